@@ -14,16 +14,92 @@ YANDEX_DISK_TOKEN = os.getenv('YANDEX_DISK_TOKEN')
 
 # ID администраторов
 ADMIN_IDS = [int(id.strip()) for id in os.getenv('ADMIN_IDS', '').split(',') if id.strip()]
+ADMIN_ID_SET = frozenset(ADMIN_IDS)  # Для быстрой проверки прав
 
 # Директории и файлы
 DATA_DIR = Path('data')
 UPLOAD_DIR = DATA_DIR / 'uploads'  # Директория для временного хранения загружаемых файлов
 FOLDERS_FILE = DATA_DIR / 'allowed_folders.json'
 USERS_FILE = DATA_DIR / 'allowed_users.json'
+TRANSCRIPTION_CACHE_FILE = DATA_DIR / 'transcriptions.sqlite3'  # Кэш результатов распознавания речи
+UPLOAD_INDEX_FILE = DATA_DIR / 'uploads.sqlite3'  # Индекс файлов, уже загруженных на Яндекс.Диск
+SIDECAR_DIR = DATA_DIR / 'protocols'  # Локальные копии структурированных протоколов (JSONL)
+SEARCH_INDEX_FILE = DATA_DIR / 'search.sqlite3'  # Полнотекстовый индекс записей протоколов
+FOLDER_ACL_FILE = DATA_DIR / 'folder_acl.json'  # Папки, выданные отдельным пользователям и группам
 
 # Настройки логирования
 LOG_LEVEL = getattr(logging, os.getenv('LOG_LEVEL', 'INFO').upper())
 
+# Максимальное количество обновлений, обрабатываемых одновременно (обновления одного пользователя всегда обрабатываются по очереди)
+CONCURRENT_UPDATES = int(os.getenv('CONCURRENT_UPDATES', '64'))
+
+# Режим быстрого подтверждения: файлы принимаются сразу, а сохраняются в фоне
+FAST_ACK_MEDIA = os.getenv('FAST_ACK_MEDIA', 'false').strip().lower() in ('1', 'true', 'yes')
+# Максимальное количество файлов, обрабатываемых в фоне одновременно
+BACKGROUND_MEDIA_CONCURRENCY = int(os.getenv('BACKGROUND_MEDIA_CONCURRENCY', '8'))
+
+# Распознавание речи: одновременные процессы ffmpeg для декодирования аудио, потоки для запросов к сервису распознавания
+SPEECH_CONVERT_WORKERS = int(os.getenv('SPEECH_CONVERT_WORKERS', '2'))
+SPEECH_RECOGNITION_WORKERS = int(os.getenv('SPEECH_RECOGNITION_WORKERS', '4'))
+# Движок распознавания речи: google (онлайн) или vosk (локально на CPU, нужна модель)
+SPEECH_ENGINE = os.getenv('SPEECH_ENGINE', 'google').strip().lower()
+VOSK_MODEL_PATH = os.getenv('VOSK_MODEL_PATH', '')
+# Длинные голосовые сообщения делятся по паузам на фрагменты не длиннее SPEECH_CHUNK_SECONDS секунд
+SPEECH_CHUNK_SECONDS = float(os.getenv('SPEECH_CHUNK_SECONDS', '30'))
+# Максимальное количество фрагментов одного сообщения, распознаваемых одновременно
+SPEECH_CHUNK_CONCURRENCY = int(os.getenv('SPEECH_CHUNK_CONCURRENCY', '4'))
+# Максимальное количество записей в кэше распознавания (0 - кэш отключен)
+TRANSCRIPTION_CACHE_SIZE = int(os.getenv('TRANSCRIPTION_CACHE_SIZE', '5000'))
+# Максимальное количество голосовых сообщений в обработке; остальные ждут своей очереди
+SPEECH_QUEUE_SIZE = int(os.getenv('SPEECH_QUEUE_SIZE', '16'))
+
+# Планировщик задач обработки: (одновременно выполняемых задач, максимальная длина очереди) для каждого класса
+JOB_CLASS_LIMITS = {
+    'protocol': (int(os.getenv('JOB_PROTOCOL_CONCURRENCY', '8')), int(os.getenv('JOB_PROTOCOL_QUEUE', '500'))),
+    'small_media': (int(os.getenv('JOB_SMALL_MEDIA_CONCURRENCY', '8')), int(os.getenv('JOB_SMALL_MEDIA_QUEUE', '200'))),
+    'large_media': (int(os.getenv('JOB_LARGE_MEDIA_CONCURRENCY', '2')), int(os.getenv('JOB_LARGE_MEDIA_QUEUE', '20'))),
+    'recognition': (int(os.getenv('JOB_RECOGNITION_CONCURRENCY', '4')), int(os.getenv('JOB_RECOGNITION_QUEUE', '50'))),
+}
+# Документы больше этого размера (в МБ) относятся к большим файлам
+LARGE_MEDIA_THRESHOLD_MB = float(os.getenv('LARGE_MEDIA_THRESHOLD_MB', '10'))
+
+# Дедупликация по содержимому: файл не загружается, если в папке уже есть файл с тем же MD5/SHA-256
+CONTENT_DEDUP = os.getenv('CONTENT_DEDUP', 'false').strip().lower() in ('1', 'true', 'yes')
+CONTENT_INDEX_TTL = float(os.getenv('CONTENT_INDEX_TTL', '300'))  # Время жизни индекса хэшей папки (в секундах)
+
+# Загрузка по ссылке: Яндекс.Диск сам скачивает файл из Telegram, минуя сервер бота.
+# Внимание: ссылка на файл Telegram содержит токен бота и передается Яндексу
+UPLOAD_FROM_URL = os.getenv('UPLOAD_FROM_URL', 'false').strip().lower() in ('1', 'true', 'yes')
+UPLOAD_FROM_URL_TIMEOUT = float(os.getenv('UPLOAD_FROM_URL_TIMEOUT', '120'))  # Ожидание завершения операции (в секундах)
+
+# Протокол из отдельных файлов-сегментов: каждая запись в протокол загружает только новый текст.
+# При завершении встречи сегменты можно объединить в один файл протокола
+PROTOCOL_SEGMENTED = os.getenv('PROTOCOL_SEGMENTED', 'false').strip().lower() in ('1', 'true', 'yes')
+PROTOCOL_COMPACT_ON_END = os.getenv('PROTOCOL_COMPACT_ON_END', 'true').strip().lower() in ('1', 'true', 'yes')
+
+# Количество одновременных запросов к Яндекс.Диску при индексации старых протоколов
+SEARCH_BACKFILL_CONCURRENCY = int(os.getenv('SEARCH_BACKFILL_CONCURRENCY', '4'))
+
+# Интервал проверки изменений allowed_users.json и allowed_folders.json (в секундах)
+CONFIG_WATCH_INTERVAL = float(os.getenv('CONFIG_WATCH_INTERVAL', '5'))
+
+# Ограничения исходящих запросов к Telegram (сообщений в секунду)
+OUTBOUND_GLOBAL_RATE = float(os.getenv('OUTBOUND_GLOBAL_RATE', '25'))  # Всего для бота (лимит Telegram - 30)
+OUTBOUND_CHAT_RATE = float(os.getenv('OUTBOUND_CHAT_RATE', '1'))  # Для одного личного чата
+OUTBOUND_GROUP_RATE = float(os.getenv('OUTBOUND_GROUP_RATE', str(20 / 60)))  # Для одной группы (лимит Telegram - 20 в минуту)
+OUTBOUND_CHAT_BURST = float(os.getenv('OUTBOUND_CHAT_BURST', '3'))  # Допустимая пачка сообщений в чат без задержки
+
+# Режим получения обновлений: polling (по умолчанию) или webhook
+BOT_MODE = os.getenv('BOT_MODE', 'polling').strip().lower()
+
+# Настройки режима webhook
+WEBHOOK_URL = os.getenv('WEBHOOK_URL', '').rstrip('/')  # Публичный адрес, по которому Telegram отправляет обновления
+WEBHOOK_PATH = '/' + os.getenv('WEBHOOK_PATH', 'telegram').strip('/')
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+WEBHOOK_LISTEN = os.getenv('WEBHOOK_LISTEN', '0.0.0.0')
+WEBHOOK_PORT = int(os.getenv('WEBHOOK_PORT', '8080'))
+WEBHOOK_MAX_CONNECTIONS = int(os.getenv('WEBHOOK_MAX_CONNECTIONS', '40'))  # Одновременные соединения со стороны Telegram (1-100)
+
 # Генерация текущего таймштампа в формате "дата_время"
 def get_current_timestamp():
     """Возвращает текущий таймштамп в формате YYYYMMDD_HHMMSS"""
@@ -32,10 +108,8 @@ def get_current_timestamp():
 # Функция для проверки прав администратора
 def is_admin(user_id):
     """Проверяет, является ли пользователь администратором"""
-    logging.info(f"Проверка прав администратора для пользователя {user_id}")
-    logging.info(f"Список администраторов: {ADMIN_IDS}")
-    result = user_id in ADMIN_IDS
-    logging.info(f"Результат проверки: {result}")
+    result = user_id in ADMIN_ID_SET
+    logging.debug("Проверка прав администратора для пользователя %s: %s", user_id, result)
     return result
 
 # Проверка обязательных переменных окружения
@@ -47,6 +121,23 @@ def validate_config():
     if missing_vars:
         raise ValueError(f"Отсутствуют обязательные переменные окружения: {', '.join(missing_vars)}")
     
+    if BOT_MODE not in ('polling', 'webhook'):
+        raise ValueError(f"Неизвестный режим работы BOT_MODE: {BOT_MODE}. Допустимые значения: polling, webhook")
+    
+    if BOT_MODE == 'webhook':
+        missing_webhook_vars = [var for var in ['WEBHOOK_URL', 'WEBHOOK_SECRET'] if not os.getenv(var)]
+        if missing_webhook_vars:
+            raise ValueError(f"Для режима webhook необходимо задать: {', '.join(missing_webhook_vars)}")
+    
+    if SPEECH_ENGINE not in ('google', 'vosk'):
+        raise ValueError(f"Неизвестный движок распознавания речи SPEECH_ENGINE: {SPEECH_ENGINE}. Допустимые значения: google, vosk")
+    
+    if SPEECH_ENGINE == 'vosk' and not VOSK_MODEL_PATH:
+        raise ValueError("Для SPEECH_ENGINE=vosk необходимо задать VOSK_MODEL_PATH")
+    
+    if SPEECH_CHUNK_SECONDS < 1:
+        raise ValueError(f"SPEECH_CHUNK_SECONDS должен быть не меньше 1 секунды, задано: {SPEECH_CHUNK_SECONDS}")
+    
     # Создаем директории, если они еще не существуют
     DATA_DIR.mkdir(parents=True, exist_ok=True)
     UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
@@ -1,5 +1,6 @@
 import logging
 import asyncio
+from concurrent.futures import ThreadPoolExecutor
 from telegram import Update
 from telegram.ext import (
     Application,
@@ -10,24 +11,34 @@ from telegram.ext import (
     filters
 )
 
-from config.config import TELEGRAM_TOKEN, validate_config
+from config.config import TELEGRAM_TOKEN, CONCURRENT_UPDATES, BOT_MODE, USERS_FILE, FOLDERS_FILE, FOLDER_ACL_FILE, validate_config
 from config.logging_config import configure_logging
 from src.utils.yadisk_helper import YaDiskHelper
 from src.utils.folder_navigation import FolderNavigator
 from src.utils.error_utils import handle_error
 from src.utils.access_control import access_control
+from src.utils.concurrency_utils import PerUserUpdateProcessor, background_tasks, loop_lag_monitor
+from src.utils.webhook_server import run_webhook
+from src.utils.message_utils import deletion_scheduler
+from src.utils.rate_limiter import OutboundRateLimiter
+from src.utils.job_scheduler import job_scheduler
+from src.utils.upload_index import upload_index
+from src.utils.search_index import search_index
+from src.utils.file_watcher import config_watcher
+from src.utils.folder_acl import folder_acl
 
 from src.handlers.command_handler import (
     start, help_command, new_meeting, handle_folder_selection, 
     create_folder, current_meeting, 
-    end_session, cancel, handle_session_callback, init_handlers,
+    end_session, search_command, cancel, handle_session_callback, init_handlers,
     CHOOSE_FOLDER, CREATE_FOLDER,
     admin_command, handle_admin_menu, add_user, remove_user,
-    ADMIN_MENU, ADD_USER, REMOVE_USER, ADD_FOLDER, REMOVE_FOLDER,
-    add_folder, remove_folder, show_allowed_folders
+    ADMIN_MENU, ADD_USER, REMOVE_USER, ADD_FOLDER, REMOVE_FOLDER, FOLDER_ACL,
+    add_folder, remove_folder, show_allowed_folders, edit_folder_acl
 )
 from src.handlers.file_handler import handle_file
 from src.handlers.text_handler import handle_text
+from src.handlers.media_handlers.voice_handler import speech_recognizer
 
 # Настройка логирования
 configure_logging()
@@ -51,6 +62,12 @@ async def setup_application():
     builder = Application.builder().token(TELEGRAM_TOKEN)
     # Отключаем JobQueue, так как она не нужна
     builder.job_queue(None)
+    # Обновления разных пользователей обрабатываются параллельно, одного пользователя - по очереди
+    builder.concurrent_updates(PerUserUpdateProcessor(CONCURRENT_UPDATES))
+    # Все исходящие запросы к Telegram проходят через очередь с лимитами и приоритетами
+    builder.rate_limiter(OutboundRateLimiter())
+    # Перед остановкой удаляем оставшиеся временные сообщения
+    builder.post_stop(on_stop)
     application = builder.build()
     
     # Добавляем yadisk_helper в контекст бота для использования в обработчиках
@@ -60,11 +77,21 @@ async def setup_application():
     # Запускаем кэширование разрешенных папок асинхронно
     asyncio.create_task(start_caching(folder_navigator))
     
+    # Следим за задержкой event loop, чтобы замечать блокирующий код
+    loop_lag_monitor.start()
+    
+    # Ручная правка списков пользователей, папок и прав на папки применяется без перезапуска
+    config_watcher.watch(USERS_FILE, access_control.reload_users)
+    config_watcher.watch(FOLDERS_FILE, folder_navigator.reload_allowed_folders)
+    config_watcher.watch(FOLDER_ACL_FILE, folder_acl.reload)
+    config_watcher.start()
+    
     # Регистрируем обработчики команд с проверкой доступа
     application.add_handler(CommandHandler("start", access_control_middleware(start)))
     application.add_handler(CommandHandler("help", access_control_middleware(help_command)))
     application.add_handler(CommandHandler("current", access_control_middleware(current_meeting)))
     application.add_handler(CommandHandler("end", access_control_middleware(end_session)))
+    application.add_handler(CommandHandler("search", access_control_middleware(search_command)))
     
     # Регистрация обработчика админ-команд
     admin_conversation = ConversationHandler(
@@ -74,7 +101,8 @@ async def setup_application():
             ADD_USER: [MessageHandler(filters.TEXT & ~filters.COMMAND, access_control_middleware(add_user))],
             REMOVE_USER: [MessageHandler(filters.TEXT & ~filters.COMMAND, access_control_middleware(remove_user))],
             ADD_FOLDER: [MessageHandler(filters.TEXT & ~filters.COMMAND, access_control_middleware(add_folder))],
-            REMOVE_FOLDER: [MessageHandler(filters.TEXT & ~filters.COMMAND, access_control_middleware(remove_folder))]
+            REMOVE_FOLDER: [MessageHandler(filters.TEXT & ~filters.COMMAND, access_control_middleware(remove_folder))],
+            FOLDER_ACL: [MessageHandler(filters.TEXT & ~filters.COMMAND, access_control_middleware(edit_folder_acl))]
         },
         fallbacks=[CommandHandler("cancel", access_control_middleware(cancel))]
     )
@@ -117,6 +145,10 @@ def access_control_middleware(handler):
     """
     Middleware для проверки доступа пользователей
     
+    Порядок обработки сообщений одного пользователя гарантирует PerUserUpdateProcessor:
+    блокировка берется до выбора обработчика, поэтому состояния ConversationHandler
+    не перемешиваются при параллельной обработке.
+    
     Args:
         handler: обработчик команды или сообщения
         
@@ -138,6 +170,19 @@ def access_control_middleware(handler):
     
     return wrapped
 
+async def on_stop(application):
+    """Завершает фоновые задачи после остановки приема обновлений"""
+    # Дожидаемся сохранения файлов, принятых до остановки
+    await background_tasks.shutdown()
+    await deletion_scheduler.flush()
+    # Останавливаем пулы распознавания речи
+    speech_recognizer.shutdown()
+    logger.info(f"Повторное использование загруженных файлов: {upload_index.get_metrics()}")
+    upload_index.close()
+    search_index.close()
+    await config_watcher.stop()
+    await loop_lag_monitor.stop()
+
 async def start_caching(folder_navigator):
     """Запускает кэширование папок в фоновом режиме"""
     try:
@@ -153,13 +198,20 @@ def main():
         # Создаем новый event loop
         loop = asyncio.new_event_loop()
         asyncio.set_event_loop(loop)
+        # Потоков по умолчанию хватает на все слоты планировщика задач и служебные вызовы,
+        # поэтому задачи одного класса не ждут освобождения потоков, занятых другим классом
+        loop.set_default_executor(ThreadPoolExecutor(max_workers=job_scheduler.max_running() + 8))
         
         # Создаем и настраиваем приложение
         application = loop.run_until_complete(setup_application())
         logger.info("Бот запущен")
         
-        # Запускаем бота (не как корутину)
-        application.run_polling(allowed_updates=Update.ALL_TYPES)
+        if BOT_MODE == 'webhook':
+            # Запускаем встроенный HTTP-сервер для приема обновлений
+            loop.run_until_complete(run_webhook(application))
+        else:
+            # Запускаем бота (не как корутину)
+            application.run_polling(allowed_updates=Update.ALL_TYPES)
     except KeyboardInterrupt:
         logger.info("Бот остановлен пользователем")
     except Exception as e:
@@ -1,15 +1,20 @@
 import logging
 import json
-import os
 import asyncio
+import time
+from functools import partial
 from telegram import Update, ReplyKeyboardMarkup, ReplyKeyboardRemove
 from telegram.ext import ContextTypes, ConversationHandler
 
-from config.config import FOLDERS_FILE, is_admin, ADMIN_IDS, UPLOAD_DIR
+from config.config import FOLDERS_FILE, is_admin, ADMIN_IDS, SIDECAR_DIR
 from src.utils.session_utils import state_manager, SessionState
 from src.utils.folder_navigation import FolderNavigator
 from src.utils.access_control import access_control
-from src.utils.message_utils import send_temp_message, send_processing_message, update_processing_message
+from src.utils.folder_acl import folder_acl
+from src.utils.concurrency_utils import background_tasks
+from src.utils.protocol_stats import aggregate_folder_stats, format_folder_stats
+from src.utils.search_index import search_index
+from src.utils.message_utils import send_temp_message, send_processing_message, update_processing_message, send_message_with_retry
 
 logger = logging.getLogger(__name__)
 
@@ -22,6 +27,7 @@ REMOVE_USER = "REMOVE_USER"
 SHOW_FOLDERS = "SHOW_FOLDERS"
 ADD_FOLDER = "ADD_FOLDER"
 REMOVE_FOLDER = "REMOVE_FOLDER"
+FOLDER_ACL = "FOLDER_ACL"
 
 # Инициализация навигатора папок (будет установлен в main.py)
 folder_navigator = None
@@ -62,6 +68,7 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
                 "/new - Создать новую встречу и выбрать папку для сохранения записей\n" \
                 "/current - Просмотреть информацию о текущей встрече\n" \
                 "/end - Завершить текущую встречу\n" \
+                "/search <запрос> - Найти записи в протоколах встреч\n" \
                 "/cancel - Отменить текущее действие\n"
     
     if is_user_admin:
@@ -107,28 +114,6 @@ async def handle_folder_selection(update: Update, context: ContextTypes.DEFAULT_
     # Добавляем логирование для отладки
     logger.debug(f"Обработка выбора папки от пользователя {user_id}. Текст: '{user_text}', текущий путь: '{current_path}'")
     
-    # Функция для повторных попыток отправки сообщения
-    async def send_message_with_retry(text, keyboard=None, retries=3):
-        for attempt in range(retries):
-            try:
-                if keyboard:
-                    return await update.message.reply_text(
-                        text,
-                        reply_markup=keyboard
-                    )
-                else:
-                    return await update.message.reply_text(
-                        text,
-                        reply_markup=ReplyKeyboardRemove()
-                    )
-            except Exception as e:
-                logger.warning(f"Ошибка при отправке сообщения (попытка {attempt+1}/{retries}): {str(e)}")
-                if attempt < retries - 1:
-                    await asyncio.sleep(1.5)
-                else:
-                    logger.error(f"Не удалось отправить сообщение после {retries} попыток: {str(e)}", exc_info=True)
-                    return None
-    
     # Обработка специальных кнопок
     if user_text == "❌ Отмена":
         return await cancel(update, context)
@@ -148,12 +133,13 @@ async def handle_folder_selection(update: Update, context: ContextTypes.DEFAULT_
             return CHOOSE_FOLDER
         except Exception as e:
             logger.error(f"Ошибка при переходе на уровень выше: {str(e)}", exc_info=True)
-            await send_message_with_retry("Произошла ошибка при навигации. Возвращаемся к корневым папкам.")
+            await send_message_with_retry(update, "Произошла ошибка при навигации. Возвращаемся к корневым папкам.")
             await folder_navigator.show_folders(update, context, "/")
             return CHOOSE_FOLDER
     
     if user_text == "➕ Новая папка":
         await send_message_with_retry(
+            update,
             f"Введите название новой папки (текущий путь: {current_path}):"
         )
         # Сохраняем текущий путь для создания папки
@@ -164,8 +150,9 @@ async def handle_folder_selection(update: Update, context: ContextTypes.DEFAULT_
     
     if user_text == "✅ Выбрать эту папку":
         # Проверяем, находится ли текущий путь в разрешенных папках
-        if not folder_navigator.is_path_allowed(current_path) and current_path != "/":
+        if not folder_navigator.is_path_allowed(current_path, user_id) and current_path != "/":
             await send_message_with_retry(
+                update,
                 f"Эта папка недоступна для выбора: {current_path}. Пожалуйста, выберите другую папку."
             )
             await folder_navigator.show_folders(update, context)
@@ -178,7 +165,7 @@ async def handle_folder_selection(update: Update, context: ContextTypes.DEFAULT_
             return ConversationHandler.END
         except Exception as e:
             logger.error(f"Ошибка при создании встречи: {str(e)}", exc_info=True)
-            await send_message_with_retry(f"Произошла ошибка при создании встречи: {str(e)}. Пожалуйста, попробуйте снова.")
+            await send_message_with_retry(update, f"Произошла ошибка при создании встречи: {str(e)}. Пожалуйста, попробуйте снова.")
             return CHOOSE_FOLDER
     
     # Обработка выбора папки по названию (все кнопки начинаются с эмодзи и имени папки)
@@ -214,12 +201,13 @@ async def handle_folder_selection(update: Update, context: ContextTypes.DEFAULT_
                 return CHOOSE_FOLDER
             except Exception as e:
                 logger.error(f"Ошибка при переходе в папку '{folder_path}': {str(e)}", exc_info=True)
-                await send_message_with_retry(f"Произошла ошибка при переходе в папку. Возвращаемся к текущей папке.")
+                await send_message_with_retry(update, f"Произошла ошибка при переходе в папку. Возвращаемся к текущей папке.")
                 await folder_navigator.show_folders(update, context, current_path)
                 return CHOOSE_FOLDER
         else:
             logger.warning(f"Не найдена папка с именем '{folder_name}' в текущем списке папок на пути '{current_path}'")
             await send_message_with_retry(
+                update,
                 f"Не удалось найти папку '{folder_name}'. Попробуйте снова.",
                 ReplyKeyboardMarkup(
                     folder_navigator.build_keyboard(folders),
@@ -230,6 +218,7 @@ async def handle_folder_selection(update: Update, context: ContextTypes.DEFAULT_
     
     # Если пользователь ввел что-то другое, показываем текущие папки снова
     await send_message_with_retry(
+        update,
         f"Пожалуйста, выберите папку из клавиатуры или используйте кнопку отмены.\nТекущий путь: {current_path}",
         ReplyKeyboardMarkup(
             folder_navigator.build_keyboard(folders),
@@ -259,7 +248,7 @@ async def create_folder(update: Update, context: ContextTypes.DEFAULT_TYPE) -> s
         logger.info(f"Полный путь новой папки: '{new_folder_path}'")
         
         # Проверяем, находится ли путь в пределах разрешенных папок
-        is_allowed = folder_navigator.is_path_allowed(new_folder_path)
+        is_allowed = folder_navigator.is_path_allowed(new_folder_path, update.effective_user.id)
         logger.info(f"Путь разрешен: {is_allowed}")
         
         if not is_allowed:
@@ -306,6 +295,28 @@ async def create_folder(update: Update, context: ContextTypes.DEFAULT_TYPE) -> s
         )
         return CREATE_FOLDER
 
+def build_session_footer(session: SessionState) -> str:
+    """Формирует завершающий блок протокола"""
+    footer = "\n\n=== Завершение встречи ===\n"
+    footer += f"Продолжительность: {session.get_duration()}\n"
+    footer += f"Количество записей: {len(session.messages)}\n"
+    return footer
+
+async def finish_session(session: SessionState, username: str) -> None:
+    """
+    Записывает протокол встречи полностью, как при /end
+    
+    Протокол создается лениво, поэтому до первой записи файла на Яндекс.Диске может
+    не быть: перед заменой или удалением сессии ее записи нужно дописать.
+    Если записать протокол не удалось, исключение передается вызывающему:
+    сессию с незаписанными записями удалять нельзя, завершение можно повторить.
+    """
+    await background_tasks.wait_for(session.user_id)
+    if not session.ending:
+        session.add_message("Завершение встречи", author=username)
+        session.ending = True
+    await session.finalize_protocol(yadisk_helper, build_session_footer(session))
+
 async def create_meeting(update: Update, context: ContextTypes.DEFAULT_TYPE, folder_path: str, folder_name: str) -> None:
     """
     Создает новую встречу в выбранной папке
@@ -313,63 +324,52 @@ async def create_meeting(update: Update, context: ContextTypes.DEFAULT_TYPE, fol
     user_id = update.effective_user.id
     username = update.effective_user.username or update.effective_user.first_name
     
-    # Показываем индикатор прогресса
-    progress_message = await send_processing_message(update, context, "⏳ Создание новой встречи...")
+    # Записываем протокол прежней встречи, иначе ее записи потеряются вместе с сессией
+    previous_session = state_manager.get_session(user_id)
+    if previous_session:
+        try:
+            await finish_session(previous_session, username)
+        except Exception as e:
+            # Прежняя встреча остается активной: ее незаписанные записи не теряются
+            logger.error(f"Ошибка при завершении предыдущей встречи {previous_session.txt_file_path}: {e}", exc_info=True)
+            state_manager.reset_state(user_id)
+            await update.message.reply_text(
+                f"❌ Не удалось сохранить протокол текущей встречи: {str(e)}\n\n"
+                f"Новая встреча не создана, записи текущей встречи не потеряны. "
+                f"Повторите /new или /end чуть позже.",
+                reply_markup=ReplyKeyboardRemove()
+            )
+            return
     
     # Создаем сессию для пользователя
     root_folder = folder_path.split("/")[1] if folder_path.startswith("/") and len(folder_path.split("/")) > 1 else ""
     session = SessionState(root_folder, folder_path, folder_name, user_id)
     
+    # Файл протокола создается вместе с первой записью (или при завершении встречи),
+    # поэтому пользователь не ждет обращения к Яндекс.Диску
+    session.protocol_header = (
+        f"=== Протокол встречи от {session.timestamp} ===\n\n"
+        f"Место: {folder_path}\n\n"
+        f"Участник: {username} (ID: {user_id})\n\n"
+    )
+    
+    # Добавляем первое сообщение в очередь на запись в протокол
+    session.add_entry(f"Начало встречи в папке: {folder_path}", author=username, entry_type="start")
+    
     # Сохраняем сессию
     state_manager.set_session(user_id, session)
     
-    # Добавляем первое сообщение в лог
-    message = f"Начало встречи в папке: {folder_path}"
-    formatted_message = session.add_message(message, author=username)
-    
     # Сбрасываем состояние выбора папки
     state_manager.reset_state(user_id)
     
-    try:
-        # Обновляем сообщение о прогрессе
-        progress_message = await update_processing_message(progress_message, "⏳ Создание файла протокола...")
-        
-        # Создаем файл на Яндекс.Диске
-        header = f"=== Протокол встречи от {session.timestamp} ===\n\n"
-        header += f"Место: {folder_path}\n\n"
-        header += f"Участник: {username} (ID: {user_id})\n\n"
-        
-        # Сохраняем полный текст с первым сообщением
-        full_text = f"{header}{formatted_message}\n"
-        
-        await yadisk_helper.create_text_file_async(full_text, session.txt_file_path)
-
-        # Удаляем сообщение о прогрессе
-        await progress_message.delete()
-        
-        # Отправляем сообщение о начале встречи
-        await update.message.reply_text(
-            f"✅ Встреча начата!\n\n"
-            f"📁 Папка: {folder_path}\n"
-            f"📝 Все сообщения и файлы будут сохранены в этой папке.\n\n"
-            f"Для завершения встречи используйте команду /end",
-            reply_markup=ReplyKeyboardRemove()
-        )
-        
-        # Отправляем временное сообщение
-        await send_temp_message(update, "📝 Файл протокола создан", 3)
-        
-    except Exception as e:
-        logger.error(f"Ошибка при создании файла протокола: {e}", exc_info=True)
-        
-        # Удаляем сообщение о прогрессе
-        if 'progress_message' in locals():
-            await progress_message.delete()
-            
-        await update.message.reply_text(
-            "❌ Не удалось создать файл протокола на Яндекс.Диске. "
-            "Встреча начата, но могут быть проблемы с сохранением данных."
-        )
+    # Отправляем сообщение о начале встречи
+    await update.message.reply_text(
+        f"✅ Встреча начата!\n\n"
+        f"📁 Папка: {folder_path}\n"
+        f"📝 Все сообщения и файлы будут сохранены в этой папке.\n\n"
+        f"Для завершения встречи используйте команду /end",
+        reply_markup=ReplyKeyboardRemove()
+    )
 
 async def current_meeting(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
@@ -393,6 +393,38 @@ async def current_meeting(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         reply_markup=ReplyKeyboardRemove()
     )
 
+async def search_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    Ищет записи в протоколах встреч (только в папках, доступных пользователю)
+    """
+    query = " ".join(context.args or []).strip()
+    if not query:
+        await update.message.reply_text(
+            "Укажите, что нужно найти, например:\n/search компрессор поставщик"
+        )
+        return
+    
+    started = time.perf_counter()
+    try:
+        folders = folder_navigator.get_allowed_folders(update.effective_user.id)
+        # Выданный корень Диска означает доступ ко всем папкам
+        results = await search_index.search_async(query, [] if "/" in folders else folders)
+    except Exception as e:
+        logger.error(f"Ошибка при поиске '{query}': {e}", exc_info=True)
+        await update.message.reply_text("❌ Не удалось выполнить поиск. Попробуйте изменить запрос.")
+        return
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    
+    if not results:
+        await update.message.reply_text(f"Ничего не найдено по запросу «{query}».")
+        return
+    
+    lines = [f"🔎 Найдено записей: {len(results)} ({elapsed_ms:.0f} мс)\n"]
+    for result in results:
+        author = f" [{result['author']}]" if result['author'] else ""
+        lines.append(f"📁 {result['folder']}\n🕒 {result['ts']}{author}\n{result['snippet']}\n")
+    await update.message.reply_text("\n".join(lines)[:4000])
+
 async def end_session(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """
     Завершает текущую встречу
@@ -411,79 +443,56 @@ async def end_session(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     
     username = update.effective_user.username or update.effective_user.first_name
     
-    # Добавляем сообщение о завершении встречи
-    session.add_message("Завершение встречи", author=username)
+    # Дожидаемся файлов, которые еще обрабатываются в фоне, и записываем их в протокол
+    if background_tasks.pending_count(user_id):
+        progress_message = await update_processing_message(progress_message, "⏳ Сохранение оставшихся файлов...")
+    await background_tasks.wait_for(user_id)
     
-    # Получаем сводку по сессии
-    summary = session.get_session_summary()
-    
-    # Завершаем сессию
     try:
         # Обновляем сообщение о прогрессе
         progress_message = await update_processing_message(progress_message, "⏳ Обновление файла протокола...")
         
-        # Обновляем файл на Яндекс.Диске
-        footer = "\n\n=== Завершение встречи ===\n"
-        duration = summary.split('Продолжительность: ')[1].split('\n')[0]
-        footer += f"Продолжительность: {duration}\n"
-        records_count = summary.split('Количество записей: ')[1].split('\n')[0]
-        footer += f"Количество записей: {records_count}\n"
-        
-        # Добавляем только завершающую информацию
-        await yadisk_helper.append_to_text_file_async(footer, session.txt_file_path)
-        
-        # Обновляем сообщение о прогрессе
-        progress_message = await update_processing_message(progress_message, "⏳ Получение содержимого протокола...")
-        
-        # Получаем содержимое файла для отображения в сообщении
-        try:
-            local_file_path = os.path.join(UPLOAD_DIR, os.path.basename(session.txt_file_path))
-            yadisk_helper.disk.download(session.txt_file_path, local_file_path)
-            
-            with open(local_file_path, 'r', encoding='utf-8') as f:
-                file_content = f.read()
-            
-            if os.path.exists(local_file_path):
-                os.remove(local_file_path)
-                
-            # Если содержимое слишком большое, обрезаем его
-            if len(file_content) > 3000:
-                file_content = file_content[:3000] + "...\n[Файл слишком большой, показана только часть]"
-        except Exception as e:
-            logger.error(f"Ошибка при чтении файла протокола: {e}", exc_info=True)
-            file_content = "[Не удалось получить содержимое файла]"
-        
-        # Очищаем сессию
-        state_manager.clear_session(user_id)
-        
-        # Удаляем сообщение о прогрессе
-        await progress_message.delete()
-        
-        await update.message.reply_text(
-            f"✅ Встреча завершена!\n\n"
-            f"📄 Файл: {session.txt_file_path}\n\n"
-            f"Содержание файла:\n\n"
-            f"{file_content}\n\n"
-            f"Все данные сохранены на Яндекс.Диске.",
-            reply_markup=ReplyKeyboardRemove()
-        )
-        
-        # Отправляем временное сообщение
-        await send_temp_message(update, "🔄 Сессия завершена", 3)
-        
+        # Оставшиеся записи и завершающая информация записываются одной загрузкой
+        await finish_session(session, username)
     except Exception as e:
         logger.error(f"Ошибка при завершении встречи: {e}", exc_info=True)
         
         # Удаляем сообщение о прогрессе, если оно есть
-        if 'progress_message' in locals():
+        if progress_message:
             await progress_message.delete()
-            
+        
+        # Сессия не очищается: незаписанные записи остаются в ней до повторного /end
         await update.message.reply_text(
-            f"❌ Встреча завершена, но возникли проблемы при сохранении данных: {str(e)}",
+            f"❌ Не удалось сохранить протокол встречи: {str(e)}\n\n"
+            f"Встреча не завершена, записи не потеряны. Повторите /end чуть позже.",
             reply_markup=ReplyKeyboardRemove()
         )
-        # Всё равно очищаем сессию
-        state_manager.clear_session(user_id)
+        return
+    
+    # Содержимое протокола хранится в сессии, скачивать файл не нужно
+    file_content = session.protocol_text
+    # Если содержимое слишком большое, обрезаем его
+    if len(file_content) > 3000:
+        file_content = file_content[:3000] + "...\n[Файл слишком большой, показана только часть]"
+    
+    # Очищаем сессию
+    state_manager.clear_session(user_id)
+    
+    # Удаляем сообщение о прогрессе
+    if progress_message:
+        await progress_message.delete()
+    
+    await update.message.reply_text(
+        f"✅ Встреча завершена!\n\n"
+        f"📄 Файл: {session.get_protocol_path()}\n\n"
+        f"Содержание файла:\n\n"
+        f"{file_content}\n\n"
+        f"Все данные сохранены на Яндекс.Диске.",
+        reply_markup=ReplyKeyboardRemove()
+    )
+    
+    # Отправляем временное сообщение
+    await send_temp_message(update, "🔄 Сессия завершена", 3)
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """
@@ -530,6 +539,15 @@ async def handle_session_callback(update: Update, context: ContextTypes.DEFAULT_
         # Завершаем сессию
         session = state_manager.get_session(user_id)
         if session:
+            try:
+                await finish_session(session, query.from_user.username or query.from_user.first_name)
+            except Exception as e:
+                logger.error(f"Ошибка при завершении встречи: {e}", exc_info=True)
+                await query.edit_message_text(
+                    f"❌ Не удалось сохранить протокол встречи: {str(e)}\n\n"
+                    f"Встреча не завершена, записи не потеряны. Повторите /end чуть позже."
+                )
+                return
             summary = session.get_session_summary()
             state_manager.clear_session(user_id)
             await query.edit_message_text(
@@ -560,6 +578,8 @@ async def admin_command(update: Update, context: ContextTypes.DEFAULT_TYPE) -> s
         ["➕ Добавить пользователя", "➖ Удалить пользователя"],
         ["📁 Список папок"],
         ["📁➕ Добавить папку", "📁➖ Удалить папку"],
+        ["🔐 Доступ к папкам"],
+        ["📊 Статистика", "🔎 Индексировать протоколы"],
         ["🔄 Перезагрузить списки"],
         ["❌ Выход"]
     ]
@@ -626,9 +646,33 @@ async def handle_admin_menu(update: Update, context: ContextTypes.DEFAULT_TYPE)
         state_manager.set_state(user_id, REMOVE_FOLDER)
         return REMOVE_FOLDER
     
+    elif user_text == "🔐 Доступ к папкам":
+        await update.message.reply_text(
+            f"Доступ к папкам:\n\n{folder_acl.describe()}\n\n"
+            "Пользователю с выданными папками (лично или через группу) доступны только они, "
+            "остальным - общий список папок.\n\n"
+            "Введите команду:\n"
+            "user <ID> + /папка - выдать папку пользователю\n"
+            "user <ID> - /папка - забрать папку у пользователя\n"
+            "group <группа> + /папка - выдать папку группе\n"
+            "group <группа> - /папка - забрать папку у группы\n"
+            "member <группа> + <ID> - добавить пользователя в группу\n"
+            "member <группа> - <ID> - удалить пользователя из группы",
+            reply_markup=ReplyKeyboardRemove()
+        )
+        state_manager.set_state(user_id, FOLDER_ACL)
+        return FOLDER_ACL
+    
+    elif user_text == "📊 Статистика":
+        return await show_protocol_stats(update, context)
+    
+    elif user_text == "🔎 Индексировать протоколы":
+        return await start_search_backfill(update, context)
+    
     elif user_text == "🔄 Перезагрузить списки":
         access_control.reload_users()
         folder_navigator.reload_allowed_folders()
+        folder_acl.reload()
         await update.message.reply_text(
             f"Списки перезагружены.\n"
             f"Текущее количество пользователей: {len(access_control.allowed_users)}\n"
@@ -652,6 +696,8 @@ async def handle_admin_menu(update: Update, context: ContextTypes.DEFAULT_TYPE)
             ["➕ Добавить пользователя", "➖ Удалить пользователя"],
             ["📁 Список папок"],
             ["📁➕ Добавить папку", "📁➖ Удалить папку"],
+            ["🔐 Доступ к папкам"],
+            ["📊 Статистика", "🔎 Индексировать протоколы"],
             ["🔄 Перезагрузить списки"],
             ["❌ Выход"]
         ]
@@ -662,6 +708,47 @@ async def handle_admin_menu(update: Update, context: ContextTypes.DEFAULT_TYPE)
         )
         return ADMIN_MENU
 
+async def start_search_backfill(update: Update, context: ContextTypes.DEFAULT_TYPE) -> str:
+    """
+    Запускает индексацию протоколов в разрешенных папках для поиска (/search)
+    """
+    if search_index.backfill_task and not search_index.backfill_task.done():
+        await update.message.reply_text("Индексация протоколов уже выполняется.")
+        return ADMIN_MENU
+    
+    folders = folder_navigator.allowed_folders or ["/"]
+    
+    async def run_backfill() -> None:
+        try:
+            stats = await search_index.backfill(yadisk_helper, folders)
+            text = (f"🔎 Индексация протоколов завершена.\n"
+                    f"Папок: {stats['folders']}, протоколов: {stats['protocols']}, "
+                    f"обновлено: {stats['indexed']}, записей: {stats['entries']}, ошибок: {stats['errors']}")
+        except Exception as e:
+            logger.error(f"Ошибка при индексации протоколов: {e}", exc_info=True)
+            text = f"❌ Ошибка при индексации протоколов: {str(e)}"
+        try:
+            await update.message.reply_text(text)
+        except Exception as e:
+            logger.error(f"Не удалось отправить результат индексации: {e}", exc_info=True)
+    
+    search_index.backfill_task = asyncio.create_task(run_backfill())
+    await update.message.reply_text(
+        f"🔎 Индексация протоколов запущена (папок: {len(folders)}). Сообщу, когда она завершится."
+    )
+    return ADMIN_MENU
+
+async def show_protocol_stats(update: Update, context: ContextTypes.DEFAULT_TYPE) -> str:
+    """
+    Отображает статистику по папкам за последние 30 дней (из структурированных протоколов)
+    """
+    since = time.strftime("%Y-%m-%d", time.localtime(time.time() - 30 * 24 * 3600))
+    loop = asyncio.get_event_loop()
+    stats = await loop.run_in_executor(None, partial(aggregate_folder_stats, SIDECAR_DIR, since))
+    
+    await update.message.reply_text(f"Статистика с {since}:\n\n{format_folder_stats(stats)}")
+    return ADMIN_MENU
+
 async def show_allowed_users(update: Update, context: ContextTypes.DEFAULT_TYPE) -> str:
     """
     Отображает список разрешенных пользователей
@@ -684,7 +771,7 @@ async def show_allowed_users(update: Update, context: ContextTypes.DEFAULT_TYPE)
         # Добавляем обычных пользователей
         if allowed_users:
             users_text += "Пользователи:\n"
-            for user_id in allowed_users:
+            for user_id in sorted(allowed_users):
                 if user_id not in admin_ids:
                     users_text += f"- {user_id}\n"
         else:
@@ -696,6 +783,8 @@ async def show_allowed_users(update: Update, context: ContextTypes.DEFAULT_TYPE)
         ["➕ Добавить пользователя", "➖ Удалить пользователя"],
         ["📁 Список папок"],
         ["📁➕ Добавить папку", "📁➖ Удалить папку"],
+        ["🔐 Доступ к папкам"],
+        ["📊 Статистика", "🔎 Индексировать протоколы"],
         ["🔄 Перезагрузить списки"],
         ["❌ Выход"]
     ]
@@ -783,6 +872,8 @@ async def show_allowed_folders(update: Update, context: ContextTypes.DEFAULT_TYP
         ["➕ Добавить пользователя", "➖ Удалить пользователя"],
         ["📁 Список папок"],
         ["📁➕ Добавить папку", "📁➖ Удалить папку"],
+        ["🔐 Доступ к папкам"],
+        ["📊 Статистика", "🔎 Индексировать протоколы"],
         ["🔄 Перезагрузить списки"],
         ["❌ Выход"]
     ]
@@ -820,4 +911,56 @@ async def remove_folder(update: Update, context: ContextTypes.DEFAULT_TYPE) -> s
     await update.message.reply_text(message)
     
     # Возвращаемся в административное меню
-    return await admin_command(update, context) 
\ No newline at end of file
+    return await admin_command(update, context) 
+
+async def edit_folder_acl(update: Update, context: ContextTypes.DEFAULT_TYPE) -> str:
+    """
+    Изменяет доступ пользователей и групп к папкам
+    """
+    parts = update.message.text.strip().split(maxsplit=3)
+    if len(parts) != 4 or parts[0].lower() not in ("user", "group", "member") or parts[2] not in ("+", "-"):
+        await update.message.reply_text(
+            "Неверный формат команды. Например: user 123456789 + /TD/Продажи"
+        )
+        return await admin_command(update, context)
+    
+    kind, name, action, value = parts[0].lower(), parts[1], parts[2], parts[3].strip()
+    
+    # Выдаваемая папка должна быть в общем списке папок или существовать на Яндекс.Диске
+    if kind in ("user", "group") and action == "+":
+        folder_path = folder_navigator.normalize_path(value)
+        if folder_path not in folder_navigator.allowed_folders:
+            valid, message, exists = await folder_navigator.validate_folder_path(folder_path)
+            if not valid or not exists:
+                await update.message.reply_text(
+                    f"❌ Папка {folder_path} не выдана: {message or 'папка не найдена на Яндекс.Диске'}"
+                )
+                return await admin_command(update, context)
+    
+    try:
+        if kind == "user":
+            if action == "+":
+                success = folder_acl.grant_user(int(name), folder_navigator.normalize_path(value))
+            else:
+                success = folder_acl.revoke_user(int(name), folder_navigator.normalize_path(value))
+        elif kind == "group":
+            if action == "+":
+                success = folder_acl.grant_group(name, folder_navigator.normalize_path(value))
+            else:
+                success = folder_acl.revoke_group(name, folder_navigator.normalize_path(value))
+        else:
+            if action == "+":
+                success = folder_acl.add_member(name, int(value))
+            else:
+                success = folder_acl.remove_member(name, int(value))
+    except ValueError:
+        await update.message.reply_text("ID пользователя должен быть числом.")
+        return await admin_command(update, context)
+    
+    if success:
+        await update.message.reply_text(f"✅ Доступ изменен.\n\n{folder_acl.describe()}")
+    else:
+        await update.message.reply_text("❌ Не удалось сохранить изменения доступа.")
+    
+    # Возвращаемся в административное меню
+    return await admin_command(update, context)
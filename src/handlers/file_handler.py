@@ -11,6 +11,7 @@ async def handle_file(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     from src.handlers.media_handlers.photo_handler import handle_photo
     from src.handlers.media_handlers.voice_handler import handle_voice
     from src.handlers.media_handlers.document_handler import handle_document
+    from src.handlers.media_handlers.album_handler import handle_media_group
     
     # Получаем yadisk_helper из context
     yadisk_helper = context.bot_data.get('yadisk_helper')
@@ -21,7 +22,10 @@ async def handle_file(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         return
     
     # Перенаправляем в соответствующий обработчик в зависимости от типа файла
-    if update.message.photo:
+    if update.message.media_group_id and (update.message.photo or update.message.document):
+        # Файлы альбома обрабатываются вместе
+        await handle_media_group(update, context, yadisk_helper)
+    elif update.message.photo:
         await handle_photo(update, context, yadisk_helper)
     elif update.message.voice:
         await handle_voice(update, context, yadisk_helper)
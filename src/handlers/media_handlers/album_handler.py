@@ -0,0 +1,159 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+from telegram import Message, Update
+from telegram.ext import ContextTypes
+
+from src.utils.session_utils import state_manager, SessionState, ProtocolEntry
+from src.utils.concurrency_utils import background_tasks
+from src.utils.job_scheduler import JobRejected
+from src.utils.message_utils import send_temp_message, ProgressReporter
+from src.handlers.media_handlers.photo_handler import save_photo
+from src.handlers.media_handlers.document_handler import save_document
+
+logger = logging.getLogger(__name__)
+
+class MediaGroupCollector:
+    """
+    Собирает сообщения одного альбома (с общим media_group_id) и сохраняет их вместе:
+    файлы загружаются параллельно, в протокол добавляется одна запись,
+    пользователь получает один итоговый ответ.
+    """
+    # Время ожидания следующего файла альбома (в секундах)
+    COLLECT_WINDOW = 1.0
+    # Максимальное количество одновременных загрузок файлов одного альбома
+    MAX_PARALLEL_UPLOADS = 4
+
+    def __init__(self):
+        # Ключ: (user_id, media_group_id), Значение: собранные обновления
+        self._groups: Dict[Tuple[int, str], List[Update]] = {}
+        # Ключ: (user_id, media_group_id), Значение: сессия и зарезервированная запись протокола
+        self._entries: Dict[Tuple[int, str], Tuple[Optional[SessionState], Optional[ProtocolEntry]]] = {}
+        # Ключ: (user_id, media_group_id), Значение: задача ожидания окончания альбома
+        self._timers: Dict[Tuple[int, str], asyncio.Task] = {}
+
+    def add(self, update: Update, yadisk_helper) -> None:
+        """Добавляет сообщение в альбом и откладывает обработку до окончания окна сбора"""
+        user_id = update.effective_user.id
+        key = (user_id, update.message.media_group_id)
+        if key not in self._groups:
+            # Резервируем место в протоколе по первому файлу альбома, чтобы сохранить порядок записей
+            session = state_manager.get_session(user_id)
+            self._entries[key] = (session, session.reserve_entry() if session else None)
+        self._groups.setdefault(key, []).append(update)
+
+        # Перезапускаем таймер: альбом обрабатывается после паузы в поступлении файлов
+        timer = self._timers.get(key)
+        if timer:
+            timer.cancel()
+        task = asyncio.create_task(self._flush_later(key, yadisk_helper))
+        self._timers[key] = task
+        # Завершение встречи и остановка бота дожидаются обработки альбома
+        background_tasks.track(user_id, task)
+
+    async def _flush_later(self, key: Tuple[int, str], yadisk_helper) -> None:
+        await asyncio.sleep(self.COLLECT_WINDOW)
+        # После этой точки задача не отменяется: новые файлы с тем же ключом попадут в новый альбом
+        del self._timers[key]
+        updates = self._groups.pop(key)
+        session, entry = self._entries.pop(key)
+        try:
+            await self._process_group(updates, session, entry, yadisk_helper)
+        except Exception as e:
+            logger.error(f"Ошибка при обработке альбома {key[1]}: {e}", exc_info=True)
+        finally:
+            # Освобождаем место в протоколе, чтобы ошибка не задерживала следующие записи
+            if session and not entry.done:
+                session.complete_entry(entry, None)
+                try:
+                    await session.flush_protocol(yadisk_helper)
+                except Exception as e:
+                    logger.error(f"Ошибка при записи протокола: {e}", exc_info=True)
+
+    @staticmethod
+    def _file_size(message: Message) -> int:
+        attachment = message.photo[-1] if message.photo else message.document
+        return attachment.file_size or 0
+
+    async def _save_file(self, message: Message, session: SessionState, yadisk_helper,
+                         semaphore: asyncio.Semaphore) -> str:
+        async with semaphore:
+            if message.photo:
+                return await save_photo(message, session, yadisk_helper)
+            return await save_document(message, session, yadisk_helper)
+
+    async def _process_group(self, updates: List[Update], session: Optional[SessionState],
+                             entry: Optional[ProtocolEntry], yadisk_helper) -> None:
+        """Сохраняет все файлы альбома и добавляет одну запись в протокол"""
+        updates.sort(key=lambda u: u.message.message_id)
+        first_update = updates[0]
+        user = first_update.effective_user
+
+        if not session:
+            await first_update.message.reply_text("Сначала нужно начать встречу с помощью команды /new")
+            return
+
+        total = len(updates)
+        logger.info(f"Обработка альбома из {total} файлов от пользователя {user.id}")
+        # Фоновая задача прогресса завершается, даже если обработка прервана
+        async with ProgressReporter(first_update, f"⏳ Сохранение альбома ({total} файлов)...") as progress:
+            try:
+                # Загружаем файлы параллельно с ограничением количества одновременных загрузок
+                semaphore = asyncio.Semaphore(self.MAX_PARALLEL_UPLOADS)
+                results = await asyncio.gather(
+                    *(self._save_file(u.message, session, yadisk_helper, semaphore) for u in updates),
+                    return_exceptions=True
+                )
+
+                saved_paths = [result for result in results if isinstance(result, str)]
+                errors = [result for result in results if isinstance(result, Exception)]
+                for error in errors:
+                    logger.error(f"Не удалось сохранить файл альбома: {error}", exc_info=error)
+
+                if not saved_paths:
+                    if all(isinstance(error, JobRejected) for error in errors):
+                        await progress.finish(str(errors[0]))
+                    else:
+                        await progress.finish(f"Не удалось сохранить альбом: {str(errors[0])}")
+                    return
+
+                # Формируем одну запись протокола для всего альбома
+                entry_text = f"Загружен альбом ({len(saved_paths)} файлов):\n" + "\n".join(f"  {path}" for path in saved_paths)
+                if errors:
+                    entry_text += f"\n  [Не удалось сохранить файлов: {len(errors)}]"
+
+                username = user.username or user.first_name
+                saved_size = sum(self._file_size(u.message) for u, result in zip(updates, results) if isinstance(result, str))
+                session.complete_entry(entry, entry_text, author=username, entry_type="album",
+                                       author_id=user.id, path=saved_paths, size=saved_size)
+
+                # Добавляем запись в файл на Яндекс.Диске (файлы уже сохранены: ошибка записи
+                # только откладывает строку протокола)
+                written = await session.write_entry(yadisk_helper, entry)
+
+                # Отправляем один итоговый ответ
+                if errors:
+                    await progress.finish(f"⚠️ Альбом сохранен частично: {len(saved_paths)} из {total} файлов")
+                else:
+                    await progress.finish(f"📷 Альбом успешно сохранен ({total} файлов)!")
+
+                if written:
+                    await send_temp_message(first_update, "📝 Сообщение об альбоме добавлено в протокол", 3)
+                else:
+                    await send_temp_message(first_update, "⏳ Сообщение об альбоме будет добавлено в протокол чуть позже", 3)
+
+            except Exception as e:
+                logger.error(f"Ошибка при сохранении альбома: {e}", exc_info=True)
+                await progress.finish(f"Не удалось сохранить альбом: {str(e)}")
+
+# Создаем глобальный сборщик альбомов
+media_group_collector = MediaGroupCollector()
+
+async def handle_media_group(update: Update, context: ContextTypes.DEFAULT_TYPE, yadisk_helper) -> None:
+    """
+    Обрабатывает файлы, отправленные альбомом
+
+    Обработчик возвращается сразу: файлы альбома приходят отдельными обновлениями
+    и обрабатываются вместе после окончания окна сбора.
+    """
+    media_group_collector.add(update, yadisk_helper)
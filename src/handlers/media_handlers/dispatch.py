@@ -0,0 +1,60 @@
+import logging
+from typing import Awaitable, Callable
+from telegram import Update
+
+from config.config import FAST_ACK_MEDIA
+from src.utils.session_utils import SessionState, ProtocolEntry
+from src.utils.message_utils import ProgressReporter
+from src.utils.concurrency_utils import background_tasks
+
+logger = logging.getLogger(__name__)
+
+async def dispatch_media(
+    update: Update,
+    session: SessionState,
+    yadisk_helper,
+    process: Callable[[ProtocolEntry, ProgressReporter], Awaitable[None]],
+    initial_text: str,
+    accepted_text: str
+) -> None:
+    """
+    Запускает обработку файла
+
+    Место записи в протоколе резервируется сразу, поэтому записи остаются
+    в порядке поступления сообщений. В режиме FAST_ACK_MEDIA пользователь сразу
+    получает подтверждение приема, а файл обрабатывается в фоне; результат
+    обработки заменяет текст подтверждения.
+
+    Args:
+        update: Объект обновления Telegram
+        session: Текущая сессия пользователя
+        yadisk_helper: Помощник для работы с Яндекс.Диском
+        process: Корутина обработки, получающая запись протокола и отчет о прогрессе
+        initial_text: Текст индикатора прогресса при обычной обработке
+        accepted_text: Текст подтверждения приема в режиме быстрого подтверждения
+    """
+    entry = session.reserve_entry()
+
+    async def run(progress: ProgressReporter) -> None:
+        # Фоновая задача прогресса завершается, даже если обработка прервана
+        async with progress:
+            try:
+                await process(entry, progress)
+            finally:
+                # Освобождаем место в протоколе, чтобы ошибка не задерживала следующие записи
+                if not entry.done:
+                    session.complete_entry(entry, None)
+                try:
+                    await session.flush_protocol(yadisk_helper)
+                except Exception as e:
+                    logger.error(f"Ошибка при записи протокола: {e}", exc_info=True)
+
+    if FAST_ACK_MEDIA:
+        try:
+            progress = await ProgressReporter.accepted(update, accepted_text)
+        except Exception:
+            session.complete_entry(entry, None)
+            raise
+        background_tasks.spawn(update.effective_user.id, run(progress))
+    else:
+        await run(ProgressReporter(update, initial_text))
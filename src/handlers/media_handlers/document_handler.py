@@ -1,81 +1,98 @@
 import logging
-import os
-from telegram import Update
+from functools import partial
+from typing import Optional
+from telegram import Message, Update
 from telegram.ext import ContextTypes
 
-from config.config import UPLOAD_DIR
-from src.utils.session_utils import state_manager
-from src.utils.message_utils import send_temp_message, send_processing_message, update_processing_message
+from src.utils.session_utils import state_manager, SessionState, ProtocolEntry
+from src.utils.message_utils import send_temp_message, ProgressReporter
 from src.utils.folder_navigation import FolderNavigator
+from src.utils.job_scheduler import JobRejected
+from src.utils.upload_index import upload_index
+from src.handlers.media_handlers.dispatch import dispatch_media
+from src.handlers.media_handlers.transfer import download_and_upload
 
 logger = logging.getLogger(__name__)
 
-async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE, yadisk_helper) -> None:
+async def save_document(message: Message, session: SessionState, yadisk_helper,
+                        progress: Optional[ProgressReporter] = None) -> str:
     """
-    Обрабатывает документы, отправленные пользователем
+    Скачивает документ из Telegram и загружает его на Яндекс.Диск
+    
+    Документ, который уже загружался, повторно не передается: используется
+    существующий файл в той же папке или копия на стороне Яндекс.Диска.
+    
+    Returns:
+        str: Путь к документу на Яндекс.Диске
     """
-    user_id = update.effective_user.id
-    session = state_manager.get_session(user_id)
+    document = message.document
     
-    if not session:
-        await update.message.reply_text("Сначала нужно начать встречу с помощью команды /new")
-        return
+    # Сохраняем оригинальное имя файла, но очищаем его от недопустимых символов
+    original_filename = document.file_name or f"document_{document.file_unique_id}"
+    safe_filename = FolderNavigator.sanitize_filename(original_filename)
+    
+    # Формируем путь на Яндекс.Диске, используя безопасное соединение путей
+    yadisk_filename = f"{session.file_prefix}_{safe_filename}"
+    yadisk_path = FolderNavigator.safe_join_path_static(session.folder_path, yadisk_filename)
     
+    async def transfer() -> Optional[str]:
+        # Локальное имя с идентификатором, чтобы одноименные файлы не пересекались
+        local_filename = f"{session.timestamp}_{document.file_unique_id}_{safe_filename}"
+        return await download_and_upload(document, local_filename, yadisk_path, session, yadisk_helper,
+                                         progress, "⏳ Загрузка документа...")
+    
+    return await upload_index.save_file(document.file_unique_id, document.file_size, yadisk_path,
+                                        yadisk_helper, transfer)
+
+async def process_document(update: Update, session: SessionState, yadisk_helper,
+                           entry: ProtocolEntry, progress: ProgressReporter) -> None:
+    """
+    Сохраняет документ и записывает его в зарезервированное место протокола
+    """
     try:
-        # Показываем индикатор прогресса
-        progress_message = await send_processing_message(update, context, "⏳ Получение документа...")
-        
-        # Получаем документ
-        document = update.message.document
-        document_file = await document.get_file()
-        
-        # Обновляем сообщение о прогрессе
-        progress_message = await update_processing_message(progress_message, "⏳ Загрузка документа...")
-        
-        # Создаем временный путь для сохранения
-        os.makedirs(UPLOAD_DIR, exist_ok=True)
-        
-        # Сохраняем оригинальное имя файла, но очищаем его от недопустимых символов
-        original_filename = document.file_name or f"document_{document_file.file_unique_id}"
-        safe_filename = FolderNavigator.sanitize_filename(original_filename)
-        
-        # Создаем локальный путь для файла
-        local_filename = f"{session.timestamp}_{safe_filename}"
-        file_path = os.path.join(UPLOAD_DIR, local_filename)
-        
-        # Загружаем документ
-        await document_file.download_to_drive(file_path)
-        
-        # Обновляем сообщение о прогрессе
-        progress_message = await update_processing_message(progress_message, "⏳ Загрузка на Яндекс.Диск...")
-        
-        # Формируем путь на Яндекс.Диске, используя безопасное соединение путей
-        yadisk_filename = f"{session.file_prefix}_{safe_filename}"
-        yadisk_path = FolderNavigator.safe_join_path_static(session.folder_path, yadisk_filename)
-        
-        # Загружаем на Яндекс.Диск асинхронно
-        await yadisk_helper.upload_file_async(file_path, yadisk_path)
+        # Скачиваем документ и загружаем на Яндекс.Диск
+        yadisk_path = await save_document(update.message, session, yadisk_helper, progress)
         
         # Добавляем сообщение в лог
         username = update.effective_user.username or update.effective_user.first_name
-        formatted_message = session.add_message(f"Загружен документ: {yadisk_path}", author=username)
-        
-        # Добавляем запись в файл на Яндекс.Диске
-        await yadisk_helper.append_to_text_file_async(formatted_message + "\n", session.txt_file_path)
+        session.complete_entry(entry, f"Загружен документ: {yadisk_path}", author=username, entry_type="document",
+                               author_id=update.effective_user.id, path=yadisk_path,
+                               size=update.message.document.file_size)
         
-        # Удаляем сообщение о прогрессе
-        await progress_message.delete()
+        # Добавляем запись в файл на Яндекс.Диске (файл уже сохранен: ошибка записи
+        # только откладывает строку протокола)
+        written = await session.write_entry(yadisk_helper, entry)
         
-        # Отвечаем пользователю
-        await update.message.reply_text("📄 Документ успешно сохранен!")
+        # Заменяем сообщение о прогрессе ответом пользователю
+        await progress.finish("📄 Документ успешно сохранен!")
         
         # Отправляем временное сообщение
-        await send_temp_message(update, "📝 Сообщение о документе добавлено в протокол", 3)
-        
-        # Удаляем временный файл
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        if written:
+            await send_temp_message(update, "📝 Сообщение о документе добавлено в протокол", 3)
+        else:
+            await send_temp_message(update, "⏳ Сообщение о документе будет добавлено в протокол чуть позже", 3)
             
+    except JobRejected as e:
+        # Очередь загрузки переполнена: файл не сохранен, просим пользователя повторить позже
+        await progress.finish(str(e))
     except Exception as e:
         logger.error(f"Ошибка при обработке документа: {e}", exc_info=True)
-        await update.message.reply_text(f"Не удалось сохранить документ: {str(e)}") 
\ No newline at end of file
+        await progress.finish(f"Не удалось сохранить документ: {str(e)}")
+
+async def handle_document(update: Update, context: ContextTypes.DEFAULT_TYPE, yadisk_helper) -> None:
+    """
+    Обрабатывает документы, отправленные пользователем
+    """
+    user_id = update.effective_user.id
+    session = state_manager.get_session(user_id)
+    
+    if not session:
+        await update.message.reply_text("Сначала нужно начать встречу с помощью команды /new")
+        return
+    
+    await dispatch_media(
+        update, session, yadisk_helper,
+        partial(process_document, update, session, yadisk_helper),
+        initial_text="⏳ Получение документа...",
+        accepted_text="📥 Документ принят, сохраняю..."
+    )
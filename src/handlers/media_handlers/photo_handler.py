@@ -1,77 +1,97 @@
 import logging
-import os
-from telegram import Update
+from functools import partial
+from typing import Optional
+from telegram import Message, Update
 from telegram.ext import ContextTypes
 
-from config.config import UPLOAD_DIR
-from src.utils.session_utils import state_manager
-from src.utils.message_utils import send_temp_message, send_processing_message, update_processing_message
+from src.utils.session_utils import state_manager, SessionState, ProtocolEntry
+from src.utils.message_utils import send_temp_message, ProgressReporter
 from src.utils.folder_navigation import FolderNavigator
+from src.utils.job_scheduler import JobRejected
+from src.utils.upload_index import upload_index
+from src.handlers.media_handlers.dispatch import dispatch_media
+from src.handlers.media_handlers.transfer import download_and_upload
 
 logger = logging.getLogger(__name__)
 
-async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE, yadisk_helper) -> None:
+async def save_photo(message: Message, session: SessionState, yadisk_helper,
+                     progress: Optional[ProgressReporter] = None) -> str:
     """
-    Обрабатывает фотографии, отправленные пользователем
+    Скачивает фотографию из Telegram и загружает её на Яндекс.Диск
+    
+    Фотография, которая уже загружалась, повторно не передается: используется
+    существующий файл в той же папке или копия на стороне Яндекс.Диска.
+    
+    Returns:
+        str: Путь к фотографии на Яндекс.Диске
     """
-    user_id = update.effective_user.id
-    session = state_manager.get_session(user_id)
+    # Берем самое большое доступное изображение
+    photo = message.photo[-1]
     
-    if not session:
-        await update.message.reply_text("Сначала нужно начать встречу с помощью команды /new")
-        return
+    # Генерируем безопасное имя файла
+    safe_file_id = FolderNavigator.sanitize_filename(photo.file_unique_id)
     
-    try:
-        # Показываем индикатор прогресса
-        progress_message = await send_processing_message(update, context, "⏳ Получение фотографии...")
-        
-        # Получаем самое большое доступное изображение
-        photo_file = await update.message.photo[-1].get_file()
-        
-        # Обновляем сообщение о прогрессе
-        progress_message = await update_processing_message(progress_message, "⏳ Загрузка фотографии...")
-        
-        # Создаем временный путь для сохранения
-        os.makedirs(UPLOAD_DIR, exist_ok=True)
-        
-        # Генерируем безопасное имя файла
-        safe_file_id = FolderNavigator.sanitize_filename(photo_file.file_unique_id)
+    # Формируем путь на Яндекс.Диске, используя безопасное соединение путей
+    yadisk_filename = f"{session.file_prefix}_{safe_file_id}.jpg"
+    yadisk_path = FolderNavigator.safe_join_path_static(session.folder_path, yadisk_filename)
+    
+    async def transfer() -> Optional[str]:
         local_filename = f"photo_{session.timestamp}_{safe_file_id}.jpg"
-        file_path = os.path.join(UPLOAD_DIR, local_filename)
-        
-        # Загружаем фото
-        await photo_file.download_to_drive(file_path)
-        
-        # Обновляем сообщение о прогрессе
-        progress_message = await update_processing_message(progress_message, "⏳ Загрузка на Яндекс.Диск...")
-        
-        # Формируем путь на Яндекс.Диске, используя безопасное соединение путей
-        yadisk_filename = f"{session.file_prefix}_{safe_file_id}.jpg"
-        yadisk_path = FolderNavigator.safe_join_path_static(session.folder_path, yadisk_filename)
-        
-        # Загружаем на Яндекс.Диск асинхронно
-        await yadisk_helper.upload_file_async(file_path, yadisk_path)
+        return await download_and_upload(photo, local_filename, yadisk_path, session, yadisk_helper,
+                                         progress, "⏳ Загрузка фотографии...")
+    
+    return await upload_index.save_file(photo.file_unique_id, photo.file_size, yadisk_path,
+                                        yadisk_helper, transfer)
+
+async def process_photo(update: Update, session: SessionState, yadisk_helper,
+                        entry: ProtocolEntry, progress: ProgressReporter) -> None:
+    """
+    Сохраняет фотографию и записывает её в зарезервированное место протокола
+    """
+    try:
+        # Скачиваем фото и загружаем на Яндекс.Диск
+        yadisk_path = await save_photo(update.message, session, yadisk_helper, progress)
         
         # Добавляем сообщение в лог
         username = update.effective_user.username or update.effective_user.first_name
-        formatted_message = session.add_message(f"Загружено фото: {yadisk_path}", author=username)
+        session.complete_entry(entry, f"Загружено фото: {yadisk_path}", author=username, entry_type="photo",
+                               author_id=update.effective_user.id, path=yadisk_path,
+                               size=update.message.photo[-1].file_size)
         
-        # Добавляем запись в файл на Яндекс.Диске
-        await yadisk_helper.append_to_text_file_async(formatted_message + "\n", session.txt_file_path)
+        # Добавляем запись в файл на Яндекс.Диске (файл уже сохранен: ошибка записи
+        # только откладывает строку протокола)
+        written = await session.write_entry(yadisk_helper, entry)
         
-        # Удаляем сообщение о прогрессе
-        await progress_message.delete()
-        
-        # Отвечаем пользователю
-        await update.message.reply_text("📷 Фото успешно сохранено!")
+        # Заменяем сообщение о прогрессе ответом пользователю
+        await progress.finish("📷 Фото успешно сохранено!")
         
         # Отправляем временное сообщение
-        await send_temp_message(update, "📝 Сообщение о фото добавлено в протокол", 3)
-        
-        # Удаляем временный файл
-        if os.path.exists(file_path):
-            os.remove(file_path)
+        if written:
+            await send_temp_message(update, "📝 Сообщение о фото добавлено в протокол", 3)
+        else:
+            await send_temp_message(update, "⏳ Сообщение о фото будет добавлено в протокол чуть позже", 3)
             
+    except JobRejected as e:
+        # Очередь загрузки переполнена: файл не сохранен, просим пользователя повторить позже
+        await progress.finish(str(e))
     except Exception as e:
         logger.error(f"Ошибка при обработке фото: {e}", exc_info=True)
-        await update.message.reply_text(f"Не удалось сохранить фото: {str(e)}") 
\ No newline at end of file
+        await progress.finish(f"Не удалось сохранить фото: {str(e)}")
+
+async def handle_photo(update: Update, context: ContextTypes.DEFAULT_TYPE, yadisk_helper) -> None:
+    """
+    Обрабатывает фотографии, отправленные пользователем
+    """
+    user_id = update.effective_user.id
+    session = state_manager.get_session(user_id)
+    
+    if not session:
+        await update.message.reply_text("Сначала нужно начать встречу с помощью команды /new")
+        return
+    
+    await dispatch_media(
+        update, session, yadisk_helper,
+        partial(process_photo, update, session, yadisk_helper),
+        initial_text="⏳ Получение фотографии...",
+        accepted_text="📥 Фото принято, сохраняю..."
+    )
@@ -0,0 +1,113 @@
+import logging
+import os
+from typing import Optional
+
+from config.config import UPLOAD_DIR, CONTENT_DEDUP, UPLOAD_FROM_URL, UPLOAD_FROM_URL_TIMEOUT
+from src.utils.session_utils import SessionState
+from src.utils.message_utils import ProgressReporter
+from src.utils.job_scheduler import job_scheduler, classify_media
+from src.utils.content_index import HashingWriter, folder_hash_index
+
+logger = logging.getLogger(__name__)
+
+# Статистика способов передачи файлов
+transfer_stats = {"via_host": 0, "via_url": 0, "url_fallbacks": 0, "bytes_offloaded": 0}
+
+async def upload_via_url(telegram_file, yadisk_path: str, yadisk_helper) -> bool:
+    """
+    Передает Яндекс.Диску ссылку на файл Telegram, чтобы он скачал файл сам
+
+    Returns:
+        True, если файл загружен; False, если нужно загрузить файл обычным способом
+    """
+    url = telegram_file.file_path or ""
+    if not url.startswith("https://"):
+        # Локальный Bot API сервер отдает путь к файлу, а не ссылку
+        return False
+    try:
+        await yadisk_helper.upload_from_url_async(url, yadisk_path, UPLOAD_FROM_URL_TIMEOUT)
+    except Exception as e:
+        # Ссылку не логируем: она содержит токен бота
+        logger.warning(f"Не удалось загрузить {yadisk_path} по ссылке, загружаем через сервер бота: {e}")
+        transfer_stats["url_fallbacks"] += 1
+        return False
+    transfer_stats["via_url"] += 1
+    transfer_stats["bytes_offloaded"] += telegram_file.file_size or 0
+    return True
+
+def upload_progress_callback(progress: Optional[ProgressReporter]):
+    """Возвращает колбэк, показывающий процент загрузки на Яндекс.Диск в сообщении о прогрессе"""
+    if progress is None:
+        return None
+
+    def report(sent: int, total: int) -> None:
+        if total:
+            # Правки сообщения ограничивает ProgressReporter, здесь только меняем текст
+            progress.update(f"⏳ Загрузка на Яндекс.Диск... {sent * 100 // total}% "
+                            f"({sent / (1024 * 1024):.1f} из {total / (1024 * 1024):.1f} МБ)")
+    return report
+
+async def download_and_upload(source, local_filename: str, yadisk_path: str, session: SessionState,
+                              yadisk_helper, progress: Optional[ProgressReporter], stage_text: str) -> Optional[str]:
+    """
+    Скачивает файл из Telegram и загружает его на Яндекс.Диск
+
+    В режиме UPLOAD_FROM_URL Яндекс.Диск сам скачивает файл по ссылке Telegram,
+    а при ошибке файл передается через сервер бота. В режиме CONTENT_DEDUP хэши
+    считаются во время скачивания, и если в папке встречи уже есть файл с тем же
+    содержимым, загрузка пропускается.
+
+    Args:
+        source: Объект Telegram с методом get_file (PhotoSize, Document)
+        local_filename: Имя временного локального файла
+        yadisk_path: Путь на Яндекс.Диске
+        session: Текущая сессия пользователя
+        yadisk_helper: Помощник для работы с Яндекс.Диском
+        progress: Отчет о прогрессе
+        stage_text: Текст этапа скачивания из Telegram
+
+    Returns:
+        Путь к уже существующему файлу с тем же содержимым или None, если файл загружен в yadisk_path
+    """
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    file_path = os.path.join(UPLOAD_DIR, local_filename)
+    job_class, cost = classify_media(source.file_size)
+
+    try:
+        # Ждем свободный слот: большие файлы не мешают небольшим и записи протокола
+        async with job_scheduler.slot(job_class, session.user_id, cost):
+            if progress:
+                progress.stage(stage_text)
+            telegram_file = await source.get_file()
+
+            if UPLOAD_FROM_URL:
+                if progress:
+                    progress.stage("⏳ Загрузка на Яндекс.Диск...")
+                if await upload_via_url(telegram_file, yadisk_path, yadisk_helper):
+                    return None
+
+            writer = None
+            if CONTENT_DEDUP:
+                # Считаем хэши при скачивании, без повторного чтения файла
+                with open(file_path, "wb") as out:
+                    writer = HashingWriter(out)
+                    await telegram_file.download_to_memory(writer)
+                existing_path = await folder_hash_index.find(session.folder_path, writer, yadisk_helper)
+                if existing_path:
+                    return existing_path
+            else:
+                await telegram_file.download_to_drive(file_path)
+
+            # Загружаем на Яндекс.Диск асинхронно
+            if progress:
+                progress.stage("⏳ Загрузка на Яндекс.Диск...")
+            await yadisk_helper.upload_file_async(file_path, yadisk_path,
+                                                  progress_callback=upload_progress_callback(progress))
+            transfer_stats["via_host"] += 1
+            if writer:
+                folder_hash_index.add(session.folder_path, writer, yadisk_path)
+            return None
+    finally:
+        # Удаляем временный файл
+        if os.path.exists(file_path):
+            os.remove(file_path)
@@ -1,39 +1,49 @@
+import asyncio
 import logging
 import os
-import tempfile
+from functools import partial
+from typing import Optional
 from telegram import Update
 from telegram.ext import ContextTypes
 
 from config.config import UPLOAD_DIR
-from src.utils.session_utils import state_manager
+from src.utils.session_utils import state_manager, SessionState, ProtocolEntry
 from src.utils.speech_recognition import SpeechRecognizer
-from src.utils.message_utils import send_temp_message, send_processing_message, update_processing_message
+from src.utils.message_utils import send_temp_message, ProgressReporter
+from src.utils.job_scheduler import job_scheduler, classify_media, JOB_RECOGNITION
+from src.handlers.media_handlers.dispatch import dispatch_media
 
 logger = logging.getLogger(__name__)
 
 # Создаем объект распознавателя речи
 speech_recognizer = SpeechRecognizer(language="ru-RU")
 
-async def handle_voice(update: Update, context: ContextTypes.DEFAULT_TYPE, yadisk_helper) -> None:
+async def upload_voice(ogg_file_path: str, yadisk_voice_path: str, session: SessionState,
+                       yadisk_helper, file_size: Optional[int]) -> None:
+    """Загружает голосовое сообщение на Яндекс.Диск в слоте планировщика задач"""
+    job_class, cost = classify_media(file_size)
+    async with job_scheduler.slot(job_class, session.user_id, cost):
+        await yadisk_helper.upload_file_async(ogg_file_path, yadisk_voice_path)
+
+async def recognize_voice(ogg_file_path: str, session: SessionState, file_unique_id: str,
+                          duration: Optional[int]) -> Optional[str]:
+    """Распознает речь в слоте планировщика задач (стоимость - длительность в минутах)"""
+    async with job_scheduler.slot(JOB_RECOGNITION, session.user_id, max(1.0, (duration or 0) / 60)):
+        return await speech_recognizer.recognize_voice(ogg_file_path, file_unique_id)
+
+async def process_voice(update: Update, session: SessionState, yadisk_helper,
+                        entry: ProtocolEntry, progress: ProgressReporter) -> None:
     """
-    Обрабатывает голосовые сообщения и распознает речь
+    Сохраняет голосовое сообщение, распознает речь и записывает результат
+    в зарезервированное место протокола
     """
-    user_id = update.effective_user.id
-    session = state_manager.get_session(user_id)
-    
-    if not session:
-        await update.message.reply_text("Сначала нужно начать встречу с помощью команды /new")
-        return
-    
+    ogg_file_path = None
     try:
-        # Показываем индикатор прогресса
-        progress_message = await send_processing_message(update, context, "⏳ Получение голосового сообщения...")
-        
         # Получаем голосовое сообщение
         voice_file = await update.message.voice.get_file()
         
         # Обновляем сообщение о прогрессе
-        progress_message = await update_processing_message(progress_message, "⏳ Загрузка голосового сообщения...")
+        progress.stage("⏳ Загрузка голосового сообщения...")
         
         # Создаем временный путь для сохранения OGG файла
         os.makedirs(UPLOAD_DIR, exist_ok=True)
@@ -42,49 +52,86 @@ async def handle_voice(update: Update, context: ContextTypes.DEFAULT_TYPE, yadis
         # Загружаем ogg файл
         await voice_file.download_to_drive(ogg_file_path)
         
-        # Обновляем сообщение о прогрессе
-        progress_message = await update_processing_message(progress_message, "⏳ Загрузка на Яндекс.Диск...")
-        
-        # Формируем путь на Яндекс.Диске для голосового сообщения
+        # Сохраняем аудио на Яндекс.Диск и распознаем речь одновременно: обе операции
+        # зависят только от локального файла
+        progress.stage("🔊 Сохраняю и распознаю речь...")
         yadisk_voice_path = f"{session.folder_path}/{session.file_prefix}_{voice_file.file_unique_id}.ogg"
+        upload_result, text = await asyncio.gather(
+            upload_voice(ogg_file_path, yadisk_voice_path, session, yadisk_helper, update.message.voice.file_size),
+            recognize_voice(ogg_file_path, session, voice_file.file_unique_id, update.message.voice.duration),
+            return_exceptions=True
+        )
         
-        # Загружаем голосовое сообщение на Яндекс.Диск асинхронно
-        await yadisk_helper.upload_file_async(ogg_file_path, yadisk_voice_path)
-        
-        # Распознаем речь
-        progress_message = await update_processing_message(progress_message, "🔊 Распознаю речь...")
-        text = await speech_recognizer.recognize_voice(ogg_file_path)
+        uploaded = not isinstance(upload_result, Exception)
+        if not uploaded:
+            logger.error(f"Не удалось загрузить голосовое сообщение на Яндекс.Диск: {upload_result}", exc_info=upload_result)
+        if isinstance(text, Exception):
+            logger.error(f"Ошибка при распознавании речи: {text}", exc_info=text)
+            text = None
         
         username = update.effective_user.username or update.effective_user.first_name
         
-        if text:
-            # Добавляем сообщение в лог
-            formatted_message = session.add_message(f"Голосовое сообщение ({voice_file.file_unique_id}): {text}", author=username)
-            
-            # Добавляем запись в файл на Яндекс.Диске
-            await yadisk_helper.append_to_text_file_async(formatted_message + "\n", session.txt_file_path)
-            
-            # Удаляем сообщение о прогрессе и показываем результат
-            await progress_message.delete()
-            await update.message.reply_text(f"✅ Распознанный текст:\n\n{text}")
-
-            # Отправляем временное сообщение
-            await send_temp_message(update, "📝 Сообщение сохранено в протоколе", 3)
-        else:
-            # Если распознавание не удалось, добавляем запись об этом
-            formatted_message = session.add_message(f"Голосовое сообщение ({voice_file.file_unique_id}): [Не удалось распознать]", author=username)
-            
-            # Добавляем запись в файл на Яндекс.Диске
-            await yadisk_helper.append_to_text_file_async(formatted_message + "\n", session.txt_file_path)
-            
-            # Удаляем сообщение о прогрессе и показываем результат
-            await progress_message.delete()
-            await update.message.reply_text("❌ Не удалось распознать речь. Возможно, запись слишком тихая или содержит шум.")
+        # Запись в протоколе отражает оба результата: аудио без текста или текст без аудио
+        # тоже попадают в протокол, чтобы не потерять сказанное
+        entry_text = f"Голосовое сообщение ({voice_file.file_unique_id}): {text or '[Не удалось распознать]'}"
+        if not uploaded:
+            entry_text += " [Аудио не сохранено на Яндекс.Диск]"
         
-        # Удаляем временный файл
-        if os.path.exists(ogg_file_path):
-            os.remove(ogg_file_path)
+        # Данные для структурированного протокола
+        details = {
+            "author_id": update.effective_user.id,
+            "path": yadisk_voice_path if uploaded else None,
+            "size": update.message.voice.file_size,
+            "duration": update.message.voice.duration,
+            "transcript": text,
+        }
+        
+        if not uploaded and not text:
+            # Ничего не удалось сохранить: отмечаем сообщение в протоколе и сообщаем об ошибке
+            session.complete_entry(entry, entry_text, author=username, entry_type="voice", **details)
+            await session.write_entry(yadisk_helper, entry)
+            await progress.finish(f"Произошла ошибка при обработке голосового сообщения: {str(upload_result)}")
+            return
+        
+        # Добавляем запись в протокол и в файл на Яндекс.Диске (ошибка записи только
+        # откладывает строку протокола)
+        session.complete_entry(entry, entry_text, author=username, entry_type="voice", **details)
+        written = await session.write_entry(yadisk_helper, entry)
+        
+        # Заменяем сообщение о прогрессе результатом
+        if text and uploaded:
+            await progress.finish(f"✅ Распознанный текст:\n\n{text}")
+            if written:
+                await send_temp_message(update, "📝 Сообщение сохранено в протоколе", 3)
+            else:
+                await send_temp_message(update, "⏳ Сообщение будет добавлено в протокол чуть позже", 3)
+        elif text:
+            await progress.finish(f"⚠️ Текст записан в протокол, но аудио не удалось сохранить на Яндекс.Диск:\n\n{text}")
+        else:
+            await progress.finish("❌ Не удалось распознать речь. Возможно, запись слишком тихая или содержит шум. Аудио сохранено на Яндекс.Диск.")
             
     except Exception as e:
         logger.error(f"Ошибка при обработке голосового сообщения: {e}", exc_info=True)
-        await update.message.reply_text(f"Произошла ошибка при обработке голосового сообщения: {str(e)}") 
\ No newline at end of file
+        await progress.finish(f"Произошла ошибка при обработке голосового сообщения: {str(e)}")
+    finally:
+        # Удаляем временный файл
+        if ogg_file_path and os.path.exists(ogg_file_path):
+            os.remove(ogg_file_path)
+
+async def handle_voice(update: Update, context: ContextTypes.DEFAULT_TYPE, yadisk_helper) -> None:
+    """
+    Обрабатывает голосовые сообщения и распознает речь
+    """
+    user_id = update.effective_user.id
+    session = state_manager.get_session(user_id)
+    
+    if not session:
+        await update.message.reply_text("Сначала нужно начать встречу с помощью команды /new")
+        return
+    
+    await dispatch_media(
+        update, session, yadisk_helper,
+        partial(process_voice, update, session, yadisk_helper),
+        initial_text="⏳ Получение голосового сообщения...",
+        accepted_text="📥 Голосовое сообщение принято, распознаю..."
+    )
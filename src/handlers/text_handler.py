@@ -34,17 +34,18 @@ async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
         return
     
     try:
-        # Добавляем сообщение в историю сессии
+        # Добавляем сообщение в историю сессии и в очередь протокола
         username = update.effective_user.username or update.effective_user.first_name
-        timestamp = session.add_message(message_text, author=username)
+        entry = session.reserve_entry()
+        session.complete_entry(entry, message_text, author=username, author_id=update.effective_user.id)
         
-        # Добавляем сообщение в файл на Яндекс.Диске
-        message_to_append = f"{timestamp}\n"
-        yadisk_helper.append_to_text_file(message_to_append, session.txt_file_path)
-        
-        # Отправляем временное сообщение
-        await send_temp_message(update, "📝 Сообщение записано в протокол", 2)
+        # Записываем сообщение в файл на Яндекс.Диске (после всех более ранних записей)
+        if await session.write_entry(yadisk_helper, entry):
+            await send_temp_message(update, "📝 Сообщение записано в протокол", 2)
+        else:
+            # Запись осталась в очереди протокола и будет записана при следующей записи
+            await send_temp_message(update, "⏳ Сообщение принято и будет записано в протокол чуть позже", 3)
         
     except Exception as e:
         logger.error(f"Ошибка при обработке текстового сообщения: {e}", exc_info=True)
-        await update.message.reply_text(f"❌ Не удалось сохранить сообщение: {str(e)}") 
\ No newline at end of file
+        await update.message.reply_text(f"❌ Не удалось сохранить сообщение: {str(e)}")
@@ -0,0 +1,211 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import Any, Awaitable, Coroutine, Dict, Hashable, Optional, Set
+from telegram.ext import BaseUpdateProcessor
+
+from config.config import BACKGROUND_MEDIA_CONCURRENCY
+
+logger = logging.getLogger(__name__)
+
+class KeyedLock:
+    """Набор asyncio-блокировок, создаваемых по ключу (например, по user_id)"""
+    def __init__(self):
+        # Ключ: идентификатор, Значение: блокировка
+        self._locks: Dict[Hashable, asyncio.Lock] = {}
+        # Ключ: идентификатор, Значение: количество задач, удерживающих или ожидающих блокировку
+        self._users: Dict[Hashable, int] = {}
+
+    @asynccontextmanager
+    async def acquire(self, key: Hashable):
+        """
+        Захватывает блокировку для указанного ключа
+
+        Ожидающие задачи получают блокировку в порядке обращения (FIFO),
+        поэтому порядок обработки для одного ключа сохраняется.
+        """
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        self._users[key] = self._users.get(key, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            # Удаляем блокировку, когда она больше никому не нужна
+            self._users[key] -= 1
+            if not self._users[key]:
+                del self._users[key]
+                del self._locks[key]
+
+    def is_locked(self, key: Hashable) -> bool:
+        """Проверяет, захвачена ли блокировка для указанного ключа"""
+        lock = self._locks.get(key)
+        return bool(lock and lock.locked())
+
+    def __len__(self) -> int:
+        return len(self._locks)
+
+class PerUserUpdateProcessor(BaseUpdateProcessor):
+    """
+    Обработчик обновлений, который обрабатывает обновления разных пользователей параллельно,
+    а обновления одного пользователя - строго по очереди в порядке поступления
+    """
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self.user_locks = KeyedLock()
+
+    @staticmethod
+    def _get_user_key(update: object) -> Optional[Hashable]:
+        """Возвращает ключ сериализации для обновления"""
+        user = getattr(update, 'effective_user', None)
+        if user:
+            return user.id
+        chat = getattr(update, 'effective_chat', None)
+        if chat:
+            return f"chat:{chat.id}"
+        # Обновления без пользователя и чата обрабатываем без блокировки
+        return None
+
+    async def process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        """
+        Обрабатывает обновление под блокировкой пользователя
+
+        Блокировка пользователя захватывается до общего ограничения параллельности:
+        обновления, ожидающие своей очереди, не занимают общие слоты и не мешают
+        обрабатывать обновления других пользователей.
+        """
+        key = self._get_user_key(update)
+        if key is None:
+            async with self._semaphore:
+                await self.do_process_update(update, coroutine)
+            return
+
+        if self.user_locks.is_locked(key):
+            logger.debug(f"Обновление пользователя {key} ожидает завершения предыдущего")
+
+        async with self.user_locks.acquire(key):
+            async with self._semaphore:
+                await self.do_process_update(update, coroutine)
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        """Выполняет обработку обновления"""
+        await coroutine
+
+    async def initialize(self) -> None:
+        """Ничего не делает"""
+
+    async def shutdown(self) -> None:
+        """Ничего не делает"""
+
+class BackgroundTaskManager:
+    """Фоновые задачи обработки, сгруппированные по ключу (user_id), с ограничением параллельности"""
+    def __init__(self, max_concurrency: int):
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        # Ключ: идентификатор, Значение: незавершенные задачи
+        self._tasks: Dict[Hashable, Set[asyncio.Task]] = {}
+
+    def spawn(self, key: Hashable, coro: Coroutine) -> asyncio.Task:
+        """Запускает корутину в фоне; одновременно выполняется не более max_concurrency задач"""
+        task = asyncio.create_task(self._run_limited(coro))
+        self.track(key, task)
+        return task
+
+    def track(self, key: Hashable, task: asyncio.Task) -> None:
+        """Добавляет уже запущенную задачу в список ожидаемых"""
+        self._tasks.setdefault(key, set()).add(task)
+        task.add_done_callback(partial(self._discard, key))
+
+    def _discard(self, key: Hashable, task: asyncio.Task) -> None:
+        tasks = self._tasks.get(key)
+        if tasks is not None:
+            tasks.discard(task)
+            if not tasks:
+                del self._tasks[key]
+
+    async def _run_limited(self, coro: Coroutine) -> Any:
+        async with self._semaphore:
+            try:
+                return await coro
+            except Exception as e:
+                logger.error(f"Ошибка в фоновой задаче: {e}", exc_info=True)
+
+    def pending_count(self, key: Optional[Hashable] = None) -> int:
+        """Возвращает количество незавершенных задач (для ключа или всего)"""
+        if key is not None:
+            return len(self._tasks.get(key, ()))
+        return sum(len(tasks) for tasks in self._tasks.values())
+
+    async def wait_for(self, key: Hashable) -> None:
+        """Ожидает завершения всех задач для ключа, включая запущенные во время ожидания"""
+        while self._tasks.get(key):
+            await asyncio.wait(list(self._tasks[key]))
+
+    async def shutdown(self) -> None:
+        """Ожидает завершения всех фоновых задач"""
+        if self._tasks:
+            logger.info(f"Ожидание завершения фоновых задач: {self.pending_count()}")
+        while self._tasks:
+            await asyncio.wait([task for tasks in self._tasks.values() for task in tasks])
+
+class LoopLagMonitor:
+    """
+    Измеряет задержку event loop: насколько позже запланированного просыпается
+    периодическая задача. Большая задержка означает, что loop заблокирован
+    синхронным кодом и бот не отвечает.
+    """
+    # Интервал измерения (в секундах)
+    INTERVAL = 0.5
+    # Задержка, о которой пишем предупреждение в лог (в секундах)
+    WARN_THRESHOLD = 0.2
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self.total_lag = 0.0
+        self.samples = 0
+
+    def start(self) -> None:
+        """Запускает измерение в текущем event loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Останавливает измерение и выводит статистику"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        logger.info(f"Задержка event loop: {self.get_metrics()}")
+
+    async def _run(self) -> None:
+        while True:
+            expected = time.monotonic() + self.INTERVAL
+            await asyncio.sleep(self.INTERVAL)
+            lag = max(0.0, time.monotonic() - expected)
+            self.last_lag = lag
+            self.max_lag = max(self.max_lag, lag)
+            self.total_lag += lag
+            self.samples += 1
+            if lag > self.WARN_THRESHOLD:
+                logger.warning(f"Event loop был заблокирован на {lag:.3f} с")
+
+    def get_metrics(self) -> Dict[str, float]:
+        """Возвращает последнюю, среднюю и максимальную задержку (в секундах)"""
+        return {
+            "last_lag": round(self.last_lag, 4),
+            "avg_lag": round(self.total_lag / self.samples, 4) if self.samples else 0.0,
+            "max_lag": round(self.max_lag, 4),
+        }
+
+# Создаем глобальный менеджер фоновой обработки файлов
+background_tasks = BackgroundTaskManager(BACKGROUND_MEDIA_CONCURRENCY)
+
+# Создаем глобальный монитор задержки event loop
+loop_lag_monitor = LoopLagMonitor()
@@ -0,0 +1,102 @@
+import hashlib
+import logging
+import time
+from typing import BinaryIO, Dict, Optional, Tuple
+
+from config.config import CONTENT_INDEX_TTL
+from src.utils.concurrency_utils import KeyedLock
+from src.utils.folder_navigation import FolderNavigator
+
+logger = logging.getLogger(__name__)
+
+class HashingWriter:
+    """Файловый объект, который считает MD5 и SHA-256 записываемых данных"""
+    def __init__(self, out: BinaryIO):
+        self.out = out
+        self.size = 0
+        self.hash_seconds = 0.0
+        self._md5 = hashlib.md5()
+        self._sha256 = hashlib.sha256()
+
+    def write(self, data: bytes) -> int:
+        started = time.perf_counter()
+        self._md5.update(data)
+        self._sha256.update(data)
+        self.hash_seconds += time.perf_counter() - started
+        self.size += len(data)
+        return self.out.write(data)
+
+    @property
+    def md5(self) -> str:
+        return self._md5.hexdigest()
+
+    @property
+    def sha256(self) -> str:
+        return self._sha256.hexdigest()
+
+class FolderHashIndex:
+    """
+    Индекс содержимого папок Яндекс.Диска по хэшам файлов
+
+    Строится по метаданным из списка файлов папки (md5, sha256, размер) и хранится
+    в памяти ttl секунд. Позволяет не загружать файл, если такой же файл
+    (например, тот же скан от другого пользователя) уже лежит в папке.
+    """
+    def __init__(self, ttl: float = CONTENT_INDEX_TTL):
+        self.ttl = ttl
+        # Ключ: папка, Значение: (время загрузки, {(размер, md5): (путь, sha256)})
+        self._folders: Dict[str, Tuple[float, Dict[Tuple[int, str], Tuple[str, str]]]] = {}
+        self._locks = KeyedLock()
+        self.stats = {"hits": 0, "misses": 0, "bytes_avoided": 0, "bytes_hashed": 0, "hash_seconds": 0.0}
+
+    async def _get_folder(self, folder: str, yadisk_helper) -> Dict[Tuple[int, str], Tuple[str, str]]:
+        async with self._locks.acquire(folder):
+            cached = self._folders.get(folder)
+            if cached and time.monotonic() - cached[0] < self.ttl:
+                return cached[1]
+
+            hashes = {}
+            for path, size, md5, sha256 in await yadisk_helper.list_file_hashes_async(folder):
+                if md5:
+                    hashes[(size, md5)] = (FolderNavigator.normalize_path(path), sha256 or "")
+            self._folders[folder] = (time.monotonic(), hashes)
+            logger.debug(f"Индекс хэшей папки {folder} обновлен: {len(hashes)} файлов")
+            return hashes
+
+    async def find(self, folder: str, writer: HashingWriter, yadisk_helper) -> Optional[str]:
+        """Возвращает путь к файлу с тем же содержимым в папке или None"""
+        self.stats["bytes_hashed"] += writer.size
+        self.stats["hash_seconds"] += writer.hash_seconds
+        try:
+            hashes = await self._get_folder(folder, yadisk_helper)
+        except Exception as e:
+            logger.error(f"Не удалось получить хэши файлов папки {folder}: {e}", exc_info=True)
+            return None
+
+        match = hashes.get((writer.size, writer.md5))
+        if match and (not match[1] or match[1] == writer.sha256):
+            self.stats["hits"] += 1
+            self.stats["bytes_avoided"] += writer.size
+            logger.info(f"Файл с таким же содержимым уже есть в папке: {match[0]}, загрузка пропущена")
+            return match[0]
+        self.stats["misses"] += 1
+        return None
+
+    def add(self, folder: str, writer: HashingWriter, path: str) -> None:
+        """Добавляет загруженный файл в индекс папки, если индекс уже построен"""
+        cached = self._folders.get(folder)
+        if cached:
+            cached[1][(writer.size, writer.md5)] = (path, writer.sha256)
+
+    def get_metrics(self) -> Dict[str, float]:
+        """Возвращает статистику совпадений и скорость хэширования"""
+        metrics = dict(self.stats)
+        metrics["hash_seconds"] = round(metrics["hash_seconds"], 3)
+        metrics["hash_mb_per_second"] = (
+            round(self.stats["bytes_hashed"] / self.stats["hash_seconds"] / (1024 * 1024), 1)
+            if self.stats["hash_seconds"] else 0.0
+        )
+        return metrics
+
+# Создаем глобальный индекс хэшей папок
+folder_hash_index = FolderHashIndex()
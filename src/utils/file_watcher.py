@@ -0,0 +1,77 @@
+import asyncio
+import logging
+import os
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+
+from config.config import CONFIG_WATCH_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+# Подпись файла: (время изменения в наносекундах, размер) или None, если файла нет
+Signature = Optional[Tuple[int, int]]
+
+class FileWatcher:
+    """
+    Следит за изменением файлов настроек и вызывает обработчик при изменении
+
+    Файлы проверяются раз в interval секунд по времени изменения и размеру
+    (os.stat), поэтому ручная правка allowed_users.json или allowed_folders.json
+    применяется без перезапуска бота.
+    """
+    def __init__(self, interval: float = CONFIG_WATCH_INTERVAL):
+        self.interval = interval
+        # Ключ: путь к файлу, Значение: обработчик и последняя подпись файла
+        self._files: Dict[Path, Tuple[Callable[[], None], Signature]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def _signature(path: Path) -> Signature:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def watch(self, path: Path, callback: Callable[[], None]) -> None:
+        """Добавляет файл для наблюдения (текущее состояние файла считается загруженным)"""
+        self._files[Path(path)] = (callback, self._signature(path))
+
+    def check(self) -> int:
+        """Проверяет файлы и вызывает обработчики изменившихся; возвращает их количество"""
+        changed = 0
+        for path, (callback, signature) in list(self._files.items()):
+            current = self._signature(path)
+            if current == signature:
+                continue
+            self._files[path] = (callback, current)
+            changed += 1
+            logger.info(f"Файл {path} изменен, перезагружаем")
+            try:
+                callback()
+            except Exception as e:
+                logger.error(f"Ошибка при перезагрузке {path}: {e}", exc_info=True)
+        return changed
+
+    def start(self) -> None:
+        """Запускает наблюдение в текущем event loop"""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Останавливает наблюдение"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            self.check()
+
+# Создаем глобальный наблюдатель за файлами настроек
+config_watcher = FileWatcher()
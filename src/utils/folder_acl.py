@@ -0,0 +1,259 @@
+import json
+import logging
+import threading
+from typing import Any, Dict, FrozenSet, List, Optional, Tuple
+
+from config.config import FOLDER_ACL_FILE
+
+logger = logging.getLogger(__name__)
+
+# Отметка в дереве путей: папка выдана целиком (вместе с подпапками)
+GRANTED = True
+
+def split_path(path: str) -> Tuple[str, ...]:
+    """Разбивает путь Яндекс.Диска на имена папок ("disk:/A//B/" -> ("A", "B"))"""
+    return tuple(part for part in path.replace("disk:", "").strip().split("/") if part)
+
+def join_path(parts: Tuple[str, ...]) -> str:
+    """Собирает нормализованный путь из имен папок"""
+    return "/" + "/".join(parts)
+
+class PathTrie:
+    """
+    Дерево разрешенных путей пользователя
+
+    Каждый узел - словарь "имя папки -> узел"; выданная папка отмечается GRANTED,
+    и ее подпапки в дереве уже не хранятся. Проверка пути проходит по дереву
+    от корня, поэтому занимает O(глубина пути) и не зависит от числа выданных папок.
+    """
+    def __init__(self, folders: List[str]):
+        self._root: Dict[str, Any] = {}
+        for folder in folders:
+            self._add(split_path(folder))
+        # Минимальный список папок: вложенные в другие выданные папки не показываются
+        self.roots: List[str] = sorted(self._collect(self._root, ()))
+
+    def _add(self, parts: Tuple[str, ...]) -> None:
+        if self._root is GRANTED:
+            return
+        if not parts:
+            # Выдан корень Диска
+            self._root = GRANTED
+            return
+        node = self._root
+        for part in parts[:-1]:
+            node = node.setdefault(part, {})
+            if node is GRANTED:
+                # Папка уже входит в выданную родительскую
+                return
+        node[parts[-1]] = GRANTED
+
+    def _collect(self, node, prefix: Tuple[str, ...]) -> List[str]:
+        if node is GRANTED:
+            return [join_path(prefix)]
+        folders = []
+        for name, child in node.items():
+            folders.extend(self._collect(child, prefix + (name,)))
+        return folders
+
+    def allows(self, path: str) -> bool:
+        """Проверяет, находится ли путь в одной из выданных папок"""
+        node = self._root
+        for part in split_path(path):
+            if node is GRANTED:
+                return True
+            node = node.get(part)
+            if node is None:
+                return False
+        return node is GRANTED
+
+class FolderACL:
+    """
+    Права пользователей и групп на папки Яндекс.Диска (folder_acl.json)
+
+    Формат файла:
+        {"users": {"<id>": ["/папка", ...]},
+         "groups": {"<группа>": {"members": ["<id>", ...], "folders": ["/папка", ...]}}}
+
+    Пользователю доступны его папки и папки его групп. Для пользователей без
+    выданных папок действует общий список allowed_folders.json. Дерево путей
+    пользователя строится при первой проверке и кэшируется до изменения прав:
+    любое изменение увеличивает version, и устаревшие деревья перестраиваются.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.version = 0
+        # Ключ: ID пользователя, Значение: (версия прав, дерево путей или None)
+        self._tries: Dict[int, Tuple[int, Optional[PathTrie]]] = {}
+        try:
+            self._users, self._groups = self._read()
+        except Exception as e:
+            logger.error(f"Ошибка при загрузке прав на папки: {e}", exc_info=True)
+            self._users, self._groups = {}, {}
+        logger.info(f"Загружены права на папки: пользователей {len(self._users)}, групп {len(self._groups)}")
+
+    @staticmethod
+    def _read() -> Tuple[Dict[int, FrozenSet[str]], Dict[str, Dict[str, FrozenSet]]]:
+        """Читает права на папки из файла (отсутствующий файл - прав нет)"""
+        if not FOLDER_ACL_FILE.exists():
+            return {}, {}
+        with open(FOLDER_ACL_FILE, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        users = {
+            int(user_id): frozenset(join_path(split_path(folder)) for folder in folders)
+            for user_id, folders in data.get("users", {}).items()
+        }
+        groups = {
+            name: {
+                "members": frozenset(int(user_id) for user_id in group.get("members", [])),
+                "folders": frozenset(join_path(split_path(folder)) for folder in group.get("folders", [])),
+            }
+            for name, group in data.get("groups", {}).items()
+        }
+        return users, groups
+
+    @staticmethod
+    def _write(users: Dict[int, FrozenSet[str]], groups: Dict[str, Dict[str, FrozenSet]]) -> bool:
+        """Записывает права на папки в файл"""
+        data = {
+            "users": {str(user_id): sorted(folders) for user_id, folders in sorted(users.items()) if folders},
+            "groups": {
+                name: {"members": [str(user_id) for user_id in sorted(group["members"])],
+                       "folders": sorted(group["folders"])}
+                for name, group in sorted(groups.items())
+            },
+        }
+        try:
+            with open(FOLDER_ACL_FILE, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=4)
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении прав на папки: {e}", exc_info=True)
+            return False
+
+    def save(self) -> bool:
+        """Сохраняет права на папки в файл"""
+        return self._write(self._users, self._groups)
+
+    def reload(self) -> None:
+        """
+        Перезагружает права на папки из файла
+
+        Если файл поврежден (например, сохранен наполовину), остаются прежние права.
+        """
+        try:
+            users, groups = self._read()
+        except Exception as e:
+            logger.error(f"Не удалось перезагрузить права на папки, права не изменены: {e}", exc_info=True)
+            return
+        with self._lock:
+            self._users, self._groups = users, groups
+            self.version += 1
+        logger.info(f"Права на папки перезагружены: пользователей {len(users)}, групп {len(groups)}")
+
+    def user_grants(self, user_id: int) -> FrozenSet[str]:
+        """Возвращает папки, выданные пользователю лично и через группы"""
+        folders = set(self._users.get(user_id, ()))
+        for group in self._groups.values():
+            if user_id in group["members"]:
+                folders |= group["folders"]
+        return frozenset(folders)
+
+    def get_trie(self, user_id: int) -> Optional[PathTrie]:
+        """Возвращает дерево путей пользователя или None, если папки ему не выданы"""
+        cached = self._tries.get(user_id)
+        if cached and cached[0] == self.version:
+            return cached[1]
+        with self._lock:
+            version = self.version
+            grants = self.user_grants(user_id)
+        trie = PathTrie(list(grants)) if grants else None
+        self._tries[user_id] = (version, trie)
+        return trie
+
+    def _commit(self, users: Dict[int, FrozenSet[str]], groups: Dict[str, Dict[str, FrozenSet]]) -> bool:
+        """
+        Применяет новые права: сначала записывает их в файл, затем заменяет права в памяти
+
+        Если файл записать не удалось, действуют прежние права, поэтому после
+        перезапуска бот не потеряет изменение, о котором администратор знает как об успешном.
+        """
+        if not self._write(users, groups):
+            return False
+        self._users, self._groups = users, groups
+        # Новая версия сбрасывает кэш деревьев путей
+        self.version += 1
+        return True
+
+    def _with_user(self, user_id: int, folders: FrozenSet[str]) -> Dict[int, FrozenSet[str]]:
+        """Возвращает копию прав пользователей с новыми папками пользователя"""
+        users = dict(self._users)
+        if folders:
+            users[user_id] = folders
+        else:
+            users.pop(user_id, None)
+        return users
+
+    def _with_group(self, name: str, members: FrozenSet[int], folders: FrozenSet[str]) -> Dict[str, Dict[str, FrozenSet]]:
+        """Возвращает копию групп с измененной группой (пустая группа удаляется)"""
+        groups = dict(self._groups)
+        if members or folders:
+            groups[name] = {"members": members, "folders": folders}
+        else:
+            groups.pop(name, None)
+        return groups
+
+    def _get_group(self, name: str) -> Dict[str, FrozenSet]:
+        return self._groups.get(name, {"members": frozenset(), "folders": frozenset()})
+
+    def grant_user(self, user_id: int, folder: str) -> bool:
+        """Выдает пользователю папку"""
+        with self._lock:
+            folders = self._users.get(user_id, frozenset()) | {join_path(split_path(folder))}
+            return self._commit(self._with_user(user_id, folders), self._groups)
+
+    def revoke_user(self, user_id: int, folder: str) -> bool:
+        """Забирает у пользователя папку"""
+        with self._lock:
+            folders = self._users.get(user_id, frozenset()) - {join_path(split_path(folder))}
+            return self._commit(self._with_user(user_id, folders), self._groups)
+
+    def grant_group(self, name: str, folder: str) -> bool:
+        """Выдает группе папку (группа создается при необходимости)"""
+        with self._lock:
+            group = self._get_group(name)
+            folders = group["folders"] | {join_path(split_path(folder))}
+            return self._commit(self._users, self._with_group(name, group["members"], folders))
+
+    def revoke_group(self, name: str, folder: str) -> bool:
+        """Забирает у группы папку (пустая группа удаляется)"""
+        with self._lock:
+            group = self._get_group(name)
+            folders = group["folders"] - {join_path(split_path(folder))}
+            return self._commit(self._users, self._with_group(name, group["members"], folders))
+
+    def add_member(self, name: str, user_id: int) -> bool:
+        """Добавляет пользователя в группу (группа создается при необходимости)"""
+        with self._lock:
+            group = self._get_group(name)
+            return self._commit(self._users, self._with_group(name, group["members"] | {user_id}, group["folders"]))
+
+    def remove_member(self, name: str, user_id: int) -> bool:
+        """Удаляет пользователя из группы (пустая группа удаляется)"""
+        with self._lock:
+            group = self._get_group(name)
+            return self._commit(self._users, self._with_group(name, group["members"] - {user_id}, group["folders"]))
+
+    def describe(self) -> str:
+        """Форматирует выданные права для сообщения"""
+        lines = []
+        for name, group in sorted(self._groups.items()):
+            members = ", ".join(str(user_id) for user_id in sorted(group["members"])) or "нет"
+            folders = ", ".join(sorted(group["folders"])) or "нет"
+            lines.append(f"👥 {name}: участники: {members}; папки: {folders}")
+        for user_id, folders in sorted(self._users.items()):
+            lines.append(f"👤 {user_id}: {', '.join(sorted(folders))}")
+        return "\n".join(lines) if lines else "Права на папки не выданы, всем доступен общий список папок."
+
+# Создаем глобальные права на папки
+folder_acl = FolderACL()
@@ -1,11 +1,14 @@
 import logging
 import asyncio
 import json
+import posixpath
 from functools import partial
-from typing import List, Dict, Any, Tuple, Optional, Callable
-from telegram import Update, ReplyKeyboardMarkup, ReplyKeyboardRemove
+from typing import List, Dict, Any, FrozenSet, Tuple, Optional, Callable
+from telegram import Update, ReplyKeyboardMarkup
 from telegram.ext import ContextTypes
 from config.config import FOLDERS_FILE
+from src.utils.folder_acl import folder_acl
+from src.utils.message_utils import send_message_with_retry
 import yadisk
 import os
 
@@ -33,13 +36,27 @@ class FolderNavigator:
         # Кэш для хранения структуры папок
         self.folder_cache = {}
     
+    @property
+    def allowed_folders(self) -> List[str]:
+        """Список разрешенных папок"""
+        return self._allowed[0]
+    
+    @allowed_folders.setter
+    def allowed_folders(self, folders: List[str]) -> None:
+        # Список и множество для быстрой проверки заменяются одним присваиванием
+        self._allowed: Tuple[List[str], FrozenSet[str]] = (list(folders), frozenset(folders))
+    
+    def _read_allowed_folders(self) -> List[str]:
+        """Читает список разрешенных папок из файла allowed_folders.json"""
+        with open(FOLDERS_FILE, 'r') as f:
+            folders = json.load(f)
+        # Убеждаемся, что все пути начинаются с / и не заканчиваются на /
+        return [self.normalize_path(folder) for folder in folders]
+    
     def _load_allowed_folders(self) -> List[str]:
         """Загружает список разрешенных папок из файла allowed_folders.json"""
         try:
-            with open(FOLDERS_FILE, 'r') as f:
-                folders = json.load(f)
-                # Убеждаемся, что все пути начинаются с / и не заканчиваются на /
-                return [self.normalize_path(folder) for folder in folders]
+            return self._read_allowed_folders()
         except Exception as e:
             logger.error(f"Ошибка при загрузке разрешенных папок: {e}", exc_info=True)
             return []
@@ -224,31 +241,48 @@ class FolderNavigator:
         
         return keyboard
     
-    def is_path_allowed(self, path: str) -> bool:
-        """Проверяет, входит ли указанный путь в список разрешенных папок"""
+    def get_allowed_folders(self, user_id: Optional[int] = None) -> List[str]:
+        """
+        Возвращает папки, доступные пользователю
+        
+        Если пользователю выданы папки (лично или через группу), возвращаются они,
+        иначе - общий список разрешенных папок.
+        """
+        if user_id is not None:
+            trie = folder_acl.get_trie(user_id)
+            if trie is not None:
+                return trie.roots
+        return self.allowed_folders
+    
+    def is_path_allowed(self, path: str, user_id: Optional[int] = None) -> bool:
+        """Проверяет, входит ли указанный путь в папки, доступные пользователю"""
+        if user_id is not None:
+            trie = folder_acl.get_trie(user_id)
+            if trie is not None:
+                # Проверка по дереву путей пользователя: O(глубина пути)
+                return trie.allows(path)
+        
+        folders, folder_set = self._allowed
         # Если список разрешенных папок пуст, разрешаем любой путь
-        if not self.allowed_folders:
+        if not folders:
             return True
             
         normalized_path = self.normalize_path(path)
         
-        # Логируем проверку пути
-        logger.debug(f"Проверка пути: {path} -> нормализован в: {normalized_path}")
-        logger.debug(f"Разрешенные папки: {self.allowed_folders}")
-        
         # Сначала проверяем, является ли путь одним из разрешенных
-        if normalized_path in self.allowed_folders:
-            logger.debug(f"Путь {normalized_path} найден в списке разрешенных папок")
+        if normalized_path in folder_set:
             return True
-            
-        # Затем проверяем, находится ли путь внутри одной из разрешенных папок
-        for allowed_folder in self.allowed_folders:
-            # Проверяем, что путь начинается с разрешенной папки и после неё идет слеш или ничего
-            if normalized_path.startswith(allowed_folder + "/") or normalized_path == allowed_folder:
-                logger.debug(f"Путь {normalized_path} находится внутри разрешенной папки {allowed_folder}")
+        
+        # Затем проверяем родительские папки пути: количество проверок равно глубине пути
+        parent = normalized_path
+        while True:
+            parent = posixpath.dirname(parent)
+            if not parent or parent == "/":
+                break
+            if parent in folder_set:
                 return True
         
-        logger.debug(f"Путь {normalized_path} не разрешен")        
+        logger.debug("Путь %s не разрешен", normalized_path)
         return False
     
     async def show_folders(
@@ -264,41 +298,17 @@ class FolderNavigator:
         # Сохраняем текущий путь для использования в build_keyboard
         self.current_path = normalized_path
         
-        # Максимальное количество попыток отправки сообщения
-        max_retries = 3
-        retry_delay = 1.5  # секунды
-        
-        # Функция для повторных попыток отправки сообщения
-        async def send_message_with_retry(text, keyboard=None, retries=max_retries):
-            for attempt in range(retries):
-                try:
-                    if keyboard:
-                        await update.message.reply_text(
-                            text,
-                            reply_markup=keyboard
-                        )
-                    else:
-                        await update.message.reply_text(
-                            text,
-                            reply_markup=ReplyKeyboardRemove()
-                        )
-                    return True
-                except Exception as e:
-                    logger.warning(f"Ошибка при отправке сообщения (попытка {attempt+1}/{retries}): {str(e)}")
-                    if attempt < retries - 1:
-                        await asyncio.sleep(retry_delay)
-                    else:
-                        logger.error(f"Не удалось отправить сообщение после {retries} попыток: {str(e)}", exc_info=True)
-                        return False
+        user_id = update.effective_user.id if update.effective_user else None
+        allowed_folders = self.get_allowed_folders(user_id)
         
         # Если путь корневой, проверяем есть ли разрешенные папки
-        if normalized_path == "/" and self.allowed_folders:
+        if normalized_path == "/" and allowed_folders:
             # Формируем сообщение с разрешенными папками
             message = f"{self.title}"
             allowed_folders_display = []
             
             # Создаем список разрешенных папок для отображения
-            for folder in self.allowed_folders:
+            for folder in allowed_folders:
                 folder_name = self.get_folder_name(folder)
                 allowed_folders_display.append({"name": folder_name, "path": folder})
             
@@ -312,12 +322,12 @@ class FolderNavigator:
                 self.build_keyboard(allowed_folders_display),
                 resize_keyboard=True
             )
-            await send_message_with_retry(message, keyboard)
+            await send_message_with_retry(update, message, keyboard)
             return
         
         # Проверяем, разрешен ли выбранный путь
-        if not self.is_path_allowed(normalized_path) and normalized_path != "/":
-            await send_message_with_retry(f"⛔ Папка недоступна: {normalized_path}")
+        if not self.is_path_allowed(normalized_path, user_id) and normalized_path != "/":
+            await send_message_with_retry(update, f"⛔ Папка недоступна: {normalized_path}")
             
             # Показываем доступные папки
             await self.show_folders(update, context)
@@ -332,7 +342,7 @@ class FolderNavigator:
                 
                 # Показываем сообщение, что папка пуста, но продолжаем показывать
                 # клавиатуру, чтобы пользователь мог выбрать эту папку
-                await send_message_with_retry(f"📂 Папка '{folder_name}' пуста, но вы можете выбрать её")
+                await send_message_with_retry(update, f"📂 Папка '{folder_name}' пуста, но вы можете выбрать её")
                 
                 # Сохраняем пустой список папок и путь в контексте
                 context.user_data["folders"] = []
@@ -386,11 +396,11 @@ class FolderNavigator:
                 self.build_keyboard(folders),
                 resize_keyboard=True
             )
-            await send_message_with_retry(message, keyboard)
+            await send_message_with_retry(update, message, keyboard)
             
         except Exception as e:
             logger.error(f"Ошибка при отображении папок для {normalized_path}: {str(e)}", exc_info=True)
-            await send_message_with_retry(f"🚫 Ошибка при работе с папкой: {str(e)}")
+            await send_message_with_retry(update, f"🚫 Ошибка при работе с папкой: {str(e)}")
             
             # В случае ошибки пробуем вернуться на верхний уровень
             if normalized_path != "/":
@@ -402,12 +412,16 @@ class FolderNavigator:
                     logger.error(f"Не удалось перейти на родительский путь: {str(parent_error)}", exc_info=True)
     
     def reload_allowed_folders(self) -> None:
-        """Перезагружает список разрешенных папок из файла"""
+        """
+        Перезагружает список разрешенных папок из файла
+        
+        Если файл поврежден (например, сохранен наполовину), остается прежний список.
+        """
         try:
-            self.allowed_folders = self._load_allowed_folders()
+            self.allowed_folders = self._read_allowed_folders()
             logger.info(f"Список разрешенных папок перезагружен. Загружено {len(self.allowed_folders)} папок")
         except Exception as e:
-            logger.error(f"Ошибка при перезагрузке разрешенных папок: {e}", exc_info=True)
+            logger.error(f"Ошибка при перезагрузке разрешенных папок, список не изменен: {e}", exc_info=True)
     
     def validate_folder_name(self, folder_name: str) -> Tuple[bool, str]:
         """Проверяет допустимость имени папки для Яндекс.Диска
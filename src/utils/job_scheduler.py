@@ -0,0 +1,181 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Hashable, Optional, Tuple
+
+from config.config import JOB_CLASS_LIMITS, LARGE_MEDIA_THRESHOLD_MB
+
+logger = logging.getLogger(__name__)
+
+# Классы задач
+JOB_PROTOCOL = "protocol"          # Запись в файл протокола
+JOB_SMALL_MEDIA = "small_media"    # Фото, голосовые и небольшие документы
+JOB_LARGE_MEDIA = "large_media"    # Большие документы
+JOB_RECOGNITION = "recognition"    # Распознавание речи
+
+class JobRejected(Exception):
+    """Очередь задач переполнена: задача не принята"""
+    def __init__(self, job_class: str):
+        self.job_class = job_class
+        super().__init__("⏳ Бот сейчас перегружен. Пожалуйста, повторите попытку через минуту.")
+
+def classify_media(file_size: Optional[int]) -> Tuple[str, float]:
+    """Возвращает класс задачи и ее стоимость (размер в МБ, не меньше 1) для файла"""
+    size_mb = (file_size or 0) / (1024 * 1024)
+    job_class = JOB_LARGE_MEDIA if size_mb > LARGE_MEDIA_THRESHOLD_MB else JOB_SMALL_MEDIA
+    return job_class, max(1.0, size_mb)
+
+class _Waiter:
+    __slots__ = ("future", "tag", "cost", "enqueued")
+
+    def __init__(self, tag: float, cost: float):
+        self.future = asyncio.get_running_loop().create_future()
+        self.tag = tag
+        self.cost = cost
+        self.enqueued = time.monotonic()
+
+class _JobClassQueue:
+    """
+    Очередь одного класса задач
+
+    Очередь честная по пользователям (weighted fair queuing): каждая задача
+    получает метку max(виртуальное время, метка предыдущей задачи пользователя) + cost,
+    первой запускается задача с наименьшей меткой. Пользователь, отправляющий много
+    или тяжелые задачи, не задерживает задачи других пользователей.
+    """
+    def __init__(self, name: str, limit: int, max_queue: int):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self.running = 0
+        self.queued = 0
+        self.virtual_time = 0.0
+        # Ключ: пользователь, Значение: ожидающие задачи пользователя (FIFO)
+        self.waiters: Dict[Hashable, Deque[_Waiter]] = {}
+        # Ключ: пользователь, Значение: метка последней задачи пользователя
+        self.user_tags: Dict[Hashable, float] = {}
+        self.stats = {"started": 0, "rejected": 0, "total_wait": 0.0, "max_wait": 0.0}
+
+    def record_start(self, wait: float) -> None:
+        self.stats["started"] += 1
+        self.stats["total_wait"] += wait
+        self.stats["max_wait"] = max(self.stats["max_wait"], wait)
+
+    def enqueue(self, user: Hashable, cost: float) -> _Waiter:
+        tag = max(self.virtual_time, self.user_tags.get(user, 0.0)) + cost
+        self.user_tags[user] = tag
+        waiter = _Waiter(tag, cost)
+        self.waiters.setdefault(user, deque()).append(waiter)
+        self.queued += 1
+        return waiter
+
+    def remove(self, user: Hashable, waiter: _Waiter) -> None:
+        """Убирает отмененную задачу из очереди и возвращает пользователю ее стоимость"""
+        queue = self.waiters.get(user)
+        if queue and waiter in queue:
+            # Метки следующих задач пользователя включают стоимость отмененной задачи
+            for later in list(queue)[queue.index(waiter) + 1:]:
+                later.tag -= waiter.cost
+            queue.remove(waiter)
+            if user in self.user_tags:
+                self.user_tags[user] -= waiter.cost
+            self.queued -= 1
+            if not queue:
+                del self.waiters[user]
+
+    def release(self) -> None:
+        self.running -= 1
+        while self.running < self.limit and self.waiters:
+            # Запускаем задачу с наименьшей меткой среди первых задач пользователей
+            user = min(self.waiters, key=lambda u: self.waiters[u][0].tag)
+            queue = self.waiters[user]
+            waiter = queue.popleft()
+            if not queue:
+                del self.waiters[user]
+            self.queued -= 1
+            self.virtual_time = max(self.virtual_time, waiter.tag)
+            if waiter.future.done():
+                continue
+            self.running += 1
+            self.record_start(time.monotonic() - waiter.enqueued)
+            waiter.future.set_result(None)
+
+        # Удаляем метки пользователей без ожидающих задач, отставшие от виртуального времени
+        for user in [u for u, tag in self.user_tags.items() if tag <= self.virtual_time and u not in self.waiters]:
+            del self.user_tags[user]
+
+class JobScheduler:
+    """
+    Планировщик тяжелых задач обработки
+
+    Для каждого класса задач (запись протокола, небольшие и большие файлы,
+    распознавание речи) задано максимальное количество одновременно выполняемых
+    задач и максимальная длина очереди. Классы не конкурируют за слоты друг с другом,
+    поэтому загрузка большого документа не задерживает запись текста в протокол.
+    При переполнении очереди задача отклоняется исключением JobRejected.
+    """
+    def __init__(self, limits: Dict[str, tuple] = JOB_CLASS_LIMITS):
+        self._queues = {name: _JobClassQueue(name, limit, max_queue) for name, (limit, max_queue) in limits.items()}
+
+    @asynccontextmanager
+    async def slot(self, job_class: str, user_id: Hashable, cost: float = 1.0):
+        """
+        Ожидает свободный слот для задачи указанного класса
+
+        Args:
+            job_class: Класс задачи
+            user_id: Пользователь, для честного распределения слотов
+            cost: Относительная стоимость задачи (например, размер файла в МБ)
+        """
+        queue = self._queues[job_class]
+
+        if queue.running < queue.limit and not queue.queued:
+            queue.running += 1
+            queue.record_start(0.0)
+        else:
+            if queue.queued >= queue.max_queue:
+                queue.stats["rejected"] += 1
+                logger.warning(f"Очередь задач {job_class} переполнена ({queue.queued}), задача пользователя {user_id} отклонена")
+                raise JobRejected(job_class)
+
+            waiter = queue.enqueue(user_id, max(cost, 0.001))
+            logger.debug(f"Задача {job_class} пользователя {user_id} ожидает в очереди ({queue.queued})")
+            try:
+                await waiter.future
+            except asyncio.CancelledError:
+                if waiter.future.done() and not waiter.future.cancelled():
+                    # Слот уже был выдан: возвращаем его
+                    queue.release()
+                else:
+                    queue.remove(user_id, waiter)
+                raise
+
+        try:
+            yield
+        finally:
+            queue.release()
+
+    def max_running(self) -> int:
+        """Возвращает суммарное количество задач, которые могут выполняться одновременно"""
+        return sum(queue.limit for queue in self._queues.values())
+
+    def get_metrics(self) -> Dict[str, Dict[str, float]]:
+        """Возвращает статистику ожидания по классам задач"""
+        metrics = {}
+        for name, queue in self._queues.items():
+            stats = queue.stats
+            metrics[name] = {
+                "running": queue.running,
+                "queued": queue.queued,
+                "limit": queue.limit,
+                "started": stats["started"],
+                "rejected": stats["rejected"],
+                "avg_wait": round(stats["total_wait"] / stats["started"], 3) if stats["started"] else 0.0,
+                "max_wait": round(stats["max_wait"], 3),
+            }
+        return metrics
+
+# Создаем глобальный планировщик задач
+job_scheduler = JobScheduler()
@@ -1,28 +1,131 @@
 import asyncio
+import heapq
+import itertools
 import logging
-from telegram import Message, Update
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+from telegram import Message, Update, ReplyKeyboardRemove
+from telegram.error import BadRequest, NetworkError
 from telegram.ext import ContextTypes
 
+from src.utils.rate_limiter import PRIORITY_REPLY, PRIORITY_PROGRESS, PRIORITY_TEMP
+
 logger = logging.getLogger(__name__)
 
+class MessageDeletionScheduler:
+    """
+    Планировщик отложенного удаления сообщений
+
+    Одна фоновая задача хранит сроки удаления в куче и удаляет сообщения,
+    срок которых наступил, пачками через delete_messages (по одному запросу на чат).
+    """
+    # Сообщения, срок удаления которых наступает в пределах окна, удаляются одной пачкой
+    BATCH_WINDOW = 0.5
+    # Максимальное количество сообщений в одном запросе delete_messages
+    MAX_BATCH_SIZE = 100
+
+    def __init__(self):
+        # Элементы кучи: (срок удаления, порядковый номер, сообщение)
+        self._heap: List[Tuple[float, int, Message]] = []
+        self._counter = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def schedule(self, message: Message, delay: float) -> None:
+        """Планирует удаление сообщения через delay секунд"""
+        deadline = time.monotonic() + delay
+        heapq.heappush(self._heap, (deadline, next(self._counter), message))
+        self._ensure_running()
+        # Будим задачу, если новое сообщение нужно удалить раньше остальных
+        if self._heap[0][2] is message:
+            self._wakeup.set()
+
+    def _ensure_running(self) -> None:
+        """Запускает фоновую задачу удаления, если она еще не запущена"""
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            if not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            delay = self._heap[0][0] - time.monotonic()
+            if delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            # Забираем все сообщения, срок удаления которых наступает в пределах окна
+            limit = time.monotonic() + self.BATCH_WINDOW
+            due = []
+            while self._heap and self._heap[0][0] <= limit:
+                due.append(heapq.heappop(self._heap)[2])
+            await self._delete_batch(due)
+
+    async def _delete_batch(self, messages: List[Message]) -> None:
+        """Удаляет сообщения, группируя их по чатам"""
+        by_chat: Dict[int, List[Message]] = defaultdict(list)
+        for message in messages:
+            by_chat[message.chat_id].append(message)
+
+        for chat_id, chat_messages in by_chat.items():
+            bot = chat_messages[0].get_bot()
+            message_ids = [message.message_id for message in chat_messages]
+            for start in range(0, len(message_ids), self.MAX_BATCH_SIZE):
+                batch = message_ids[start:start + self.MAX_BATCH_SIZE]
+                try:
+                    await bot.delete_messages(chat_id, batch)
+                    logger.debug(f"Удалено {len(batch)} временных сообщений в чате {chat_id}")
+                except Exception as e:
+                    logger.error(f"Ошибка при удалении временных сообщений в чате {chat_id}: {e}", exc_info=True)
+
+    async def flush(self) -> None:
+        """Немедленно удаляет все запланированные сообщения и останавливает фоновую задачу"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        pending = [item[2] for item in self._heap]
+        self._heap.clear()
+        if pending:
+            await self._delete_batch(pending)
+
+# Создаем глобальный планировщик удаления сообщений
+deletion_scheduler = MessageDeletionScheduler()
+
 async def send_temp_message(update: Update, text: str, timeout: int = 5) -> None:
     """
     Отправляет временное сообщение, которое автоматически удаляется через указанное время
     
+    Удаление выполняет фоновый планировщик, поэтому функция возвращается сразу после отправки.
+    
     Args:
         update (Update): Объект обновления Telegram
         text (str): Текст сообщения
         timeout (int): Время в секундах, через которое сообщение будет удалено
     """
     try:
-        # Отправляем сообщение
-        message = await update.message.reply_text(text)
-        
-        # Ожидаем указанное время
-        await asyncio.sleep(timeout)
+        # Отправляем сообщение с низким приоритетом, чтобы не задерживать ответы
+        message = await update.message.get_bot().send_message(
+            chat_id=update.message.chat_id,
+            text=text,
+            rate_limit_args={"priority": PRIORITY_TEMP}
+        )
         
-        # Удаляем сообщение
-        await message.delete()
+        # Планируем удаление сообщения
+        deletion_scheduler.schedule(message, timeout)
     except Exception as e:
         logger.error(f"Ошибка при работе с временным сообщением: {e}", exc_info=True)
 
@@ -57,7 +160,208 @@ async def send_processing_message(update: Update, context: ContextTypes.DEFAULT_
         Message: Объект сообщения для дальнейшего обновления
     """
     try:
-        return await update.message.reply_text(initial_text)
+        return await update.message.get_bot().send_message(
+            chat_id=update.message.chat_id,
+            text=initial_text,
+            rate_limit_args={"priority": PRIORITY_PROGRESS}
+        )
     except Exception as e:
         logger.error(f"Ошибка при отправке сообщения о прогрессе: {e}", exc_info=True)
-        return None 
\ No newline at end of file
+        return None
+
+async def send_message_with_retry(update: Update, text: str, reply_markup=None, retries: int = 3,
+                                  retry_delay: float = 1.5) -> Optional[Message]:
+    """
+    Отправляет ответ пользователю с повторными попытками при сетевых ошибках
+    
+    Превышение лимитов Telegram (RetryAfter) обрабатывает OutboundRateLimiter,
+    здесь повторяются только сбои соединения.
+    
+    Args:
+        update (Update): Объект обновления Telegram
+        text (str): Текст сообщения
+        reply_markup: Клавиатура (по умолчанию клавиатура убирается)
+        retries (int): Количество попыток
+        retry_delay (float): Задержка между попытками в секундах
+        
+    Returns:
+        Message: Отправленное сообщение или None, если отправить не удалось
+    """
+    for attempt in range(retries):
+        try:
+            return await update.message.reply_text(
+                text,
+                reply_markup=reply_markup or ReplyKeyboardRemove()
+            )
+        except BadRequest as e:
+            # Ошибку в самом запросе повторять бессмысленно
+            logger.error(f"Не удалось отправить сообщение: {e}", exc_info=True)
+            return None
+        except NetworkError as e:
+            logger.warning(f"Ошибка при отправке сообщения (попытка {attempt+1}/{retries}): {str(e)}")
+            if attempt < retries - 1:
+                await asyncio.sleep(retry_delay)
+            else:
+                logger.error(f"Не удалось отправить сообщение после {retries} попыток: {str(e)}", exc_info=True)
+                return None
+        except Exception as e:
+            logger.error(f"Не удалось отправить сообщение: {e}", exc_info=True)
+            return None
+
+
+class ProgressReporter:
+    """
+    Отображает ход обработки файла, экономя запросы к Telegram
+
+    - этапы, завершившиеся быстрее SHOW_THRESHOLD, не показываются вовсе;
+    - правки сообщений в одном чате выполняются не чаще, чем раз в EDIT_INTERVAL;
+    - отправка и правка выполняются фоновой задачей, обработчик их не ждет;
+    - по завершении выполняется одна итоговая правка (или ответ, если сообщение
+      о прогрессе так и не было показано) либо удаление.
+
+    Используется как асинхронный контекстный менеджер: при выходе из блока без
+    вызова finish() фоновая задача все равно завершается, а при исключении
+    пользователь получает сообщение об ошибке.
+    """
+    # Этап короче порога (в секундах) не отображается
+    SHOW_THRESHOLD = 1.0
+    # Минимальный интервал между правками сообщений в одном чате (в секундах)
+    EDIT_INTERVAL = 1.5
+    # Ключ: chat_id, Значение: время последней отправки/правки в чате. Общий для всех
+    # отчетов, чтобы ограничивать правки в чате; записи старше EDIT_INTERVAL больше
+    # ни на что не влияют и удаляются при завершении отчетов
+    _last_edit: Dict[int, float] = {}
+
+    def __init__(self, update: Update, initial_text: str = "⏳ Обработка...",
+                 progress_message: Optional[Message] = None):
+        self.message = update.message
+        self.chat_id = update.message.chat_id
+        # Если сообщение уже отправлено (например, подтверждение приема), дальше оно только правится
+        self.progress_message = progress_message
+        self._text = initial_text
+        self._shown_text: Optional[str] = initial_text if progress_message else None
+        self._stage_started = time.monotonic()
+        self._finished = False
+        self._changed = asyncio.Event()
+        # Количество запросов без оптимизации: отправка, правка на каждый этап, удаление
+        self.stages = 1
+        self.api_calls = 0
+        self._task = asyncio.create_task(self._run())
+
+    @classmethod
+    async def accepted(cls, update: Update, text: str) -> "ProgressReporter":
+        """Сразу отправляет подтверждение приема и возвращает отчет, который будет его обновлять"""
+        message = await update.message.get_bot().send_message(
+            chat_id=update.message.chat_id,
+            text=text,
+            rate_limit_args={"priority": PRIORITY_REPLY}
+        )
+        reporter = cls(update, text, progress_message=message)
+        reporter.api_calls += 1
+        return reporter
+
+    async def __aenter__(self) -> "ProgressReporter":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        if exc_type is not None and not self._finished:
+            logger.error(f"Обработка в чате {self.chat_id} прервана: {exc}")
+            await self.finish("❌ Не удалось завершить обработку. Попробуйте отправить файл еще раз.")
+        else:
+            await self.finish()
+
+    @classmethod
+    def _forget_stale_chats(cls) -> None:
+        """Удаляет время правок, которое уже не ограничивает новые правки"""
+        expired = time.monotonic() - cls.EDIT_INTERVAL
+        for chat_id, edited in list(cls._last_edit.items()):
+            if edited <= expired:
+                del cls._last_edit[chat_id]
+
+    def stage(self, text: str) -> None:
+        """Сообщает о начале нового этапа обработки (не блокирует обработчик)"""
+        self._text = text
+        self._stage_started = time.monotonic()
+        self.stages += 1
+        self._changed.set()
+
+    def update(self, text: str) -> None:
+        """Обновляет текст текущего этапа (например, процент загрузки), не начиная новый этап"""
+        self._text = text
+        self._changed.set()
+
+    async def _run(self) -> None:
+        while not self._finished:
+            if self._text == self._shown_text:
+                self._changed.clear()
+                await self._changed.wait()
+                continue
+
+            # Показываем этап, только если он длится дольше порога и прошло достаточно времени с прошлой правки
+            due = max(self._stage_started + self.SHOW_THRESHOLD,
+                      self._last_edit.get(self.chat_id, 0) + self.EDIT_INTERVAL)
+            delay = due - time.monotonic()
+            if delay > 0:
+                self._changed.clear()
+                try:
+                    await asyncio.wait_for(self._changed.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            text = self._text
+            try:
+                if self.progress_message is None:
+                    self.progress_message = await self.message.get_bot().send_message(
+                        chat_id=self.chat_id,
+                        text=text,
+                        rate_limit_args={"priority": PRIORITY_PROGRESS}
+                    )
+                else:
+                    await self.progress_message.edit_text(text)
+                self.api_calls += 1
+            except Exception as e:
+                logger.error(f"Ошибка при обновлении сообщения о прогрессе: {e}", exc_info=True)
+            self._shown_text = text
+            self._last_edit[self.chat_id] = time.monotonic()
+
+    async def finish(self, final_text: Optional[str] = None) -> None:
+        """
+        Завершает отображение прогресса
+
+        Args:
+            final_text: Итоговый текст. Если указан, сообщение о прогрессе заменяется им
+                (или отправляется ответом, если прогресс не показывался), иначе сообщение удаляется.
+        """
+        if self._finished:
+            return
+        self._finished = True
+        self._changed.set()
+        # Дожидаемся только текущего запроса, если он уже выполняется
+        try:
+            await self._task
+        finally:
+            self._forget_stale_chats()
+
+        baseline = self.stages + 1 + (1 if final_text else 0)
+        try:
+            if self.progress_message is not None and final_text:
+                # Итоговая правка - это ответ пользователю, она заменяет неотправленные правки прогресса
+                await self.progress_message.get_bot().edit_message_text(
+                    final_text,
+                    chat_id=self.chat_id,
+                    message_id=self.progress_message.message_id,
+                    rate_limit_args={"priority": PRIORITY_REPLY}
+                )
+                self.api_calls += 1
+            elif self.progress_message is not None:
+                deletion_scheduler.schedule(self.progress_message, 0)
+                self.api_calls += 1
+            elif final_text:
+                await self.message.reply_text(final_text)
+                self.api_calls += 1
+        except Exception as e:
+            logger.error(f"Ошибка при завершении сообщения о прогрессе: {e}", exc_info=True)
+        finally:
+            logger.info(f"Прогресс обработки в чате {self.chat_id}: {self.api_calls} запросов к Telegram "
+                        f"вместо {baseline}, сэкономлено {baseline - self.api_calls}")
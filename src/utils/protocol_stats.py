@@ -0,0 +1,76 @@
+import json
+import logging
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+from config.config import SIDECAR_DIR
+
+logger = logging.getLogger(__name__)
+
+# Типы записей, содержащие файлы
+FILE_ENTRY_TYPES = ("photo", "document", "voice", "album")
+
+def iter_sidecar_records(paths: Iterable[Path]) -> Iterator[Dict[str, Any]]:
+    """
+    Построчно читает записи структурированных протоколов (JSONL)
+
+    Файлы не загружаются в память целиком; поврежденные строки пропускаются.
+    """
+    for path in paths:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                for line_number, line in enumerate(f, 1):
+                    if not line.strip():
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        logger.warning(f"Пропущена поврежденная строка {line_number} в {path}")
+        except OSError as e:
+            logger.error(f"Не удалось прочитать структурированный протокол {path}: {e}")
+
+def aggregate_folder_stats(sidecar_dir: Path = SIDECAR_DIR, since: Optional[str] = None) -> Dict[str, Dict[str, int]]:
+    """
+    Собирает статистику по папкам из локальных структурированных протоколов
+
+    Args:
+        sidecar_dir: Папка с JSONL-файлами протоколов
+        since: Учитывать только записи не раньше этой даты ("ГГГГ-ММ-ДД")
+
+    Returns:
+        Словарь: папка -> количество встреч, записей, записей по типам и объем файлов в байтах
+    """
+    stats: Dict[str, Dict[str, int]] = {}
+    # Встреча - отдельный JSONL-файл; одна встреча может не попасть в период целиком
+    for path in sorted(Path(sidecar_dir).glob("*.jsonl")):
+        counted_meeting = False
+        for record in iter_sidecar_records([path]):
+            if since and record.get("ts", "") < since:
+                continue
+            folder_stats = stats.setdefault(record.get("folder", ""), {"meetings": 0, "entries": 0, "bytes": 0})
+            if not counted_meeting:
+                folder_stats["meetings"] += 1
+                counted_meeting = True
+            entry_type = record.get("type", "text")
+            folder_stats["entries"] += 1
+            folder_stats[entry_type] = folder_stats.get(entry_type, 0) + 1
+            if entry_type in FILE_ENTRY_TYPES:
+                folder_stats["bytes"] += record.get("size") or 0
+    return stats
+
+def format_folder_stats(stats: Dict[str, Dict[str, int]], limit: int = 15) -> str:
+    """Форматирует статистику по папкам для сообщения (папки с наибольшим числом записей первыми)"""
+    if not stats:
+        return "Нет данных."
+    lines = []
+    for folder, folder_stats in sorted(stats.items(), key=lambda item: -item[1]["entries"])[:limit]:
+        lines.append(
+            f"📁 {folder}\n"
+            f"   встреч: {folder_stats['meetings']}, записей: {folder_stats['entries']}, "
+            f"фото: {folder_stats.get('photo', 0)}, документов: {folder_stats.get('document', 0)}, "
+            f"голосовых: {folder_stats.get('voice', 0)}, альбомов: {folder_stats.get('album', 0)}, "
+            f"файлов: {folder_stats['bytes'] / (1024 * 1024):.1f} МБ"
+        )
+    if len(stats) > limit:
+        lines.append(f"... и еще папок: {len(stats) - limit}")
+    return "\n".join(lines)
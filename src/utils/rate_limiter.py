@@ -0,0 +1,322 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Any, Callable, Coroutine, Dict, List, Optional, Tuple, Union
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+from config.config import OUTBOUND_GLOBAL_RATE, OUTBOUND_CHAT_RATE, OUTBOUND_GROUP_RATE, OUTBOUND_CHAT_BURST
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты исходящих запросов (меньше - важнее)
+PRIORITY_REPLY = 0      # Ответы пользователю
+PRIORITY_PROGRESS = 1   # Правки сообщений о прогрессе
+PRIORITY_TEMP = 2       # Временные уведомления
+PRIORITY_DELETE = 3     # Удаление сообщений
+
+PRIORITY_NAMES = {
+    PRIORITY_REPLY: "reply",
+    PRIORITY_PROGRESS: "progress",
+    PRIORITY_TEMP: "temp",
+    PRIORITY_DELETE: "delete",
+}
+
+# Методы API, приоритет которых определяется по умолчанию
+ENDPOINT_PRIORITIES = {
+    "editMessageText": PRIORITY_PROGRESS,
+    "deleteMessage": PRIORITY_DELETE,
+    "deleteMessages": PRIORITY_DELETE,
+}
+
+# Методы API, новые вызовы которых для того же сообщения заменяют еще не отправленные
+MERGEABLE_ENDPOINTS = {"editMessageText"}
+
+class TokenBucket:
+    """Корзина токенов: rate токенов в секунду, не более capacity накопленных"""
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        # Время, до которого запросы запрещены (после ответа RetryAfter)
+        self.blocked_until = 0.0
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def ready_at(self, now: float) -> float:
+        """Возвращает момент, когда в корзине появится токен"""
+        self._refill(now)
+        ready = now if self.tokens >= 1 else now + (1 - self.tokens) / self.rate
+        return max(ready, self.blocked_until)
+
+    def consume(self, now: float) -> None:
+        """Забирает один токен"""
+        self._refill(now)
+        self.tokens -= 1
+
+    def is_idle(self, now: float) -> bool:
+        """Проверяет, что корзина снова полна и не заблокирована (ее можно создать заново)"""
+        self._refill(now)
+        return self.tokens >= self.capacity and self.blocked_until <= now
+
+class _OutboundRequest:
+    """Запрос в очереди исходящих сообщений"""
+    __slots__ = ("priority", "seq", "chat_id", "callback", "args", "kwargs", "merge_key",
+                 "future", "enqueued", "attempts", "dropped", "merged")
+
+    def __init__(self, priority: int, seq: int, chat_id, callback, args, kwargs, merge_key):
+        self.priority = priority
+        self.seq = seq
+        self.chat_id = chat_id
+        self.callback = callback
+        self.args = args
+        self.kwargs = kwargs
+        self.merge_key = merge_key
+        self.future = asyncio.get_running_loop().create_future()
+        self.enqueued = time.monotonic()
+        self.attempts = 0
+        self.dropped = False
+        # Запросы, замененные этим запросом: получают его результат
+        self.merged: List["_OutboundRequest"] = []
+
+    def __lt__(self, other: "_OutboundRequest") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+    def set_result(self, result) -> None:
+        for request in [self] + self.merged:
+            if not request.future.done():
+                request.future.set_result(result)
+
+    def set_exception(self, error: BaseException) -> None:
+        for request in [self] + self.merged:
+            if not request.future.done():
+                request.future.set_exception(error)
+
+class OutboundRateLimiter(BaseRateLimiter[Dict[str, Any]]):
+    """
+    Планировщик исходящих запросов к Bot API
+
+    Все запросы бота, адресованные чату, проходят через очереди по чатам
+    с корзинами токенов на чат и общей корзиной на бота. Из готовых к отправке
+    запросов первым уходит запрос с наивысшим приоритетом: ответы пользователю
+    опережают правки прогресса, временные уведомления и удаления. Еще не отправленная
+    правка сообщения заменяется более новой правкой того же сообщения.
+
+    Приоритет можно задать явно через rate_limit_args={"priority": ...}.
+    """
+    # Максимальное количество повторов после ответа RetryAfter
+    MAX_RETRIES = 3
+    # Как часто удалять корзины чатов, в которые давно ничего не отправлялось (секунды)
+    BUCKET_EVICT_INTERVAL = 60
+
+    def __init__(self, global_rate: float = OUTBOUND_GLOBAL_RATE, chat_rate: float = OUTBOUND_CHAT_RATE,
+                 group_rate: float = OUTBOUND_GROUP_RATE, chat_burst: float = OUTBOUND_CHAT_BURST):
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.chat_burst = chat_burst
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        # Ключ: chat_id, Значение: корзина токенов чата
+        self._chat_buckets: Dict[Any, TokenBucket] = {}
+        self._last_eviction = time.monotonic()
+        # Ключ: chat_id, Значение: куча запросов чата
+        self._queues: Dict[Any, List[_OutboundRequest]] = {}
+        # Ключ: (метод, chat_id, message_id), Значение: ожидающий запрос, который можно заменить
+        self._mergeable: Dict[Tuple, _OutboundRequest] = {}
+        self._counter = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        # Ключ: приоритет, Значение: статистика задержки в очереди
+        self._metrics: Dict[int, Dict[str, float]] = {}
+
+    async def initialize(self) -> None:
+        """Ничего не делает: фоновая задача запускается при первом запросе"""
+
+    async def shutdown(self) -> None:
+        """Останавливает фоновую задачу и выводит статистику очереди"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        logger.info(f"Статистика очереди исходящих сообщений: {self.get_metrics()}")
+
+    def _get_chat_bucket(self, chat_id) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            # Для групп Telegram допускает меньше сообщений в минуту, чем для личных чатов
+            is_group = isinstance(chat_id, int) and chat_id < 0
+            rate = self.group_rate if is_group else self.chat_rate
+            bucket = self._chat_buckets[chat_id] = TokenBucket(rate, self.chat_burst)
+        return bucket
+
+    def _evict_idle_buckets(self, now: float) -> None:
+        """
+        Удаляет корзины чатов без ожидающих запросов, которые снова наполнились
+
+        Полная незаблокированная корзина ничем не отличается от новой, поэтому
+        удаление не меняет темп отправки, а словарь корзин не растет с числом
+        чатов, которым бот когда-либо писал.
+        """
+        self._last_eviction = now
+        idle = [chat_id for chat_id, bucket in self._chat_buckets.items()
+                if chat_id not in self._queues and bucket.is_idle(now)]
+        for chat_id in idle:
+            del self._chat_buckets[chat_id]
+        if idle:
+            logger.debug(f"Удалены корзины неактивных чатов: {len(idle)}, осталось {len(self._chat_buckets)}")
+
+    async def process_request(
+        self,
+        callback: Callable[..., Coroutine[Any, Any, Union[bool, Dict[str, Any], List[Dict[str, Any]]]]],
+        args: Any,
+        kwargs: Dict[str, Any],
+        endpoint: str,
+        data: Dict[str, Any],
+        rate_limit_args: Optional[Dict[str, Any]],
+    ) -> Union[bool, Dict[str, Any], List[Dict[str, Any]]]:
+        chat_id = data.get("chat_id")
+        if chat_id is None:
+            # Запросы, не адресованные чату (getFile, setWebhook и т.п.), не ограничиваем
+            return await callback(*args, **kwargs)
+
+        priority = ENDPOINT_PRIORITIES.get(endpoint, PRIORITY_REPLY)
+        if rate_limit_args and "priority" in rate_limit_args:
+            priority = rate_limit_args["priority"]
+
+        merge_key = None
+        if endpoint in MERGEABLE_ENDPOINTS and data.get("message_id") is not None:
+            merge_key = (endpoint, chat_id, data["message_id"])
+
+        request = _OutboundRequest(priority, next(self._counter), chat_id, callback, args, kwargs, merge_key)
+        self._enqueue(request)
+        return await request.future
+
+    def _enqueue(self, request: _OutboundRequest) -> None:
+        if request.merge_key is not None:
+            previous = self._mergeable.get(request.merge_key)
+            if previous is not None and not previous.dropped:
+                # Более новая правка заменяет неотправленную: старый запрос получит ее результат
+                previous.dropped = True
+                request.merged.append(previous)
+                request.merged.extend(previous.merged)
+                request.priority = min(request.priority, previous.priority)
+                self._record(previous.priority, None)
+                logger.debug(f"Правка сообщения {request.merge_key} заменена более новой")
+            self._mergeable[request.merge_key] = request
+
+        heapq.heappush(self._queues.setdefault(request.chat_id, []), request)
+
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+        self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            now = time.monotonic()
+            if now - self._last_eviction >= self.BUCKET_EVICT_INTERVAL:
+                self._evict_idle_buckets(now)
+            best: Optional[_OutboundRequest] = None
+            wait: Optional[float] = None
+
+            for chat_id in list(self._queues):
+                queue = self._queues[chat_id]
+                # Убираем замененные запросы из начала очереди
+                while queue and queue[0].dropped:
+                    heapq.heappop(queue)
+                if not queue:
+                    del self._queues[chat_id]
+                    continue
+
+                ready_at = self._get_chat_bucket(chat_id).ready_at(now)
+                if ready_at <= now:
+                    if best is None or queue[0] < best:
+                        best = queue[0]
+                else:
+                    wait = ready_at - now if wait is None else min(wait, ready_at - now)
+
+            if best is not None:
+                global_ready = self.global_bucket.ready_at(now)
+                if global_ready > now:
+                    best = None
+                    wait = global_ready - now
+
+            if best is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self._queues[best.chat_id])
+            if best.merge_key is not None and self._mergeable.get(best.merge_key) is best:
+                del self._mergeable[best.merge_key]
+            self._get_chat_bucket(best.chat_id).consume(now)
+            self.global_bucket.consume(now)
+            asyncio.create_task(self._execute(best))
+
+    async def _execute(self, request: _OutboundRequest) -> None:
+        request.attempts += 1
+        if request.attempts == 1:
+            self._record(request.priority, time.monotonic() - request.enqueued)
+
+        try:
+            result = await request.callback(*request.args, **request.kwargs)
+        except RetryAfter as e:
+            retry_after = e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds") else e.retry_after
+            logger.warning(f"Превышен лимит Telegram для чата {request.chat_id}, повтор через {retry_after} с")
+            if request.attempts > self.MAX_RETRIES:
+                request.set_exception(e)
+                return
+            # Приостанавливаем отправку в этот чат и возвращаем запрос в очередь
+            bucket = self._get_chat_bucket(request.chat_id)
+            bucket.blocked_until = max(bucket.blocked_until, time.monotonic() + retry_after)
+            if request.merge_key is not None:
+                newer = self._mergeable.get(request.merge_key)
+                if newer is not None and not newer.dropped:
+                    # Пока запрос выполнялся, пришла более новая правка: повтор не нужен
+                    request.dropped = True
+                    newer.merged.append(request)
+                    newer.merged.extend(request.merged)
+                    self._record(request.priority, None)
+                    return
+                # Повторяемую правку снова можно заменить более новой
+                self._mergeable[request.merge_key] = request
+            heapq.heappush(self._queues.setdefault(request.chat_id, []), request)
+            self._wakeup.set()
+        except Exception as e:
+            request.set_exception(e)
+        else:
+            request.set_result(result)
+
+    def _record(self, priority: int, delay: Optional[float]) -> None:
+        """Обновляет статистику задержки в очереди (delay=None - запрос заменен более новым)"""
+        stats = self._metrics.setdefault(priority, {"sent": 0, "merged": 0, "total_delay": 0.0, "max_delay": 0.0})
+        if delay is None:
+            stats["merged"] += 1
+            return
+        stats["sent"] += 1
+        stats["total_delay"] += delay
+        stats["max_delay"] = max(stats["max_delay"], delay)
+
+    def get_metrics(self) -> Dict[str, Dict[str, float]]:
+        """Возвращает статистику задержек в очереди по приоритетам"""
+        metrics = {}
+        for priority, stats in sorted(self._metrics.items()):
+            metrics[PRIORITY_NAMES.get(priority, str(priority))] = {
+                "sent": stats["sent"],
+                "merged": stats["merged"],
+                "avg_delay": round(stats["total_delay"] / stats["sent"], 3) if stats["sent"] else 0.0,
+                "max_delay": round(stats["max_delay"], 3),
+                "queued": sum(1 for queue in self._queues.values() for r in queue
+                              if r.priority == priority and not r.dropped),
+            }
+        return metrics
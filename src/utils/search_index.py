@@ -0,0 +1,289 @@
+import asyncio
+import logging
+import posixpath
+import re
+import sqlite3
+import threading
+from functools import partial
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from config.config import SEARCH_INDEX_FILE, SEARCH_BACKFILL_CONCURRENCY
+from src.utils.folder_navigation import FolderNavigator
+
+logger = logging.getLogger(__name__)
+
+# Строка записи протокола: [ГГГГ-ММ-ДД ЧЧ:ММ:СС] [автор] текст
+ENTRY_LINE_RE = re.compile(r"^\[(\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\] (?:\[([^\]]*)\] )?(.*)$")
+# Имя файла протокола (в том числе сегмента)
+PROTOCOL_NAME_RE = re.compile(r"_visit_.*\.txt$")
+# Папка сегментов протокола (PROTOCOL_SEGMENTED): <имя протокола>_parts
+SEGMENTS_SUFFIX = "_parts"
+# Слова запроса
+QUERY_TERM_RE = re.compile(r"\w+", re.UNICODE)
+
+# Строка индекса: (протокол, папка, время, автор, текст)
+IndexRow = Tuple[str, str, str, str, str]
+
+def protocol_folder(protocol_path: str) -> str:
+    """Возвращает папку встречи для файла протокола (для сегментов - папку рядом с папкой сегментов)"""
+    folder = posixpath.dirname(protocol_path)
+    if folder.endswith(SEGMENTS_SUFFIX):
+        folder = posixpath.dirname(folder)
+    return folder
+
+def segments_protocol(segments_path: str) -> str:
+    """Возвращает путь к протоколу, который собирается из папки сегментов"""
+    return segments_path[:-len(SEGMENTS_SUFFIX)] + ".txt"
+
+def parse_protocol(text: str, protocol_path: str) -> List[IndexRow]:
+    """
+    Разбирает текст протокола на записи
+
+    Строки без метки времени (например, список файлов альбома) относятся к предыдущей
+    записи; заголовок и завершающий блок протокола пропускаются.
+    """
+    folder = protocol_folder(protocol_path)
+    rows: List[List[str]] = []
+    current: Optional[List[str]] = None
+    for line in text.splitlines():
+        match = ENTRY_LINE_RE.match(line)
+        if match:
+            timestamp, author, message = match.groups()
+            current = [protocol_path, folder, timestamp, author or "", message]
+            rows.append(current)
+        elif line.startswith("==="):
+            current = None
+        elif current is not None and line.strip():
+            current[4] += "\n" + line.strip()
+    return [tuple(row) for row in rows]
+
+def build_match_query(query: str) -> str:
+    """
+    Преобразует текст запроса в запрос FTS5: все слова, с поиском по началу слова
+
+    У длинных слов отбрасывается окончание, чтобы находились другие формы слова
+    ("компрессоры" находит "компрессор", "поставщик" - "поставщиком").
+    """
+    terms = QUERY_TERM_RE.findall(query.lower())
+    return " ".join(f'"{term[:-2] if len(term) > 5 else term}"*' for term in terms)
+
+class SearchIndex:
+    """
+    Полнотекстовый индекс записей протоколов (SQLite FTS5)
+
+    Новые записи добавляются при записи протокола, старые протоколы
+    добавляются обходом папок Яндекс.Диска (backfill). Для каждого
+    проиндексированного файла хранится дата изменения, поэтому повторный
+    обход загружает только измененные протоколы.
+    """
+    def __init__(self, db_path: Path = SEARCH_INDEX_FILE):
+        self.db_path = Path(db_path)
+        self._conn: Optional[sqlite3.Connection] = None
+        # Соединение используется из пула потоков, поэтому обращения сериализуем
+        self._lock = threading.Lock()
+        # Текущий обход протоколов на Яндекс.Диске
+        self.backfill_task: Optional[asyncio.Task] = None
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS entries USING fts5(
+                    text,
+                    protocol UNINDEXED,
+                    folder UNINDEXED,
+                    ts UNINDEXED,
+                    author UNINDEXED,
+                    tokenize = 'unicode61 remove_diacritics 2'
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS protocols (
+                    path TEXT PRIMARY KEY,
+                    modified TEXT NOT NULL,
+                    entries INTEGER NOT NULL
+                )
+            """)
+            self._conn.commit()
+        return self._conn
+
+    def add_rows(self, rows: List[IndexRow]) -> None:
+        """Добавляет записи в индекс"""
+        with self._lock:
+            conn = self._connect()
+            conn.executemany(
+                "INSERT INTO entries (protocol, folder, ts, author, text) VALUES (?, ?, ?, ?, ?)", rows
+            )
+            conn.commit()
+
+    def replace_protocol(self, path: str, modified: str, rows: List[IndexRow]) -> None:
+        """Заменяет все записи протокола записями из файла"""
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM entries WHERE protocol = ?", (path,))
+            conn.executemany(
+                "INSERT INTO entries (protocol, folder, ts, author, text) VALUES (?, ?, ?, ?, ?)", rows
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO protocols (path, modified, entries) VALUES (?, ?, ?)",
+                (path, modified, len(rows))
+            )
+            conn.commit()
+
+    def is_indexed(self, path: str, modified: str) -> bool:
+        """Проверяет, проиндексирован ли протокол с этой датой изменения"""
+        with self._lock:
+            row = self._connect().execute("SELECT modified FROM protocols WHERE path = ?", (path,)).fetchone()
+        return row is not None and row[0] == modified
+
+    def search(self, query: str, allowed_folders: Optional[List[str]] = None, limit: int = 10) -> List[Dict[str, Any]]:
+        """
+        Ищет записи протоколов
+
+        Args:
+            query: Текст запроса
+            allowed_folders: Папки, доступные пользователю (пустой список - все папки)
+            limit: Максимальное количество результатов
+
+        Returns:
+            Найденные записи (самые релевантные первыми)
+        """
+        match_query = build_match_query(query)
+        if not match_query:
+            return []
+
+        sql = ("SELECT folder, ts, author, snippet(entries, 0, '«', '»', '…', 16) "
+               "FROM entries WHERE entries MATCH ?")
+        params: List[Any] = [match_query]
+        if allowed_folders:
+            # Ограничиваем поиск доступными папками и их подпапками
+            conditions = " OR ".join("folder = ? OR substr(folder, 1, ?) = ?" for _ in allowed_folders)
+            sql += f" AND ({conditions})"
+            for folder in allowed_folders:
+                params += [folder, len(folder) + 1, folder + "/"]
+        sql += " ORDER BY rank LIMIT ?"
+        params.append(limit)
+
+        with self._lock:
+            rows = self._connect().execute(sql, params).fetchall()
+        return [{"folder": folder, "ts": ts, "author": author, "snippet": snippet}
+                for folder, ts, author, snippet in rows]
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, partial(func, *args))
+
+    async def add_records_async(self, protocol_path: str, records: List[Dict[str, Any]]) -> None:
+        """Асинхронно добавляет записи протокола; ошибки индекса только записываются в лог"""
+        rows = [(protocol_path, record.get("folder", ""), record.get("ts", ""),
+                 record.get("author", ""), record.get("text", "")) for record in records]
+        try:
+            await self._run(self.add_rows, rows)
+        except Exception as e:
+            logger.error(f"Ошибка записи в поисковый индекс: {e}", exc_info=True)
+
+    async def search_async(self, query: str, allowed_folders: Optional[List[str]] = None,
+                           limit: int = 10) -> List[Dict[str, Any]]:
+        """Асинхронно ищет записи протоколов"""
+        return await self._run(self.search, query, allowed_folders, limit)
+
+    async def backfill(self, yadisk_helper, folders: List[str],
+                       concurrency: int = SEARCH_BACKFILL_CONCURRENCY) -> Dict[str, int]:
+        """
+        Добавляет в индекс протоколы из папок на Яндекс.Диске (с подпапками)
+
+        Одновременно выполняется не более concurrency запросов к Яндекс.Диску.
+        Протоколы, не изменившиеся с прошлого обхода, не загружаются.
+        Сегменты протокола индексируются вместе под путем протокола (так же, как
+        записи, добавленные во время встречи), а если рядом уже лежит объединенный
+        протокол - пропускаются, чтобы записи не повторялись.
+
+        Returns:
+            Статистика обхода
+        """
+        semaphore = asyncio.Semaphore(concurrency)
+        stats = {"folders": 0, "protocols": 0, "indexed": 0, "entries": 0, "errors": 0}
+
+        async def index_protocol(path: str, modified: str) -> None:
+            stats["protocols"] += 1
+            try:
+                if await self._run(self.is_indexed, path, modified):
+                    return
+                async with semaphore:
+                    text = await yadisk_helper.read_text_file_async(path)
+                rows = parse_protocol(text, path)
+                await self._run(self.replace_protocol, path, modified, rows)
+                stats["indexed"] += 1
+                stats["entries"] += len(rows)
+            except Exception as e:
+                stats["errors"] += 1
+                logger.error(f"Не удалось проиндексировать протокол {path}: {e}", exc_info=True)
+
+        async def index_segments(segments_path: str) -> None:
+            protocol_path = segments_protocol(segments_path)
+            stats["protocols"] += 1
+            try:
+                async with semaphore:
+                    items = await yadisk_helper.list_items_async(segments_path)
+                segments = sorted(
+                    (FolderNavigator.normalize_path(path), modified) for path, item_type, modified in items
+                    if item_type == "file" and PROTOCOL_NAME_RE.search(posixpath.basename(path))
+                )
+                if not segments:
+                    return
+                # Новый сегмент меняет и количество, и дату последнего изменения
+                modified = f"{max(modified for _, modified in segments)}#{len(segments)}"
+                if await self._run(self.is_indexed, protocol_path, modified):
+                    return
+                texts = []
+                for path, _ in segments:
+                    async with semaphore:
+                        texts.append(await yadisk_helper.read_text_file_async(path))
+                rows = parse_protocol("\n".join(texts), protocol_path)
+                await self._run(self.replace_protocol, protocol_path, modified, rows)
+                stats["indexed"] += 1
+                stats["entries"] += len(rows)
+            except Exception as e:
+                stats["errors"] += 1
+                logger.error(f"Не удалось проиндексировать сегменты протокола {segments_path}: {e}", exc_info=True)
+
+        async def walk(folder: str) -> None:
+            stats["folders"] += 1
+            try:
+                async with semaphore:
+                    items = await yadisk_helper.list_items_async(folder)
+            except Exception as e:
+                stats["errors"] += 1
+                logger.error(f"Не удалось получить содержимое папки {folder}: {e}", exc_info=True)
+                return
+            items = [(FolderNavigator.normalize_path(path), item_type, modified) for path, item_type, modified in items]
+            files = {path for path, item_type, _ in items if item_type != "dir"}
+            tasks = []
+            for path, item_type, modified in items:
+                if item_type == "dir":
+                    if not path.endswith(SEGMENTS_SUFFIX):
+                        tasks.append(walk(path))
+                    elif segments_protocol(path) not in files:
+                        tasks.append(index_segments(path))
+                elif PROTOCOL_NAME_RE.search(posixpath.basename(path)):
+                    tasks.append(index_protocol(path, modified))
+            await asyncio.gather(*tasks)
+
+        await asyncio.gather(*(walk(folder) for folder in folders))
+        logger.info(f"Обход протоколов завершен: {stats}")
+        return stats
+
+    def close(self) -> None:
+        """Останавливает обход протоколов и закрывает соединение с базой"""
+        if self.backfill_task and not self.backfill_task.done():
+            self.backfill_task.cancel()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+# Создаем глобальный поисковый индекс
+search_index = SearchIndex()
@@ -1,10 +1,26 @@
+import asyncio
+import json
 import logging
+import posixpath
 import time
-from typing import Dict, Optional
-from config.config import get_current_timestamp
+from functools import partial
+from typing import Any, Dict, List, Optional
+from config.config import get_current_timestamp, PROTOCOL_SEGMENTED, PROTOCOL_COMPACT_ON_END, SIDECAR_DIR
+from src.utils.job_scheduler import job_scheduler, JOB_PROTOCOL
+from src.utils.search_index import search_index
 
 logger = logging.getLogger(__name__)
 
+class ProtocolEntry:
+    """Запись протокола, место которой зарезервировано до того, как известен её текст"""
+    def __init__(self):
+        # Время поступления сообщения (запись получает его, даже если текст готов позже)
+        self.timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
+        self.text: Optional[str] = None
+        # Структурированная запись для JSONL-файла протокола
+        self.record: Optional[Dict[str, Any]] = None
+        self.done = False
+
 class SessionState:
     """Класс для хранения данных о текущей сессии встречи"""
     def __init__(self, root_folder: str, folder_path: str, folder_name: str, user_id: int):
@@ -17,6 +33,24 @@ class SessionState:
         self.user_id = user_id
         self.messages = []  # Список сообщений в сессии
         self.start_time = time.time()
+        # Записи, еще не записанные в файл протокола, в порядке поступления сообщений
+        self.pending_entries: List[ProtocolEntry] = []
+        # Заголовок протокола: файл создается вместе с первой записью
+        self.protocol_header = ""
+        # Текст протокола, уже записанный в файл на Яндекс.Диске
+        self.protocol_text = ""
+        # Протокол из сегментов: txt_file_path - логический протокол, сегменты лежат
+        # в папке рядом с ним и загружаются один раз, без перезаписи
+        self.segmented = PROTOCOL_SEGMENTED
+        self.segments: List[Dict[str, int]] = []
+        # Структурированный протокол (JSONL): локальная копия дописывается при каждой
+        # записи протокола, на Яндекс.Диск загружается при завершении встречи
+        self.sidecar_file = SIDECAR_DIR / f"{posixpath.splitext(posixpath.basename(self.txt_file_path))[0]}.jsonl"
+        # Завершение встречи уже начато (сообщение о завершении добавлено в историю)
+        self.ending = False
+        # Завершающий блок записан в протокол: повторное завершение его не дублирует
+        self.footer_written = False
+        self._write_lock = asyncio.Lock()
     
     def get_txt_filename(self) -> str:
         """Возвращает имя текстового файла"""
@@ -26,29 +60,230 @@ class SessionState:
         """Возвращает префикс для медиафайлов"""
         return f"{self.timestamp}_Files_{self.folder_name}_{self.user_id}"
     
-    def add_message(self, message: str, author: str = "") -> str:
+    def get_sidecar_path(self) -> str:
+        """Возвращает путь к структурированному протоколу (JSONL) на Яндекс.Диске"""
+        return f"{posixpath.splitext(self.txt_file_path)[0]}.jsonl"
+    
+    def get_segments_path(self) -> str:
+        """Возвращает папку с сегментами протокола"""
+        return f"{posixpath.splitext(self.txt_file_path)[0]}_parts"
+    
+    def add_message(self, message: str, author: str = "", timestamp: Optional[str] = None) -> str:
         """Добавляет сообщение в историю сессии и возвращает отформатированное сообщение"""
-        timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
+        timestamp = timestamp or time.strftime("%Y-%m-%d %H:%M:%S")
         author_prefix = f"[{author}] " if author else ""
         formatted_message = f"[{timestamp}] {author_prefix}{message}"
         self.messages.append(formatted_message)
         logger.debug(f"Добавлено сообщение в сессию: {formatted_message[:50]}...")
         return formatted_message
     
-    def get_session_summary(self) -> str:
-        """Возвращает сводку по сессии"""
-        duration = time.time() - self.start_time
-        hours, remainder = divmod(int(duration), 3600)
-        minutes, seconds = divmod(remainder, 60)
+    def reserve_entry(self) -> ProtocolEntry:
+        """Резервирует место для записи в протоколе в порядке поступления сообщений"""
+        entry = ProtocolEntry()
+        self.pending_entries.append(entry)
+        return entry
+    
+    def complete_entry(self, entry: ProtocolEntry, message: Optional[str], author: str = "",
+                       entry_type: str = "text", **details: Any) -> Optional[str]:
+        """
+        Заполняет зарезервированную запись
+        
+        Args:
+            entry: Зарезервированная запись
+            message: Текст записи или None, если запись нужно пропустить
+            author: Автор сообщения
+            entry_type: Тип записи (text, photo, document, voice, album, start)
+            **details: Данные для структурированного протокола: author_id, path, size, transcript
+            
+        Returns:
+            Отформатированное сообщение или None
+        """
+        if entry.done:
+            return entry.text
+        if message is not None:
+            entry.text = self.add_message(message, author=author, timestamp=entry.timestamp)
+            entry.record = {
+                "ts": entry.timestamp,
+                "folder": self.folder_path,
+                "author": author,
+                "author_id": details.pop("author_id", self.user_id),
+                "type": entry_type,
+                "text": message,
+                **details,
+            }
+        entry.done = True
+        return entry.text
+    
+    def add_entry(self, message: str, author: str = "", entry_type: str = "text", **details: Any) -> str:
+        """Добавляет сообщение в историю сессии и в очередь на запись в протокол"""
+        return self.complete_entry(self.reserve_entry(), message, author, entry_type, **details)
+    
+    def _append_sidecar(self, records: List[Dict[str, Any]]) -> None:
+        self.sidecar_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.sidecar_file, "a", encoding="utf-8") as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    
+    async def _record_entries(self, entries: List[ProtocolEntry]) -> None:
+        """Дописывает записанные в протокол записи в локальный JSONL-файл и в поисковый индекс"""
+        records = [entry.record for entry in entries if entry.record]
+        if not records:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, partial(self._append_sidecar, records))
+        except Exception as e:
+            logger.error(f"Ошибка записи структурированного протокола {self.sidecar_file}: {e}", exc_info=True)
+        await search_index.add_records_async(self.txt_file_path, records)
+    
+    async def _upload_sidecar(self, yadisk_helper) -> None:
+        """Загружает структурированный протокол на Яндекс.Диск рядом с протоколом"""
+        try:
+            loop = asyncio.get_running_loop()
+            text = await loop.run_in_executor(None, partial(self.sidecar_file.read_text, encoding="utf-8"))
+            async with job_scheduler.slot(JOB_PROTOCOL, self.user_id):
+                await yadisk_helper.create_text_file_async(text, self.get_sidecar_path())
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            logger.error(f"Не удалось загрузить структурированный протокол {self.get_sidecar_path()}: {e}", exc_info=True)
+    
+    def _take_ready_entries(self) -> List[ProtocolEntry]:
+        """Возвращает готовые записи из начала очереди (до первой неготовой)"""
+        ready = []
+        for entry in self.pending_entries:
+            if not entry.done:
+                break
+            ready.append(entry)
+        return ready
+    
+    async def _write_protocol(self, yadisk_helper, text: str) -> None:
+        """
+        Дописывает текст в протокол
         
-        # Получаем количество сообщений
-        total_messages = len(self.messages)
+        Текст протокола хранится в сессии, поэтому файл перезаписывается целиком
+        без предварительного скачивания. В режиме сегментов загружается только
+        новый текст отдельным файлом. Первая запись создает протокол с заголовком.
+        """
+        if not self.protocol_text:
+            text = self.protocol_header + text
+        async with job_scheduler.slot(JOB_PROTOCOL, self.user_id):
+            if self.segmented:
+                # Имя сегмента содержит имя протокола: временные файлы разных встреч не пересекаются
+                stem = posixpath.splitext(posixpath.basename(self.txt_file_path))[0]
+                name = f"{stem}_{len(self.segments) + 1:04d}.txt"
+                await yadisk_helper.create_text_file_async(text, f"{self.get_segments_path()}/{name}")
+                self.segments.append({"name": name, "bytes": len(text.encode("utf-8"))})
+            else:
+                await yadisk_helper.create_text_file_async(self.protocol_text + text, self.txt_file_path)
+        self.protocol_text += text
+    
+    async def _finish_segments(self, yadisk_helper) -> None:
+        """
+        Завершает протокол из сегментов
+        
+        Сегменты объединяются в txt_file_path (текст протокола уже есть в сессии),
+        и папка сегментов удаляется. Если объединение выключено или не удалось,
+        рядом с сегментами записывается индекс.
+        """
+        async with job_scheduler.slot(JOB_PROTOCOL, self.user_id):
+            if PROTOCOL_COMPACT_ON_END:
+                try:
+                    await yadisk_helper.create_text_file_async(self.protocol_text, self.txt_file_path)
+                    await yadisk_helper.remove_path_async(self.get_segments_path())
+                    self.segmented = False
+                    return
+                except Exception as e:
+                    logger.error(f"Не удалось объединить сегменты протокола {self.txt_file_path}: {e}", exc_info=True)
+            
+            index = {
+                "protocol": posixpath.basename(self.txt_file_path),
+                "segments": self.segments,
+            }
+            stem = posixpath.splitext(posixpath.basename(self.txt_file_path))[0]
+            await yadisk_helper.create_text_file_async(
+                json.dumps(index, ensure_ascii=False, indent=2),
+                f"{self.get_segments_path()}/{stem}_index.json"
+            )
+    
+    def get_protocol_path(self) -> str:
+        """Возвращает путь к протоколу на Яндекс.Диске (файл или папка сегментов)"""
+        return self.get_segments_path() if self.segmented else self.txt_file_path
+    
+    async def flush_protocol(self, yadisk_helper) -> int:
+        """
+        Записывает в файл протокола готовые записи
+        
+        Записи пишутся строго по порядку: если более ранняя запись еще не готова
+        (файл обрабатывается в фоне), более поздние ждут её в очереди.
+        
+        Returns:
+            Количество записанных записей
+        """
+        async with self._write_lock:
+            ready = self._take_ready_entries()
+            if not ready:
+                return 0
+            
+            text = "".join(f"{entry.text}\n" for entry in ready if entry.text)
+            if text:
+                # При ошибке записи остаются в очереди и будут записаны при следующей попытке
+                await self._write_protocol(yadisk_helper, text)
+            
+            del self.pending_entries[:len(ready)]
+            await self._record_entries(ready)
+            return len(ready)
+    
+    async def write_entry(self, yadisk_helper, entry: ProtocolEntry) -> bool:
+        """
+        Записывает готовые записи протокола и сообщает, попала ли в файл запись entry
+        
+        Запись остается в очереди, если более ранняя запись еще не готова, очередь
+        записи переполнена или запись не удалась; она будет записана при следующей
+        записи или при /end, поэтому ошибка здесь не означает потерю данных.
         
+        Returns:
+            True, если запись entry уже записана в протокол
+        """
+        try:
+            await self.flush_protocol(yadisk_helper)
+        except Exception as e:
+            logger.warning(f"Запись протокола {self.txt_file_path} отложена: {e}")
+        return entry not in self.pending_entries
+    
+    async def finalize_protocol(self, yadisk_helper, footer: str) -> None:
+        """
+        Записывает оставшиеся готовые записи и завершающий блок одной загрузкой
+        
+        Затем рядом с протоколом загружается структурированный протокол (JSONL).
+        Если запись не удалась, записи остаются в очереди сессии и завершение
+        можно повторить: уже записанный завершающий блок повторно не пишется.
+        """
+        async with self._write_lock:
+            if not self.footer_written:
+                ready = self._take_ready_entries()
+                text = "".join(f"{entry.text}\n" for entry in ready if entry.text)
+                await self._write_protocol(yadisk_helper, text + footer)
+                self.footer_written = True
+                del self.pending_entries[:len(ready)]
+                await self._record_entries(ready)
+            if self.segmented:
+                await self._finish_segments(yadisk_helper)
+            await self._upload_sidecar(yadisk_helper)
+    
+    def get_duration(self) -> str:
+        """Возвращает продолжительность встречи в виде 'Xч Yм Zс'"""
+        hours, remainder = divmod(int(time.time() - self.start_time), 3600)
+        minutes, seconds = divmod(remainder, 60)
+        return f"{hours}ч {minutes}м {seconds}с"
+    
+    def get_session_summary(self) -> str:
+        """Возвращает сводку по сессии"""
         summary = [
             f"📁 Папка: {self.folder_path}",
             f"📄 Файл: {self.get_txt_filename()}",
-            f"⏱ Продолжительность: {hours}ч {minutes}м {seconds}с",
-            f"✍️ Количество записей: {total_messages}"
+            f"⏱ Продолжительность: {self.get_duration()}",
+            f"✍️ Количество записей: {len(self.messages)}"
         ]
         
         return "\n".join(summary)
@@ -0,0 +1,104 @@
+import json
+import logging
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional
+import speech_recognition as sr
+
+from config.config import SPEECH_ENGINE, VOSK_MODEL_PATH
+
+logger = logging.getLogger(__name__)
+
+class SpeechEngine(ABC):
+    """
+    Базовый класс движка распознавания речи
+
+    Движок получает PCM (моно, 16 бит, sample_rate) и возвращает текст или None,
+    если речь не распознана. Ошибки сервиса или модели передаются вызывающему коду.
+    Методы синхронные: SpeechRecognizer вызывает их в пуле потоков, поэтому
+    реализация должна быть потокобезопасной. Движок без recognize() нельзя создать.
+    """
+    name = "base"
+    sample_rate = 16000
+
+    @abstractmethod
+    def recognize(self, pcm: bytes, language: str) -> Optional[str]:
+        """Распознает один фрагмент аудио"""
+
+    def recognize_batch(self, chunks: List[bytes], language: str) -> List[Optional[str]]:
+        """Распознает несколько фрагментов аудио; по умолчанию - по одному"""
+        return [self.recognize(chunk, language) for chunk in chunks]
+
+    def capabilities(self) -> Dict[str, Any]:
+        """Возвращает возможности движка"""
+        return {"offline": False, "batch": False, "sample_rate": self.sample_rate}
+
+class GoogleSpeechEngine(SpeechEngine):
+    """Распознавание через Google Web Speech API (требуется доступ в интернет)"""
+    name = "google"
+
+    def __init__(self):
+        self.recognizer = sr.Recognizer()
+
+    def recognize(self, pcm: bytes, language: str) -> Optional[str]:
+        audio_data = sr.AudioData(pcm, self.sample_rate, 2)
+        try:
+            return self.recognizer.recognize_google(audio_data, language=language)
+        except sr.UnknownValueError:
+            return None
+
+class VoskSpeechEngine(SpeechEngine):
+    """
+    Локальное распознавание на CPU с помощью Vosk
+
+    Модель загружается один раз при создании движка и используется всеми потоками;
+    для каждого фрагмента создается свой KaldiRecognizer. Язык определяется моделью.
+    """
+    name = "vosk"
+
+    def __init__(self, model_path: str = VOSK_MODEL_PATH):
+        try:
+            import vosk
+        except ImportError:
+            raise RuntimeError("Для SPEECH_ENGINE=vosk необходимо установить пакет vosk (pip install vosk)")
+        if not model_path:
+            raise RuntimeError("Для SPEECH_ENGINE=vosk необходимо задать VOSK_MODEL_PATH")
+
+        vosk.SetLogLevel(-1)
+        logger.info(f"Загрузка модели Vosk из {model_path}")
+        self._vosk = vosk
+        self.model = vosk.Model(model_path)
+
+    def recognize(self, pcm: bytes, language: str) -> Optional[str]:
+        recognizer = self._vosk.KaldiRecognizer(self.model, self.sample_rate)
+        recognizer.AcceptWaveform(pcm)
+        text = json.loads(recognizer.FinalResult()).get("text", "").strip()
+        return text or None
+
+    def capabilities(self) -> Dict[str, Any]:
+        return {"offline": True, "batch": False, "sample_rate": self.sample_rate}
+
+# Ключ: имя движка, Значение: класс движка
+ENGINES = {
+    GoogleSpeechEngine.name: GoogleSpeechEngine,
+    VoskSpeechEngine.name: VoskSpeechEngine,
+}
+
+_engines: Dict[str, SpeechEngine] = {}
+_engines_lock = threading.Lock()
+
+def get_engine(name: str = SPEECH_ENGINE) -> SpeechEngine:
+    """
+    Возвращает движок распознавания по имени
+
+    Движок (и его модель) создается один раз на процесс и используется повторно.
+    """
+    with _engines_lock:
+        engine = _engines.get(name)
+        if engine is None:
+            engine_class = ENGINES.get(name)
+            if engine_class is None:
+                raise ValueError(f"Неизвестный движок распознавания речи: {name}. Допустимые значения: {', '.join(ENGINES)}")
+            engine = _engines[name] = engine_class()
+            logger.info(f"Движок распознавания речи: {name} {engine.capabilities()}")
+        return engine
@@ -1,47 +1,228 @@
+import asyncio
 import logging
-import os
-import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+import numpy as np
 import speech_recognition as sr
 from pydub import AudioSegment
 
+from config.config import (
+    SPEECH_ENGINE, SPEECH_CONVERT_WORKERS, SPEECH_RECOGNITION_WORKERS, SPEECH_QUEUE_SIZE,
+    SPEECH_CHUNK_SECONDS, SPEECH_CHUNK_CONCURRENCY, TRANSCRIPTION_CACHE_SIZE
+)
+from src.utils.speech_engines import SpeechEngine, get_engine
+from src.utils.transcription_cache import TranscriptionCache, transcription_cache
+
 logger = logging.getLogger(__name__)
 
+# Формат PCM для распознавания: моно, 16 кГц, 16 бит
+SAMPLE_RATE = 16000
+SAMPLE_WIDTH = 2
+
+# Метка на месте фрагмента, который не удалось распознать
+UNRECOGNIZED_CHUNK = "[...]"
+
+def split_on_silence(pcm: bytes, max_chunk_seconds: float = SPEECH_CHUNK_SECONDS,
+                     sample_rate: int = SAMPLE_RATE, frame_ms: int = 20,
+                     smoothing_frames: int = 15) -> List[bytes]:
+    """
+    Делит PCM (моно, 16 бит) на фрагменты не длиннее max_chunk_seconds
+
+    Граница фрагмента ставится в самом тихом месте второй половины допустимого
+    окна (по сглаженной энергии кадров), поэтому разрезы приходятся на паузы
+    между фразами, а не на середину слова. Фрагмент должен вмещать хотя бы два
+    кадра, иначе разрезать негде.
+    """
+    samples = np.frombuffer(pcm, dtype=np.int16)
+    max_samples = int(max_chunk_seconds * sample_rate)
+    if len(samples) <= max_samples:
+        return [pcm]
+
+    frame_len = sample_rate * frame_ms // 1000
+    max_frames = max_samples // frame_len
+    if max_frames < 2:
+        raise ValueError(f"Длина фрагмента {max_chunk_seconds} с меньше двух кадров по {frame_ms} мс")
+    min_frames = max_frames // 2
+
+    # Энергия кадров, сглаженная скользящим средним
+    frame_count = len(samples) // frame_len
+    frames = samples[:frame_count * frame_len].astype(np.float32).reshape(frame_count, frame_len)
+    energy = np.sqrt(np.mean(frames ** 2, axis=1))
+    smoothing = min(smoothing_frames, frame_count)
+    energy = np.convolve(energy, np.ones(smoothing) / smoothing, mode="same")
+
+    cuts = []
+    start = 0
+    # Условие по отсчетам, а не по кадрам: последний фрагмент включает и неполный кадр
+    while len(samples) - start * frame_len > max_samples:
+        # При одинаково тихих местах берем самое позднее, чтобы фрагментов было меньше
+        window = energy[start + min_frames:start + max_frames][::-1]
+        cut = start + max_frames - 1 - int(np.argmin(window))
+        cuts.append(cut * frame_len)
+        start = cut
+
+    bounds = [0] + cuts + [len(samples)]
+    return [samples[begin:end].tobytes() for begin, end in zip(bounds, bounds[1:])]
+
 class SpeechRecognizer:
-    """Класс для распознавания речи из голосовых сообщений"""
-    def __init__(self, language="ru-RU"):
+    """
+    Класс для распознавания речи из голосовых сообщений
+
+    Аудио декодируется ffmpeg в отдельном процессе сразу в PCM нужного формата
+    (моно, 16 кГц) без временных файлов, распознавание выполняется движком
+    (SPEECH_ENGINE) в пуле потоков, поэтому event loop бота не блокируется.
+    Длинные сообщения делятся по паузам на фрагменты, которые распознаются
+    параллельно (не более chunk_concurrency на сообщение) и склеиваются по порядку.
+    Результаты кэшируются по file_unique_id: повторное сообщение не декодируется
+    и не распознается. Одновременно в обработке
+    находится не более queue_size сообщений: остальные ждут освобождения места.
+    """
+    def __init__(self, language="ru-RU", engine_name: str = SPEECH_ENGINE, convert_workers: int = SPEECH_CONVERT_WORKERS,
+                 recognition_workers: int = SPEECH_RECOGNITION_WORKERS, queue_size: int = SPEECH_QUEUE_SIZE,
+                 chunk_seconds: float = SPEECH_CHUNK_SECONDS, chunk_concurrency: int = SPEECH_CHUNK_CONCURRENCY,
+                 cache: Optional[TranscriptionCache] = transcription_cache if TRANSCRIPTION_CACHE_SIZE > 0 else None):
         """Инициализация распознавателя речи с указанным языком"""
-        self.recognizer = sr.Recognizer()
         self.language = language
-    
-    async def recognize_voice(self, voice_file_path):
+        self.engine_name = engine_name
+        self.engine: Optional[SpeechEngine] = None
+        self.convert_workers = convert_workers
+        self.recognition_workers = recognition_workers
+        self.queue_size = queue_size
+        self.chunk_seconds = chunk_seconds
+        self.chunk_concurrency = chunk_concurrency
+        self.cache = cache
+        # Пул потоков и ограничители создаются при первом использовании
+        self._thread_pool: Optional[ThreadPoolExecutor] = None
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._convert_slots: Optional[asyncio.Semaphore] = None
+        self._active = 0
+        self._waiting = 0
+
+    def _get_pool(self) -> ThreadPoolExecutor:
+        if self._thread_pool is None:
+            self._thread_pool = ThreadPoolExecutor(
+                max_workers=self.recognition_workers,
+                thread_name_prefix="speech"
+            )
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.queue_size)
+            self._convert_slots = asyncio.Semaphore(self.convert_workers)
+        return self._thread_pool
+
+    async def decode_to_pcm(self, voice_file_path: str) -> bytes:
+        """
+        Декодирует аудиофайл в PCM (моно, 16 кГц, 16 бит)
+
+        Декодирование, сведение каналов и передискретизация выполняются ffmpeg
+        за один проход, результат читается из stdout без записи на диск.
+        """
+        async with self._convert_slots:
+            process = await asyncio.create_subprocess_exec(
+                AudioSegment.converter, "-nostdin", "-loglevel", "error",
+                "-i", voice_file_path,
+                "-ac", "1", "-ar", str(SAMPLE_RATE), "-f", "s16le", "-",
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+            try:
+                pcm, stderr = await process.communicate()
+            except asyncio.CancelledError:
+                # Не оставляем ffmpeg работать после отмены обработки
+                process.kill()
+                raise
+        if process.returncode != 0:
+            raise RuntimeError(f"ffmpeg завершился с кодом {process.returncode}: {stderr.decode(errors='replace').strip()}")
+        return pcm
+
+    async def get_engine(self) -> SpeechEngine:
+        """Возвращает движок распознавания, загружая модель в пуле потоков при первом обращении"""
+        if self.engine is None:
+            loop = asyncio.get_running_loop()
+            self.engine = await loop.run_in_executor(self._get_pool(), get_engine, self.engine_name)
+        return self.engine
+
+    async def _recognize_chunks(self, engine: SpeechEngine, chunks: List[bytes]) -> List[Optional[str]]:
+        """Распознает фрагменты параллельно; для фрагмента с ошибкой возвращает None"""
+        loop = asyncio.get_running_loop()
+        thread_pool = self._get_pool()
+
+        if engine.capabilities().get("batch"):
+            # Движок сам распознает пакет эффективнее, чем по одному фрагменту
+            return await loop.run_in_executor(thread_pool, engine.recognize_batch, chunks, self.language)
+
+        semaphore = asyncio.Semaphore(self.chunk_concurrency)
+
+        async def recognize_chunk(index: int, chunk: bytes) -> Optional[str]:
+            async with semaphore:
+                try:
+                    return await loop.run_in_executor(thread_pool, engine.recognize, chunk, self.language)
+                except Exception as e:
+                    logger.warning(f"Не удалось распознать фрагмент {index + 1} из {len(chunks)}: {e}")
+                    return None
+
+        return await asyncio.gather(*(recognize_chunk(i, chunk) for i, chunk in enumerate(chunks)))
+
+    async def recognize_voice(self, voice_file_path, file_unique_id: Optional[str] = None):
         """
         Распознает речь из голосового файла
-        
+
         Args:
             voice_file_path: Путь к голосовому файлу (обычно ogg для Telegram)
-        
+            file_unique_id: Постоянный идентификатор файла в Telegram для кэширования результата
+
         Returns:
-            str: Распознанный текст или None в случае ошибки
+            str: Распознанный текст (нераспознанные фрагменты отмечены как [...])
+                или None, если не удалось распознать ни одного фрагмента
         """
-        try:
-            # Создаем временный файл WAV
-            with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as wav_file:
-                wav_path = wav_file.name
-                
-            # Конвертируем OGG -> WAV
-            audio = AudioSegment.from_file(voice_file_path, format="ogg")
-            audio.export(wav_path, format="wav")
-            
-            # Распознаем речь
-            with sr.AudioFile(wav_path) as source:
-                audio_data = self.recognizer.record(source)
-                text = self.recognizer.recognize_google(audio_data, language=self.language)
-                logger.info(f"Голосовое сообщение успешно распознано: {text[:50]}...")
+        # Сообщение уже распознавалось: не декодируем и не распознаем повторно
+        if file_unique_id and self.cache:
+            text = await self.cache.get_async(file_unique_id, self.engine_name, self.language)
+            if text:
+                logger.info(f"Результат распознавания {file_unique_id} взят из кэша")
                 return text
-                
-        except sr.UnknownValueError:
-            logger.warning("Не удалось распознать речь из аудиофайла")
-            return None
+
+        thread_pool = self._get_pool()
+        loop = asyncio.get_running_loop()
+
+        if self._slots.locked():
+            logger.info(f"Очередь распознавания заполнена ({self.queue_size}), сообщение ожидает")
+        self._waiting += 1
+        try:
+            await self._slots.acquire()
+        finally:
+            self._waiting -= 1
+
+        self._active += 1
+        try:
+            # Декодируем OGG -> PCM
+            pcm = await self.decode_to_pcm(voice_file_path)
+            logger.debug(f"Голосовое сообщение декодировано: {len(pcm) / (SAMPLE_RATE * SAMPLE_WIDTH):.1f} с аудио")
+
+            engine = await self.get_engine()
+
+            # Короткие сообщения распознаем целиком: ошибка сервиса передается дальше как раньше
+            if len(pcm) <= self.chunk_seconds * SAMPLE_RATE * SAMPLE_WIDTH:
+                text = await loop.run_in_executor(thread_pool, engine.recognize, pcm, self.language)
+            else:
+                # Делим длинное сообщение по паузам и распознаем фрагменты параллельно
+                chunks = await loop.run_in_executor(thread_pool, split_on_silence, pcm, self.chunk_seconds)
+                results = await self._recognize_chunks(engine, chunks)
+                failed = sum(1 for result in results if not result)
+                if failed:
+                    logger.warning(f"Не распознано фрагментов: {failed} из {len(chunks)}")
+                text = None
+                if failed < len(results):
+                    text = " ".join(result or UNRECOGNIZED_CHUNK for result in results)
+
+            if not text:
+                logger.warning("Не удалось распознать речь из аудиофайла")
+                return None
+            logger.info(f"Голосовое сообщение успешно распознано: {text[:50]}...")
+            # Частичный результат не кэшируем: повторная отправка даст шанс распознать все
+            if file_unique_id and self.cache and UNRECOGNIZED_CHUNK not in text:
+                await self.cache.put_async(file_unique_id, self.engine_name, self.language, text)
+            return text
+
         except sr.RequestError as e:
             logger.error(f"Ошибка API распознавания речи: {e}")
             return None
@@ -49,19 +230,31 @@ class SpeechRecognizer:
             logger.error(f"Ошибка при распознавании речи: {e}", exc_info=True)
             return None
         finally:
-            # Очистка временных файлов
-            if 'wav_path' in locals() and os.path.exists(wav_path):
-                os.remove(wav_path)
+            self._active -= 1
+            self._slots.release()
+
+    def get_metrics(self) -> Dict[str, int]:
+        """Возвращает движок, количество сообщений в обработке и в ожидании и статистику кэша"""
+        return {"engine": self.engine_name, "active": self._active, "waiting": self._waiting,
+                "queue_size": self.queue_size, "cache": self.cache.get_metrics() if self.cache else None}
+
+    def shutdown(self) -> None:
+        """Останавливает пул потоков распознавания и закрывает кэш"""
+        if self._thread_pool is not None:
+            self._thread_pool.shutdown(wait=True, cancel_futures=True)
+            self._thread_pool = None
+        if self.cache:
+            self.cache.close()
 
     @staticmethod
     async def download_voice_message(file, dest_path):
         """
         Загружает голосовое сообщение в локальный файл
-        
+
         Args:
             file: Объект File из Telegram
             dest_path: Путь для сохранения файла
-        
+
         Returns:
             str: Путь к сохраненному файлу или None в случае ошибки
         """
@@ -72,4 +265,4 @@ class SpeechRecognizer:
             return dest_path
         except Exception as e:
             logger.error(f"Ошибка при загрузке голосового сообщения: {e}", exc_info=True)
-            return None 
\ No newline at end of file
+            return None
@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from functools import partial
+from pathlib import Path
+from typing import Dict, Optional
+
+from config.config import TRANSCRIPTION_CACHE_FILE, TRANSCRIPTION_CACHE_SIZE
+
+logger = logging.getLogger(__name__)
+
+class TranscriptionCache:
+    """
+    Постоянный кэш результатов распознавания речи (SQLite)
+
+    Ключ - file_unique_id голосового сообщения, движок и язык: пересланное или
+    повторно отправленное сообщение не распознается заново. Хранится не более
+    max_entries записей, при переполнении удаляются давно не использованные.
+    """
+    def __init__(self, db_path: Path = TRANSCRIPTION_CACHE_FILE, max_entries: int = TRANSCRIPTION_CACHE_SIZE):
+        self.db_path = Path(db_path)
+        self.max_entries = max_entries
+        self._conn: Optional[sqlite3.Connection] = None
+        # Соединение используется из пула потоков, поэтому обращения сериализуем
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS transcriptions (
+                    file_unique_id TEXT NOT NULL,
+                    engine TEXT NOT NULL,
+                    language TEXT NOT NULL,
+                    text TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (file_unique_id, engine, language)
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_transcriptions_last_used ON transcriptions (last_used)")
+            self._conn.commit()
+        return self._conn
+
+    def get(self, file_unique_id: str, engine: str, language: str) -> Optional[str]:
+        """Возвращает сохраненный текст или None"""
+        with self._lock:
+            conn = self._connect()
+            key = (file_unique_id, engine, language)
+            row = conn.execute(
+                "SELECT text FROM transcriptions WHERE file_unique_id = ? AND engine = ? AND language = ?", key
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            conn.execute(
+                "UPDATE transcriptions SET last_used = ?, hits = hits + 1 "
+                "WHERE file_unique_id = ? AND engine = ? AND language = ?", (time.time(),) + key
+            )
+            conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, file_unique_id: str, engine: str, language: str, text: str) -> None:
+        """Сохраняет текст и удаляет лишние записи"""
+        with self._lock:
+            conn = self._connect()
+            now = time.time()
+            conn.execute(
+                "INSERT OR REPLACE INTO transcriptions (file_unique_id, engine, language, text, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)", (file_unique_id, engine, language, text, now, now)
+            )
+            conn.execute(
+                "DELETE FROM transcriptions WHERE rowid IN ("
+                "SELECT rowid FROM transcriptions ORDER BY last_used DESC LIMIT -1 OFFSET ?)", (self.max_entries,)
+            )
+            conn.commit()
+
+    async def get_async(self, file_unique_id: str, engine: str, language: str) -> Optional[str]:
+        """Асинхронно возвращает сохраненный текст; ошибки кэша не прерывают распознавание"""
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, partial(self.get, file_unique_id, engine, language))
+        except Exception as e:
+            logger.error(f"Ошибка чтения кэша распознавания: {e}", exc_info=True)
+            return None
+
+    async def put_async(self, file_unique_id: str, engine: str, language: str, text: str) -> None:
+        """Асинхронно сохраняет текст; ошибки кэша только записываются в лог"""
+        try:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, partial(self.put, file_unique_id, engine, language, text))
+        except Exception as e:
+            logger.error(f"Ошибка записи в кэш распознавания: {e}", exc_info=True)
+
+    def get_metrics(self) -> Dict[str, int]:
+        """Возвращает количество попаданий, промахов и записей в кэше"""
+        size = 0
+        if self._conn is not None:
+            with self._lock:
+                size = self._conn.execute("SELECT COUNT(*) FROM transcriptions").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "size": size, "max_entries": self.max_entries}
+
+    def close(self) -> None:
+        """Закрывает соединение с базой"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+# Создаем глобальный кэш распознавания
+transcription_cache = TranscriptionCache()
@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import posixpath
+import sqlite3
+import threading
+import time
+from functools import partial
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import yadisk
+
+from config.config import UPLOAD_INDEX_FILE
+
+logger = logging.getLogger(__name__)
+
+class UploadIndex:
+    """
+    Индекс файлов, уже загруженных из Telegram на Яндекс.Диск (SQLite)
+
+    Ключ - file_unique_id и размер файла, значение - пути на Яндекс.Диске, куда файл
+    был записан. Позволяет не скачивать и не загружать повторно одинаковые файлы.
+    """
+    def __init__(self, db_path: Path = UPLOAD_INDEX_FILE):
+        self.db_path = Path(db_path)
+        self._conn: Optional[sqlite3.Connection] = None
+        # Соединение используется из пула потоков, поэтому обращения сериализуем
+        self._lock = threading.Lock()
+        self.stats = {"same_folder_hits": 0, "copies": 0, "uploads": 0, "bytes_saved": 0}
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS uploads (
+                    file_unique_id TEXT NOT NULL,
+                    file_size INTEGER NOT NULL,
+                    remote_path TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (file_unique_id, remote_path)
+                )
+            """)
+            self._conn.commit()
+        return self._conn
+
+    def find(self, file_unique_id: str, file_size: int) -> List[str]:
+        """Возвращает пути на Яндекс.Диске, куда уже был загружен файл (новые первыми)"""
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT remote_path FROM uploads WHERE file_unique_id = ? AND file_size = ? ORDER BY created_at DESC",
+                (file_unique_id, file_size)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def add(self, file_unique_id: str, file_size: int, remote_path: str) -> None:
+        """Запоминает путь, куда был записан файл"""
+        with self._lock:
+            conn = self._connect()
+            conn.execute(
+                "INSERT OR REPLACE INTO uploads (file_unique_id, file_size, remote_path, created_at) VALUES (?, ?, ?, ?)",
+                (file_unique_id, file_size, remote_path, time.time())
+            )
+            conn.commit()
+
+    def remove(self, remote_path: str) -> None:
+        """Удаляет путь из индекса (файл удален или перемещен на Яндекс.Диске)"""
+        with self._lock:
+            conn = self._connect()
+            conn.execute("DELETE FROM uploads WHERE remote_path = ?", (remote_path,))
+            conn.commit()
+
+    async def _run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, partial(func, *args))
+
+    async def save_file(self, file_unique_id: str, file_size: Optional[int], target_path: str,
+                        yadisk_helper, transfer) -> str:
+        """
+        Сохраняет файл на Яндекс.Диск, по возможности без повторной передачи
+
+        Если файл уже есть в той же папке, возвращается путь к существующему файлу.
+        Если файл есть в другой папке, он копируется на стороне Яндекс.Диска.
+        Иначе вызывается transfer() - скачивание из Telegram и загрузка на Диск;
+        transfer() может вернуть путь к уже существующему файлу с тем же содержимым.
+        Ошибки индекса не прерывают сохранение: файл просто передается заново.
+
+        Args:
+            file_unique_id: Постоянный идентификатор файла в Telegram
+            file_size: Размер файла в байтах
+            target_path: Путь на Яндекс.Диске для нового файла
+            yadisk_helper: Помощник для работы с Яндекс.Диском
+            transfer: Корутина-функция, загружающая файл в target_path (возвращает None)
+                или возвращающая путь к существующему файлу
+
+        Returns:
+            str: Путь к файлу на Яндекс.Диске
+        """
+        size = file_size or 0
+        try:
+            known_paths = await self._run(self.find, file_unique_id, size) if size else []
+        except Exception as e:
+            logger.error(f"Ошибка чтения индекса загруженных файлов: {e}", exc_info=True)
+            known_paths = []
+
+        target_folder = posixpath.dirname(target_path)
+        # Сначала проверяем файлы в той же папке, затем в остальных
+        known_paths.sort(key=lambda path: posixpath.dirname(path) != target_folder)
+
+        for path in known_paths:
+            try:
+                if posixpath.dirname(path) == target_folder:
+                    if await yadisk_helper.exists_async(path):
+                        self.stats["same_folder_hits"] += 1
+                        self.stats["bytes_saved"] += size
+                        logger.info(f"Файл {file_unique_id} уже загружен в {path}, сэкономлено {size} байт")
+                        return path
+                else:
+                    await yadisk_helper.copy_file_async(path, target_path)
+                    self.stats["copies"] += 1
+                    self.stats["bytes_saved"] += size
+                    logger.info(f"Файл {file_unique_id} скопирован на Яндекс.Диске из {path} в {target_path}, "
+                                f"сэкономлено {size} байт")
+                    await self._run(self.add, file_unique_id, size, target_path)
+                    return target_path
+            except yadisk.exceptions.PathNotFoundError:
+                logger.info(f"Ранее загруженный файл {path} не найден на Яндекс.Диске")
+            except Exception as e:
+                # Временная ошибка: файл, возможно, на месте, поэтому путь остается в индексе
+                logger.warning(f"Не удалось использовать ранее загруженный файл {path}: {e}")
+                continue
+            # Файла больше нет: забываем путь
+            try:
+                await self._run(self.remove, path)
+            except Exception as e:
+                logger.error(f"Ошибка обновления индекса загруженных файлов: {e}", exc_info=True)
+
+        saved_path = await transfer() or target_path
+        if saved_path == target_path:
+            self.stats["uploads"] += 1
+        if size:
+            try:
+                await self._run(self.add, file_unique_id, size, saved_path)
+            except Exception as e:
+                logger.error(f"Ошибка записи в индекс загруженных файлов: {e}", exc_info=True)
+        return saved_path
+
+    def get_metrics(self) -> Dict[str, int]:
+        """Возвращает статистику повторного использования файлов"""
+        return dict(self.stats)
+
+    def close(self) -> None:
+        """Закрывает соединение с базой"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+# Создаем глобальный индекс загруженных файлов
+upload_index = UploadIndex()
@@ -0,0 +1,170 @@
+import asyncio
+import hmac
+import json
+import logging
+import signal
+from http import HTTPStatus
+import tornado.web
+from tornado.httpserver import HTTPServer
+from telegram import Update
+from telegram.ext import Application
+
+from config.config import (
+    WEBHOOK_URL, WEBHOOK_PATH, WEBHOOK_SECRET, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_MAX_CONNECTIONS
+)
+from src.utils.concurrency_utils import loop_lag_monitor
+from src.utils.job_scheduler import job_scheduler
+from src.utils.upload_index import upload_index
+from src.utils.content_index import folder_hash_index
+from src.handlers.media_handlers.voice_handler import speech_recognizer
+from src.handlers.media_handlers.transfer import transfer_stats
+
+logger = logging.getLogger(__name__)
+
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+class TelegramUpdateHandler(tornado.web.RequestHandler):
+    """Принимает обновления от Telegram и передает их в очередь приложения"""
+    def initialize(self, bot_application: Application, secret_token: str) -> None:
+        self.bot_application = bot_application
+        self.secret_token = secret_token
+
+    async def post(self) -> None:
+        # Проверяем секретный токен, который Telegram передает в заголовке
+        token = self.request.headers.get(SECRET_TOKEN_HEADER, "")
+        if not hmac.compare_digest(token.encode(), self.secret_token.encode()):
+            logger.warning(f"Отклонен запрос с неверным секретным токеном от {self.request.remote_ip}")
+            raise tornado.web.HTTPError(HTTPStatus.FORBIDDEN)
+
+        if self.request.headers.get("Content-Type", "").split(";")[0].strip() != "application/json":
+            raise tornado.web.HTTPError(HTTPStatus.UNSUPPORTED_MEDIA_TYPE)
+
+        try:
+            data = json.loads(self.request.body)
+            update = Update.de_json(data, self.bot_application.bot)
+        except Exception as e:
+            logger.error(f"Не удалось разобрать обновление из webhook: {e}", exc_info=True)
+            raise tornado.web.HTTPError(HTTPStatus.BAD_REQUEST)
+
+        if update:
+            await self.bot_application.update_queue.put(update)
+        self.set_status(HTTPStatus.OK)
+
+class HealthHandler(tornado.web.RequestHandler):
+    """Проверка работоспособности процесса (liveness)"""
+    def get(self) -> None:
+        self.write({"status": "ok"})
+
+class ReadinessHandler(tornado.web.RequestHandler):
+    """Проверка готовности принимать обновления (readiness)"""
+    def initialize(self, server: "WebhookServer") -> None:
+        self.server = server
+
+    def get(self) -> None:
+        ready = self.server.is_ready()
+        self.set_status(HTTPStatus.OK if ready else HTTPStatus.SERVICE_UNAVAILABLE)
+        self.write({
+            "status": "ready" if ready else "not_ready",
+            "pending_updates": self.server.application.update_queue.qsize()
+        })
+
+class MetricsHandler(tornado.web.RequestHandler):
+    """Статистика очереди исходящих сообщений, задач обработки, повторного использования файлов, распознавания речи и задержки event loop"""
+    def initialize(self, server: "WebhookServer") -> None:
+        self.server = server
+
+    def get(self) -> None:
+        rate_limiter = self.server.application.bot.rate_limiter
+        self.write({
+            "pending_updates": self.server.application.update_queue.qsize(),
+            "outbound": rate_limiter.get_metrics() if hasattr(rate_limiter, "get_metrics") else {},
+            "jobs": job_scheduler.get_metrics(),
+            "dedup": upload_index.get_metrics(),
+            "content_dedup": folder_hash_index.get_metrics(),
+            "transfer": dict(transfer_stats),
+            "speech": speech_recognizer.get_metrics(),
+            "event_loop": loop_lag_monitor.get_metrics()
+        })
+
+class WebhookServer:
+    """Встроенный HTTP-сервер для приема обновлений Telegram в режиме webhook"""
+    def __init__(self, application: Application, listen: str = WEBHOOK_LISTEN, port: int = WEBHOOK_PORT,
+                 url_path: str = WEBHOOK_PATH, secret_token: str = WEBHOOK_SECRET):
+        self.application = application
+        self.listen = listen
+        self.port = port
+        self.url_path = url_path
+        self.secret_token = secret_token
+        self.webhook_registered = False
+        self._http_server = None
+
+    def is_ready(self) -> bool:
+        """Сервер готов, если приложение запущено и webhook зарегистрирован в Telegram"""
+        return self.webhook_registered and self.application.running
+
+    def _make_app(self) -> tornado.web.Application:
+        return tornado.web.Application([
+            (self.url_path, TelegramUpdateHandler,
+             {"bot_application": self.application, "secret_token": self.secret_token}),
+            (r"/healthz", HealthHandler),
+            (r"/readyz", ReadinessHandler, {"server": self}),
+            (r"/metrics", MetricsHandler, {"server": self}),
+        ])
+
+    def start(self) -> None:
+        """Запускает HTTP-сервер"""
+        self._http_server = HTTPServer(self._make_app(), xheaders=True)
+        self._http_server.listen(self.port, self.listen)
+        logger.info(f"HTTP-сервер webhook запущен на {self.listen}:{self.port}, путь {self.url_path}")
+
+    async def register_webhook(self, webhook_url: str = WEBHOOK_URL,
+                               max_connections: int = WEBHOOK_MAX_CONNECTIONS) -> None:
+        """Регистрирует webhook в Telegram"""
+        await self.application.bot.set_webhook(
+            url=f"{webhook_url}{self.url_path}",
+            secret_token=self.secret_token,
+            allowed_updates=Update.ALL_TYPES,
+            max_connections=max_connections
+        )
+        self.webhook_registered = True
+        logger.info(f"Webhook зарегистрирован: {webhook_url}{self.url_path}")
+
+    async def stop(self) -> None:
+        """Останавливает HTTP-сервер, дожидаясь завершения текущих запросов"""
+        self.webhook_registered = False
+        if self._http_server:
+            self._http_server.stop()
+            await self._http_server.close_all_connections()
+            self._http_server = None
+            logger.info("HTTP-сервер webhook остановлен")
+
+async def run_webhook(application: Application) -> None:
+    """
+    Запускает бота в режиме webhook и работает до получения сигнала остановки
+
+    Webhook не удаляется при остановке, чтобы несколько экземпляров бота
+    за балансировщиком могли перезапускаться независимо друг от друга.
+    """
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:
+            # Windows не поддерживает обработчики сигналов в event loop
+            pass
+
+    server = WebhookServer(application)
+    async with application:
+        await application.start()
+        server.start()
+        try:
+            await server.register_webhook()
+            logger.info("Бот запущен в режиме webhook")
+            await stop_event.wait()
+        finally:
+            await server.stop()
+            await application.stop()
+            # run_webhook заменяет Application.run_webhook, поэтому post_stop вызываем сами
+            if application.post_stop:
+                await application.post_stop(application)
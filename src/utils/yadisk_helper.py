@@ -1,3 +1,4 @@
+import io
 import logging
 import os
 import time
@@ -9,10 +10,45 @@ from typing import List, Any
 
 logger = logging.getLogger(__name__)
 
+class _ProgressFile:
+    """
+    Обертка файла для потоковой загрузки, сообщающая о количестве отправленных байт
+    
+    Колбэк вызывается не чаще, чем раз на процент файла.
+    """
+    def __init__(self, file, callback):
+        self.file = file
+        self.callback = callback
+        self.total = os.fstat(file.fileno()).st_size
+        self.sent = 0
+        self._step = max(self.total // 100, 1)
+        self._reported = -1
+    
+    def read(self, size=-1):
+        data = self.file.read(size)
+        self.sent += len(data)
+        if self.sent // self._step != self._reported or self.sent == self.total:
+            self._reported = self.sent // self._step
+            self.callback(self.sent, self.total)
+        return data
+    
+    def seek(self, offset, whence=os.SEEK_SET):
+        # Повторная попытка начинается с начала файла
+        position = self.file.seek(offset, whence)
+        self.sent = position
+        return position
+    
+    def tell(self):
+        return self.file.tell()
+    
+    def __len__(self):
+        return self.total
+
 class YaDiskHelper:
     """Класс для работы с API Яндекс.Диска"""
-    def __init__(self):
-        self.disk = yadisk.YaDisk(token=YANDEX_DISK_TOKEN)
+    def __init__(self, disk=None):
+        # disk - клиент с интерфейсом yadisk (например, локальная замена в тестах)
+        self.disk = disk or yadisk.YaDisk(token=YANDEX_DISK_TOKEN)
         self._check_connection()
     
     def _check_connection(self):
@@ -26,31 +62,105 @@ class YaDiskHelper:
             logger.error(f"Ошибка соединения с Яндекс.Диском: {e}", exc_info=True)
             raise
     
-    def upload_file(self, local_path, remote_path, retry_count=3, retry_delay=2):
-        """Загружает файл на Яндекс.Диск с повторными попытками при ошибке"""
+    def upload_file(self, local_path, remote_path, retry_count=3, retry_delay=2, progress_callback=None):
+        """
+        Загружает файл на Яндекс.Диск с повторными попытками при ошибке
+        
+        Файл передается потоком; progress_callback(отправлено, всего) вызывается
+        из рабочего потока по мере отправки. API Яндекс.Диска не поддерживает
+        дозагрузку, поэтому повторная попытка начинается с начала файла;
+        пауза между попытками растет вдвое.
+        """
         for attempt in range(retry_count):
             try:
                 # Проверяем существование директории
                 self._ensure_directory_exists(os.path.dirname(remote_path))
                 
-                # Загружаем файл
-                self.disk.upload(local_path, remote_path, overwrite=True)
+                # Загружаем файл (повторные попытки выполняем сами, а не внутри yadisk)
+                with open(local_path, "rb") as file:
+                    source = _ProgressFile(file, progress_callback) if progress_callback else file
+                    self.disk.upload(source, remote_path, overwrite=True, n_retries=0)
                 logger.info(f"Файл успешно загружен: {remote_path}")
                 return True
             except Exception as e:
                 logger.warning(f"Попытка {attempt+1}/{retry_count} загрузки файла не удалась: {e}")
                 if attempt < retry_count - 1:
-                    time.sleep(retry_delay)
+                    time.sleep(retry_delay * 2 ** attempt)
                 else:
                     logger.error(f"Не удалось загрузить файл после {retry_count} попыток: {e}", exc_info=True)
                     raise
     
-    async def upload_file_async(self, local_path, remote_path, retry_count=3, retry_delay=2):
-        """Асинхронно загружает файл на Яндекс.Диск"""
+    async def upload_file_async(self, local_path, remote_path, retry_count=3, retry_delay=2, progress_callback=None):
+        """
+        Асинхронно загружает файл на Яндекс.Диск
+        
+        progress_callback(отправлено, всего) вызывается в цикле событий.
+        """
         loop = asyncio.get_event_loop()
-        upload_func = partial(self.upload_file, local_path, remote_path, retry_count, retry_delay)
+        if progress_callback:
+            callback = progress_callback
+            progress_callback = lambda sent, total: loop.call_soon_threadsafe(callback, sent, total)
+        upload_func = partial(self.upload_file, local_path, remote_path, retry_count, retry_delay, progress_callback)
         return await loop.run_in_executor(None, upload_func)
     
+    def _wait_for_operation(self, href, description, poll_interval=0.5, max_poll_interval=5, poll_timeout=60):
+        """
+        Ожидает завершения асинхронной операции Яндекс.Диска
+        
+        Интервал опроса растет вдвое после каждой проверки (до max_poll_interval).
+        """
+        deadline = time.monotonic() + poll_timeout
+        while True:
+            status = self.disk.get_operation_status(href)
+            if status == "success":
+                return
+            if status == "failed":
+                raise RuntimeError(f"Яндекс.Диск не смог выполнить операцию: {description}")
+            if time.monotonic() + poll_interval > deadline:
+                raise TimeoutError(f"Операция не завершилась за {poll_timeout} с: {description}")
+            time.sleep(poll_interval)
+            poll_interval = min(poll_interval * 2, max_poll_interval)
+    
+    def copy_file(self, src_path, dst_path, poll_timeout=60):
+        """Копирует файл на стороне Яндекс.Диска (без передачи содержимого через бота)"""
+        self._ensure_directory_exists(os.path.dirname(dst_path))
+        result = self.disk.copy(src_path, dst_path, overwrite=True)
+        
+        # Большие файлы копируются асинхронно: дожидаемся завершения операции
+        if isinstance(result, yadisk.objects.OperationLinkObject):
+            self._wait_for_operation(result.href, f"копирование {src_path} в {dst_path}", poll_timeout=poll_timeout)
+        
+        logger.info(f"Файл скопирован на Яндекс.Диске: {src_path} -> {dst_path}")
+        return True
+    
+    async def copy_file_async(self, src_path, dst_path):
+        """Асинхронно копирует файл на стороне Яндекс.Диска"""
+        loop = asyncio.get_event_loop()
+        copy_func = partial(self.copy_file, src_path, dst_path)
+        return await loop.run_in_executor(None, copy_func)
+    
+    def upload_from_url(self, url, remote_path, poll_timeout=120):
+        """
+        Загружает файл на Яндекс.Диск по URL: Яндекс.Диск сам скачивает файл,
+        содержимое не проходит через сервер бота
+        """
+        self._ensure_directory_exists(os.path.dirname(remote_path))
+        operation = self.disk.upload_url(url, remote_path)
+        self._wait_for_operation(operation.href, f"загрузка по ссылке в {remote_path}", poll_timeout=poll_timeout)
+        logger.info(f"Файл загружен на Яндекс.Диск по ссылке: {remote_path}")
+        return True
+    
+    async def upload_from_url_async(self, url, remote_path, poll_timeout=120):
+        """Асинхронно загружает файл на Яндекс.Диск по URL"""
+        loop = asyncio.get_event_loop()
+        upload_func = partial(self.upload_from_url, url, remote_path, poll_timeout)
+        return await loop.run_in_executor(None, upload_func)
+    
+    async def exists_async(self, path):
+        """Асинхронно проверяет существование файла или папки на Яндекс.Диске"""
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, partial(self.disk.exists, path))
+    
     def _ensure_directory_exists(self, directory_path):
         """Проверяет существование директории и создает её при необходимости"""
         try:
@@ -144,6 +254,57 @@ class YaDiskHelper:
         append_func = partial(self.append_to_text_file, text, remote_path, retry_count, retry_delay)
         return await loop.run_in_executor(None, append_func)
     
+    def remove_path(self, path):
+        """Удаляет файл или папку на Яндекс.Диске"""
+        result = self.disk.remove(path, permanently=True)
+        # Папки удаляются асинхронно: дожидаемся завершения операции
+        if isinstance(result, yadisk.objects.OperationLinkObject):
+            self._wait_for_operation(result.href, f"удаление {path}")
+        logger.info(f"Удалено с Яндекс.Диска: {path}")
+        return True
+    
+    async def remove_path_async(self, path):
+        """Асинхронно удаляет файл или папку на Яндекс.Диске"""
+        loop = asyncio.get_event_loop()
+        remove_func = partial(self.remove_path, path)
+        return await loop.run_in_executor(None, remove_func)
+    
+    def list_items(self, path):
+        """Возвращает (путь, тип, дата изменения) для содержимого папки"""
+        items = self.disk.listdir(path, fields=["name", "path", "type", "modified"])
+        return [(item.path, item.type, item.modified.isoformat() if item.modified else "") for item in items]
+    
+    async def list_items_async(self, path):
+        """Асинхронно возвращает содержимое папки"""
+        loop = asyncio.get_event_loop()
+        list_func = partial(self.list_items, path)
+        return await loop.run_in_executor(None, list_func)
+    
+    def read_text_file(self, remote_path):
+        """Скачивает текстовый файл с Яндекс.Диска в память и возвращает его содержимое"""
+        buffer = io.BytesIO()
+        self.disk.download(remote_path, buffer)
+        return buffer.getvalue().decode("utf-8", errors="replace")
+    
+    async def read_text_file_async(self, remote_path):
+        """Асинхронно скачивает текстовый файл с Яндекс.Диска"""
+        loop = asyncio.get_event_loop()
+        read_func = partial(self.read_text_file, remote_path)
+        return await loop.run_in_executor(None, read_func)
+    
+    def list_file_hashes(self, path):
+        """Возвращает (путь, размер, md5, sha256) для файлов в папке"""
+        try:
+            items = self.disk.listdir(path, fields=["name", "path", "type", "size", "md5", "sha256"])
+            return [(item.path, item.size, item.md5, item.sha256) for item in items if item.type == "file"]
+        except yadisk.exceptions.PathNotFoundError:
+            return []
+    
+    async def list_file_hashes_async(self, path):
+        """Асинхронно возвращает хэши файлов в папке"""
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, partial(self.list_file_hashes, path))
+    
     def list_dirs(self, path="/"):
         """Возвращает список папок в указанном пути"""
         try:
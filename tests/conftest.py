@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# Корень репозитория в sys.path, чтобы тесты запускались и командой pytest
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,104 @@
+import shutil
+import threading
+import time
+import urllib.request
+from pathlib import Path
+from types import SimpleNamespace
+
+import yadisk
+
+class LocalDisk:
+    """
+    Локальная замена клиента yadisk для тестов и замеров
+
+    Файлы хранятся в папке root. Загрузка по ссылке (upload_url) выполняется
+    асинхронной операцией в отдельном потоке, как на Яндекс.Диске: статус операции
+    остается "in-progress", пока файл скачивается, затем становится "success"
+    или "failed". Количество проверок статуса сохраняется в status_polls.
+    Первые fail_uploads загрузок обрываются ошибкой соединения после двух частей файла.
+    """
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, root, fetch=None, operation_delay=0.0):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        # fetch(url) -> bytes; по умолчанию файл скачивается по HTTP
+        self.fetch = fetch or (lambda url: urllib.request.urlopen(url, timeout=10).read())
+        self.operation_delay = operation_delay
+        self.operations = {}
+        self.status_polls = 0
+        self.bytes_uploaded = 0
+        # Пути загруженных файлов в порядке загрузки
+        self.uploads = []
+        self.downloads = 0
+        self.fail_uploads = 0
+
+    def _local(self, path):
+        return self.root / path.replace("disk:", "").lstrip("/")
+
+    def check_token(self):
+        return True
+
+    def exists(self, path):
+        return self._local(path).exists()
+
+    def get_meta(self, path):
+        local = self._local(path)
+        if not local.exists():
+            raise yadisk.exceptions.PathNotFoundError(msg=path)
+        return SimpleNamespace(path=f"disk:{path}", type="dir" if local.is_dir() else "file")
+
+    def mkdir(self, path):
+        self._local(path).mkdir()
+
+    def upload(self, file, path, overwrite=True, n_retries=0):
+        self.uploads.append(path)
+        # Файл читается частями, как при потоковой загрузке
+        chunks = []
+        while True:
+            chunk = file.read(self.CHUNK_SIZE)
+            if chunk:
+                chunks.append(chunk)
+                self.bytes_uploaded += len(chunk)
+            if self.fail_uploads and (not chunk or len(chunks) >= 2):
+                # Соединение обрывается после нескольких отправленных частей
+                self.fail_uploads -= 1
+                raise ConnectionError(f"Обрыв соединения при загрузке {path}")
+            if not chunk:
+                break
+        self._local(path).write_bytes(b"".join(chunks))
+
+    def copy(self, src_path, dst_path, overwrite=True):
+        if not self.exists(src_path):
+            raise yadisk.exceptions.PathNotFoundError(msg=src_path)
+        shutil.copyfile(self._local(src_path), self._local(dst_path))
+
+    def upload_url(self, url, path):
+        href = f"local://operations/{len(self.operations) + 1}"
+        self.operations[href] = "in-progress"
+
+        def run():
+            time.sleep(self.operation_delay)
+            try:
+                self._local(path).write_bytes(self.fetch(url))
+                self.operations[href] = "success"
+            except Exception:
+                self.operations[href] = "failed"
+
+        threading.Thread(target=run, daemon=True).start()
+        return yadisk.objects.OperationLinkObject({"href": href, "method": "GET"})
+
+    def get_operation_status(self, href):
+        self.status_polls += 1
+        return self.operations[href]
+
+    def download(self, path, file):
+        self.downloads += 1
+        data = self.read(path)
+        if hasattr(file, "write"):
+            file.write(data)
+        else:
+            Path(file).write_bytes(data)
+
+    def read(self, path):
+        return self._local(path).read_bytes()
@@ -0,0 +1,100 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from src.utils import access_control as access_control_module
+from src.utils.access_control import AccessControl
+from src.utils.file_watcher import FileWatcher
+
+logger = logging.getLogger(__name__)
+
+@pytest.fixture
+def users_file(tmp_path, monkeypatch):
+    path = tmp_path / "allowed_users.json"
+    monkeypatch.setattr(access_control_module, "USERS_FILE", path)
+    return path
+
+def write_users(path, user_ids):
+    path.write_text(json.dumps([str(user_id) for user_id in user_ids]))
+
+def test_is_user_allowed_with_10k_users(users_file):
+    write_users(users_file, range(1, 10001))
+    control = AccessControl()
+    assert len(control.allowed_users) == 10000
+    assert control.is_user_allowed(1) and control.is_user_allowed(10000)
+    assert not control.is_user_allowed(10001)
+
+def test_empty_list_allows_everyone(users_file):
+    write_users(users_file, [])
+    assert AccessControl().is_user_allowed(12345)
+
+def test_reload_on_mtime_or_size_change(users_file):
+    write_users(users_file, [1, 2])
+    control = AccessControl()
+    watcher = FileWatcher()
+    watcher.watch(users_file, control.reload_users)
+    assert watcher.check() == 0
+
+    # Тот же размер файла, другое время изменения
+    stat = os.stat(users_file)
+    write_users(users_file, [1, 3])
+    os.utime(users_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert watcher.check() == 1
+    assert control.allowed_users == {1, 3}
+
+    # Другой размер файла, прежнее время изменения
+    stat = os.stat(users_file)
+    write_users(users_file, [1, 3, 40])
+    os.utime(users_file, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert watcher.check() == 1
+    assert control.allowed_users == {1, 3, 40}
+    assert watcher.check() == 0
+
+def test_broken_json_keeps_previous_list(users_file):
+    write_users(users_file, [1, 2])
+    control = AccessControl()
+    watcher = FileWatcher()
+    watcher.watch(users_file, control.reload_users)
+
+    # Файл сохранен наполовину
+    users_file.write_text('["1", "2", "3"')
+    assert watcher.check() == 1
+    assert control.allowed_users == {1, 2}
+    assert not control.is_user_allowed(3)
+
+def test_access_check_benchmark(users_file):
+    """Накладные расходы проверки доступа на одно обновление при 10 000 пользователей"""
+    write_users(users_file, range(1, 10001))
+    control = AccessControl()
+    updates = [SimpleNamespace(effective_user=SimpleNamespace(id=random.randrange(1, 20001), username="u",
+                                                              first_name="U"))
+               for _ in range(20000)]
+
+    async def check_all():
+        return [await control.check_access(update) for update in updates]
+
+    logging.getLogger(access_control_module.__name__).setLevel(logging.ERROR)
+    try:
+        started = time.perf_counter()
+        allowed = asyncio.run(check_all())
+        check_time = time.perf_counter() - started
+    finally:
+        logging.getLogger(access_control_module.__name__).setLevel(logging.NOTSET)
+
+    # Прежний способ: перебор списка ID
+    user_list = list(range(1, 10001))
+    started = time.perf_counter()
+    expected = [update.effective_user.id in user_list for update in updates]
+    scan_time = time.perf_counter() - started
+
+    per_update = check_time / len(updates) * 1e6
+    logger.info(f"Проверка доступа: {per_update:.2f} мкс на обновление "
+                f"(перебор списка: {scan_time / len(updates) * 1e6:.2f} мкс)")
+    assert allowed == expected
+    assert per_update < 100
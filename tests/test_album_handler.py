@@ -0,0 +1,151 @@
+import asyncio
+import itertools
+from types import SimpleNamespace
+
+import pytest
+
+from src.handlers.media_handlers import album_handler
+from src.handlers.media_handlers.album_handler import MediaGroupCollector
+from src.utils import message_utils
+from src.utils import session_utils
+from src.utils.concurrency_utils import background_tasks
+from src.utils.message_utils import MessageDeletionScheduler
+from src.utils.session_utils import SessionState, state_manager
+
+USER_ID = 464646
+
+class FakeBot:
+    def __init__(self):
+        self._ids = itertools.count(1)
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append(text)
+        return SimpleNamespace(chat_id=chat_id, message_id=next(self._ids), get_bot=lambda: self)
+
+    async def delete_messages(self, chat_id, message_ids):
+        pass
+
+class FakeMessage:
+    def __init__(self, bot, message_id, media_group_id="album-1"):
+        self.bot = bot
+        self.chat_id = USER_ID
+        self.message_id = message_id
+        self.media_group_id = media_group_id
+        self.photo = [SimpleNamespace(file_size=1024)]
+        self.document = None
+        self.replies = []
+
+    def get_bot(self):
+        return self.bot
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+
+class FakeDisk:
+    def __init__(self):
+        self.files = {}
+
+    async def create_text_file_async(self, text, path):
+        self.files[path] = text
+
+class FakeSearchIndex:
+    async def add_records_async(self, protocol_path, records):
+        pass
+
+@pytest.fixture
+def session(tmp_path, monkeypatch):
+    monkeypatch.setattr(session_utils, "search_index", FakeSearchIndex())
+    monkeypatch.setattr(message_utils, "deletion_scheduler", MessageDeletionScheduler())
+    session = SessionState("TD", "/TD/A", "A", USER_ID)
+    session.segmented = False
+    session.sidecar_file = tmp_path / "protocol.jsonl"
+    state_manager.set_session(USER_ID, session)
+    yield session
+    state_manager.clear_session(USER_ID)
+
+@pytest.fixture
+def saved(monkeypatch):
+    """Сохраненные файлы альбома: вместо загрузки на Яндекс.Диск запоминается message_id"""
+    saved = []
+
+    async def save_photo(message, session, yadisk_helper):
+        saved.append(message.message_id)
+        return f"{session.folder_path}/photo_{message.message_id}.jpg"
+
+    monkeypatch.setattr(album_handler, "save_photo", save_photo)
+    return saved
+
+def make_update(bot, message_id):
+    user = SimpleNamespace(id=USER_ID, username="tester", first_name="Test")
+    return SimpleNamespace(effective_user=user, message=FakeMessage(bot, message_id))
+
+def make_collector():
+    collector = MediaGroupCollector()
+    collector.COLLECT_WINDOW = 0.05
+    return collector
+
+def test_timer_restarts_with_each_file(session, saved):
+    async def scenario():
+        bot, disk, collector = FakeBot(), FakeDisk(), make_collector()
+        collector.add(make_update(bot, 1), disk)
+        await asyncio.sleep(0.03)
+        # Второй файл пришел до окончания окна: альбом ждет еще одно окно
+        collector.add(make_update(bot, 2), disk)
+        await asyncio.sleep(0.03)
+        processed_early = list(saved)
+        await background_tasks.wait_for(USER_ID)
+        await message_utils.deletion_scheduler.flush()
+        return processed_early
+
+    assert asyncio.run(scenario()) == []
+    assert sorted(saved) == [1, 2]
+
+def test_album_gets_one_protocol_entry(session, saved):
+    async def scenario():
+        bot, disk, collector = FakeBot(), FakeDisk(), make_collector()
+        updates = [make_update(bot, message_id) for message_id in (3, 1, 2)]
+        for update in updates:
+            collector.add(update, disk)
+        await background_tasks.wait_for(USER_ID)
+        await message_utils.deletion_scheduler.flush()
+        return disk.files[session.txt_file_path], updates
+
+    protocol, updates = asyncio.run(scenario())
+    assert protocol.count("Загружен альбом (3 файлов)") == 1
+    # Файлы перечислены в порядке сообщений
+    assert protocol.index("photo_1") < protocol.index("photo_2") < protocol.index("photo_3")
+    assert len(session.messages) == 1
+    assert session.pending_entries == []
+    # Один итоговый ответ на весь альбом
+    replies = [reply for update in updates for reply in update.message.replies]
+    assert replies == ["📷 Альбом успешно сохранен (3 файлов)!"]
+
+@pytest.mark.parametrize("failure", ["upload", "processing"])
+def test_failed_album_frees_reserved_entry(session, monkeypatch, failure):
+    async def failing_save(message, session, yadisk_helper):
+        raise ConnectionError("Яндекс.Диск недоступен")
+
+    async def failing_process(self, updates, session, entry, yadisk_helper):
+        raise RuntimeError("сбой обработки")
+
+    if failure == "upload":
+        monkeypatch.setattr(album_handler, "save_photo", failing_save)
+    else:
+        monkeypatch.setattr(MediaGroupCollector, "_process_group", failing_process)
+
+    async def scenario():
+        bot, disk, collector = FakeBot(), FakeDisk(), make_collector()
+        collector.add(make_update(bot, 1), disk)
+        # Сообщение после альбома ждет зарезервированную альбомом запись
+        later = session.reserve_entry()
+        session.complete_entry(later, "Текст после альбома")
+        assert not await session.write_entry(disk, later)
+        await background_tasks.wait_for(USER_ID)
+        await message_utils.deletion_scheduler.flush()
+        return disk.files.get(session.txt_file_path, "")
+
+    protocol = asyncio.run(scenario())
+    assert "Текст после альбома" in protocol
+    assert "Загружен альбом" not in protocol
+    assert session.pending_entries == []
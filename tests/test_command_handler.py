@@ -0,0 +1,87 @@
+import asyncio
+from types import SimpleNamespace
+
+from local_disk import LocalDisk
+from src.handlers import command_handler
+from src.utils import session_utils
+from src.utils import yadisk_helper as yadisk_helper_module
+from src.utils.session_utils import SessionState, state_manager
+from src.utils.yadisk_helper import YaDiskHelper
+
+class FakeDisk:
+    def __init__(self):
+        self.files = {}
+
+    async def create_text_file_async(self, text, path):
+        self.files[path] = text
+
+class FakeSearchIndex:
+    async def add_records_async(self, protocol_path, records):
+        pass
+
+class FakeMessage:
+    def __init__(self):
+        self.replies = []
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+
+def make_update(user_id):
+    user = SimpleNamespace(id=user_id, username="tester", first_name="Test")
+    return SimpleNamespace(effective_user=user, message=FakeMessage())
+
+def test_new_meeting_writes_protocol_of_replaced_session(tmp_path, monkeypatch):
+    monkeypatch.setattr(session_utils, "search_index", FakeSearchIndex())
+    disk = FakeDisk()
+    command_handler.init_handlers(None, disk)
+
+    user_id = 424242
+    old_session = SessionState("TD", "/TD/A", "A", user_id)
+    old_session.segmented = False
+    old_session.protocol_header = "=== Протокол ===\n"
+    old_session.sidecar_file = tmp_path / "old.jsonl"
+    old_session.add_entry("Запись, еще не записанная в файл")
+    state_manager.set_session(user_id, old_session)
+    try:
+        asyncio.run(command_handler.create_meeting(make_update(user_id), None, "/TD/B", "B"))
+
+        protocol = disk.files[old_session.txt_file_path]
+        assert "Запись, еще не записанная в файл" in protocol
+        assert "=== Завершение встречи ===" in protocol
+        assert state_manager.get_session(user_id).folder_path == "/TD/B"
+    finally:
+        state_manager.clear_session(user_id)
+
+def test_failed_end_keeps_unwritten_entries(tmp_path, monkeypatch):
+    monkeypatch.setattr(session_utils, "search_index", FakeSearchIndex())
+    monkeypatch.setattr(yadisk_helper_module, "UPLOAD_DIR", str(tmp_path))
+    monkeypatch.setattr(yadisk_helper_module.time, "sleep", lambda seconds: None)
+    disk = LocalDisk(tmp_path / "disk")
+    command_handler.init_handlers(None, YaDiskHelper(disk))
+
+    user_id = 434343
+    session = SessionState("TD", "/TD/A", "A", user_id)
+    session.segmented = False
+    session.protocol_header = "=== Протокол ===\n"
+    session.sidecar_file = tmp_path / "session.jsonl"
+    session.add_entry("Первая запись")
+    session.add_entry("Вторая запись")
+    state_manager.set_session(user_id, session)
+    try:
+        # Яндекс.Диск недоступен на все попытки загрузки
+        disk.fail_uploads = 3
+        update = make_update(user_id)
+        asyncio.run(command_handler.end_session(update, None))
+        assert update.message.replies[-1].startswith("❌")
+        assert state_manager.get_session(user_id) is session
+        assert len(session.pending_entries) == 2
+
+        update = make_update(user_id)
+        asyncio.run(command_handler.end_session(update, None))
+        assert update.message.replies[0].startswith("✅")
+        assert state_manager.get_session(user_id) is None
+        protocol = disk.read(session.txt_file_path).decode("utf-8")
+        assert "Первая запись" in protocol and "Вторая запись" in protocol
+        assert protocol.count("=== Завершение встречи ===") == 1
+    finally:
+        state_manager.clear_session(user_id)
@@ -0,0 +1,85 @@
+import asyncio
+import logging
+import time
+from types import SimpleNamespace
+
+from src.utils.concurrency_utils import KeyedLock, PerUserUpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+def make_update(user_id):
+    return SimpleNamespace(effective_user=SimpleNamespace(id=user_id), effective_chat=None)
+
+async def handle(log, user_id, number, delay):
+    await asyncio.sleep(delay)
+    log.append((user_id, number, time.monotonic()))
+
+def test_keyed_lock_is_fifo_and_cleans_up():
+    async def scenario():
+        locks = KeyedLock()
+        order = []
+
+        async def worker(number):
+            async with locks.acquire("user"):
+                await asyncio.sleep(0.001)
+                order.append(number)
+
+        await asyncio.gather(*(worker(number) for number in range(10)))
+        return order, len(locks)
+
+    order, remaining = asyncio.run(scenario())
+    assert order == list(range(10))
+    assert remaining == 0
+
+def test_updates_of_one_user_keep_order():
+    async def scenario():
+        processor = PerUserUpdateProcessor(8)
+        log = []
+        # Первое обновление самое долгое: без блокировки оно завершилось бы последним
+        delays = [0.05, 0.01, 0.02, 0.0, 0.01]
+        await asyncio.gather(*(
+            processor.process_update(make_update(1), handle(log, 1, number, delay))
+            for number, delay in enumerate(delays)
+        ))
+        return [number for _, number, _ in log]
+
+    assert asyncio.run(scenario()) == [0, 1, 2, 3, 4]
+
+def test_waiting_updates_do_not_hold_global_slots():
+    async def scenario():
+        processor = PerUserUpdateProcessor(4)
+        log = []
+        started = time.monotonic()
+        tasks = [asyncio.create_task(processor.process_update(make_update(1), handle(log, 1, number, 0.1)))
+                 for number in range(8)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(processor.process_update(make_update(2), handle(log, 2, 0, 0.1))))
+        await asyncio.gather(*tasks)
+        return next(finished for user_id, _, finished in log if user_id == 2) - started
+
+    # Обновление второго пользователя не ждет очередь первого (0.8 с)
+    assert asyncio.run(scenario()) < 0.3
+
+def test_load_50_users_in_parallel():
+    users, updates_per_user, delay = 50, 5, 0.02
+
+    async def scenario():
+        processor = PerUserUpdateProcessor(64)
+        log = []
+        started = time.monotonic()
+        await asyncio.gather(*(
+            processor.process_update(make_update(user_id), handle(log, user_id, number, delay))
+            for number in range(updates_per_user)
+            for user_id in range(users)
+        ))
+        return log, time.monotonic() - started
+
+    log, elapsed = asyncio.run(scenario())
+    throughput = len(log) / elapsed
+    logger.info(f"{len(log)} обновлений от {users} пользователей за {elapsed:.2f} с ({throughput:.0f} в секунду)")
+
+    # Последовательная обработка заняла бы users * updates_per_user * delay = 5 с (50 обновлений в секунду)
+    assert elapsed < users * updates_per_user * delay / 5
+    assert throughput > 5 / delay
+    for user_id in range(users):
+        assert [number for uid, number, _ in log if uid == user_id] == list(range(updates_per_user))
@@ -0,0 +1,113 @@
+import asyncio
+import hashlib
+import io
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from src.utils import content_index as content_index_module
+from src.utils.content_index import FolderHashIndex, HashingWriter
+
+SCAN = b"%PDF-1.4 scan" * 1000
+
+class FakeDisk:
+    """Список файлов папки с хэшами, как его возвращает Яндекс.Диск"""
+    def __init__(self, files=None):
+        self.files = files or {}
+        self.listings = 0
+        self.fail = False
+
+    async def list_file_hashes_async(self, folder):
+        self.listings += 1
+        if self.fail:
+            raise ConnectionError("Яндекс.Диск недоступен")
+        return [(f"disk:{folder}/{name}", len(data), hashlib.md5(data).hexdigest(), hashlib.sha256(data).hexdigest())
+                for name, data in self.files.items()]
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(content_index_module, "time", SimpleNamespace(monotonic=clock, perf_counter=time.perf_counter))
+    return clock
+
+def hashed(data, chunk_size=4096):
+    out = io.BytesIO()
+    writer = HashingWriter(out)
+    for start in range(0, len(data), chunk_size):
+        writer.write(data[start:start + chunk_size])
+    return writer, out
+
+def test_hashing_writer_passes_data_through():
+    writer, out = hashed(SCAN)
+    assert out.getvalue() == SCAN
+    assert writer.size == len(SCAN)
+    assert writer.md5 == hashlib.md5(SCAN).hexdigest()
+    assert writer.sha256 == hashlib.sha256(SCAN).hexdigest()
+    assert writer.hash_seconds > 0
+
+def test_duplicate_is_found_in_folder(clock):
+    disk = FakeDisk({"scan.pdf": SCAN, "notes.txt": b"notes"})
+    index = FolderHashIndex(ttl=60)
+
+    async def scenario():
+        duplicate = await index.find("/TD/A", hashed(SCAN)[0], disk)
+        missing = await index.find("/TD/A", hashed(SCAN + b"!")[0], disk)
+        return duplicate, missing
+
+    assert asyncio.run(scenario()) == ("/TD/A/scan.pdf", None)
+    metrics = index.get_metrics()
+    assert metrics["hits"] == 1 and metrics["misses"] == 1
+    assert metrics["bytes_avoided"] == len(SCAN)
+    assert metrics["bytes_hashed"] == 2 * len(SCAN) + 1
+
+def test_folder_listing_is_cached_for_ttl(clock):
+    disk = FakeDisk({"scan.pdf": SCAN})
+    index = FolderHashIndex(ttl=60)
+    writer, _ = hashed(SCAN)
+
+    async def scenario():
+        await index.find("/TD/A", writer, disk)
+        clock.now += 59
+        await index.find("/TD/A", writer, disk)
+        listings_within_ttl = disk.listings
+        # После истечения TTL список файлов запрашивается заново
+        disk.files = {}
+        clock.now += 2
+        return listings_within_ttl, await index.find("/TD/A", writer, disk)
+
+    assert asyncio.run(scenario()) == (1, None)
+    assert disk.listings == 2
+
+def test_uploaded_file_is_added_to_built_index(clock):
+    disk = FakeDisk()
+    index = FolderHashIndex(ttl=60)
+    writer, _ = hashed(SCAN)
+
+    async def scenario():
+        # В индекс еще не построенной папки файл не добавляется
+        index.add("/TD/B", writer, "/TD/B/scan.pdf")
+        assert await index.find("/TD/A", writer, disk) is None
+        index.add("/TD/A", writer, "/TD/A/scan.pdf")
+        return await index.find("/TD/A", writer, disk)
+
+    assert asyncio.run(scenario()) == "/TD/A/scan.pdf"
+    assert disk.listings == 1
+    assert "/TD/B" not in index._folders
+
+def test_listing_error_means_no_duplicate(clock):
+    disk = FakeDisk({"scan.pdf": SCAN})
+    disk.fail = True
+    index = FolderHashIndex(ttl=60)
+
+    assert asyncio.run(index.find("/TD/A", hashed(SCAN)[0], disk)) is None
+    # Неудачная попытка не кэшируется
+    disk.fail = False
+    assert asyncio.run(index.find("/TD/A", hashed(SCAN)[0], disk)) == "/TD/A/scan.pdf"
@@ -0,0 +1,154 @@
+import asyncio
+import json
+import logging
+import random
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from local_disk import LocalDisk
+from src.handlers import command_handler
+from src.utils import folder_acl as folder_acl_module
+from src.utils import folder_navigation
+from src.utils.folder_acl import FolderACL, PathTrie
+from src.utils.folder_navigation import FolderNavigator
+from src.utils.yadisk_helper import YaDiskHelper
+
+logger = logging.getLogger(__name__)
+
+@pytest.fixture
+def acl(tmp_path, monkeypatch):
+    monkeypatch.setattr(folder_acl_module, "FOLDER_ACL_FILE", tmp_path / "folder_acl.json")
+    return FolderACL()
+
+def test_path_trie_allows_granted_subtrees():
+    trie = PathTrie(["/A/B", "/A", "/C/D/E", "/C/D/E/F", "/X"])
+    assert trie.roots == ["/A", "/C/D/E", "/X"]
+    assert trie.allows("/A") and trie.allows("/A/B/c")
+    assert trie.allows("disk:/C/D/E/z/")
+    assert not trie.allows("/C/D") and not trie.allows("/")
+    assert not trie.allows("/Y") and not trie.allows("/AB")
+
+def test_path_trie_with_root_grant():
+    trie = PathTrie(["/TD", "/"])
+    assert trie.roots == ["/"]
+    assert trie.allows("/anything/below")
+
+def test_user_and_group_grants_are_combined(acl):
+    assert acl.grant_user(1, "/Sales/")
+    assert acl.add_member("supply", 1)
+    assert acl.grant_group("supply", "Supply//North")
+    assert acl.user_grants(1) == {"/Sales", "/Supply/North"}
+    assert acl.get_trie(2) is None
+
+    # Изменение прав сбрасывает кэш дерева
+    trie = acl.get_trie(1)
+    assert acl.get_trie(1) is trie
+    assert acl.remove_member("supply", 1)
+    assert acl.get_trie(1).roots == ["/Sales"]
+    # Пустая группа удаляется
+    assert acl.revoke_group("supply", "/Supply/North")
+    assert "supply" not in acl.describe()
+
+def test_grants_survive_reload(acl):
+    acl.grant_user(1, "/Sales")
+    acl.add_member("supply", 2)
+    acl.grant_group("supply", "/Supply")
+    data = json.loads(folder_acl_module.FOLDER_ACL_FILE.read_text(encoding="utf-8"))
+    assert data["users"] == {"1": ["/Sales"]}
+
+    reloaded = FolderACL()
+    assert reloaded.user_grants(1) == {"/Sales"}
+    assert reloaded.user_grants(2) == {"/Supply"}
+
+def test_failed_save_keeps_previous_grants(acl, tmp_path, monkeypatch):
+    acl.grant_user(1, "/Sales")
+    version = acl.version
+    # Файл нельзя записать: вместо файла - папка
+    monkeypatch.setattr(folder_acl_module, "FOLDER_ACL_FILE", tmp_path)
+    assert acl.grant_user(1, "/Supply") is False
+    assert acl.add_member("supply", 1) is False
+    assert acl.user_grants(1) == {"/Sales"}
+    assert acl.version == version
+
+def test_broken_file_is_ignored_on_reload(acl):
+    acl.grant_user(1, "/Sales")
+    folder_acl_module.FOLDER_ACL_FILE.write_text('{"users": {"1": ["/Sup', encoding="utf-8")
+    acl.reload()
+    assert acl.user_grants(1) == {"/Sales"}
+
+def test_navigator_uses_grants_or_global_list(acl, monkeypatch):
+    monkeypatch.setattr(folder_navigation, "folder_acl", acl)
+    navigator = FolderNavigator(None)
+    navigator.allowed_folders = ["/Sales", "/Supply"]
+    acl.grant_user(1, "/Sales/North")
+
+    assert navigator.get_allowed_folders(1) == ["/Sales/North"]
+    assert navigator.is_path_allowed("/Sales/North/2025", 1)
+    assert not navigator.is_path_allowed("/Sales/South", 1)
+    # Пользователь без выданных папок видит общий список
+    assert navigator.get_allowed_folders(2) == ["/Sales", "/Supply"]
+    assert navigator.is_path_allowed("/Supply/x", 2)
+
+def test_acl_check_with_1000_users_and_100_grants(acl):
+    random.seed(1)
+    folders = [f"/TD/Dept{dept}/Client{client}" for dept in range(50) for client in range(200)]
+    users = {user_id: frozenset(random.sample(folders, 100)) for user_id in range(1000)}
+    acl._users, acl.version = users, acl.version + 1
+    checks = [(random.randrange(1000), random.choice(folders) + "/2025/Meeting") for _ in range(50000)]
+
+    started = time.perf_counter()
+    for user_id in range(1000):
+        acl.get_trie(user_id)
+    build_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    allowed = [acl.get_trie(user_id).allows(path) for user_id, path in checks]
+    trie_time = time.perf_counter() - started
+
+    # Прежний способ: перебор списка папок пользователя
+    lists = {user_id: sorted(grants) for user_id, grants in users.items()}
+    started = time.perf_counter()
+    expected = [any(path == folder or path.startswith(folder + "/") for folder in lists[user_id])
+                for user_id, path in checks]
+    scan_time = time.perf_counter() - started
+
+    per_check = trie_time / len(checks) * 1e6
+    logger.info(f"деревья 1000 пользователей: {build_time * 1000:.0f} мс; проверка: "
+                f"{per_check:.2f} мкс (перебор списка: {scan_time / len(checks) * 1e6:.2f} мкс)")
+    assert allowed == expected
+    assert trie_time < scan_time
+    # Проверка по дереву не зависит от числа выданных папок и занимает единицы микросекунд
+    assert per_check < 50
+
+class FakeMessage:
+    def __init__(self, text):
+        self.text = text
+        self.replies = []
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+
+def run_acl_command(text):
+    update = SimpleNamespace(effective_user=SimpleNamespace(id=1), message=FakeMessage(text))
+    asyncio.run(command_handler.edit_folder_acl(update, None))
+    return update.message.replies
+
+def test_admin_grant_requires_existing_folder(acl, tmp_path, monkeypatch):
+    disk = LocalDisk(tmp_path / "disk")
+    disk.mkdir("/TD")
+    disk.mkdir("/TD/Sales")
+    navigator = FolderNavigator(YaDiskHelper(disk))
+    navigator.allowed_folders = ["/Configured"]
+    command_handler.init_handlers(navigator, navigator.yadisk_helper)
+    monkeypatch.setattr(command_handler, "folder_acl", acl)
+
+    assert run_acl_command("user 5 + /TD/Missing")[0].startswith("❌")
+    assert acl.user_grants(5) == frozenset()
+
+    assert run_acl_command("user 5 + /TD/Sales")[0].startswith("✅")
+    # Папка из общего списка выдается без обращения к Яндекс.Диску
+    assert run_acl_command("group sales + /Configured")[0].startswith("✅")
+    assert run_acl_command("member sales + 5")[0].startswith("✅")
+    assert acl.user_grants(5) == {"/TD/Sales", "/Configured"}
@@ -0,0 +1,117 @@
+import asyncio
+
+import pytest
+
+from src.utils.job_scheduler import JobRejected, JobScheduler
+
+async def hold(scheduler, job_class, user_id, release, started=None, cost=1.0):
+    """Занимает слот до события release; started - список, куда записывается порядок запуска"""
+    async with scheduler.slot(job_class, user_id, cost):
+        if started is not None:
+            started.append(user_id)
+        await release.wait()
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+def test_full_queue_rejects_jobs():
+    async def scenario():
+        scheduler = JobScheduler({"media": (1, 2)})
+        release = asyncio.Event()
+        tasks = [asyncio.create_task(hold(scheduler, "media", user_id, release)) for user_id in (1, 2, 3)]
+        await settle()
+        with pytest.raises(JobRejected):
+            async with scheduler.slot("media", 4):
+                pass
+        release.set()
+        await asyncio.gather(*tasks)
+        return scheduler.get_metrics()["media"]
+
+    metrics = asyncio.run(scenario())
+    assert metrics["rejected"] == 1
+    assert metrics["started"] == 3
+    assert metrics["running"] == 0 and metrics["queued"] == 0
+
+def test_heavy_jobs_do_not_delay_other_users():
+    async def scenario():
+        scheduler = JobScheduler({"media": (1, 100)})
+        started = []
+        blocker = asyncio.Event()
+        tasks = [asyncio.create_task(hold(scheduler, "media", 0, blocker))]
+        await settle()
+        # Пользователь 1 отправил десять больших файлов, пользователь 2 - один небольшой
+        done = asyncio.Event()
+        done.set()
+        for _ in range(10):
+            tasks.append(asyncio.create_task(hold(scheduler, "media", 1, done, started, cost=20)))
+        await settle()
+        tasks.append(asyncio.create_task(hold(scheduler, "media", 2, done, started, cost=1)))
+        await settle()
+        blocker.set()
+        await asyncio.gather(*tasks)
+        return started
+
+    started = asyncio.run(scenario())
+    assert started[0] == 2
+    assert started.count(1) == 10
+
+def test_cancelled_waiter_does_not_leak_slot():
+    async def scenario():
+        scheduler = JobScheduler({"media": (1, 10)})
+        release = asyncio.Event()
+        holder = asyncio.create_task(hold(scheduler, "media", 1, release))
+        await settle()
+        waiter = asyncio.create_task(hold(scheduler, "media", 2, release))
+        await settle()
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        release.set()
+        await holder
+        # Слот свободен: новая задача запускается сразу
+        async with scheduler.slot("media", 3):
+            running = scheduler.get_metrics()["media"]["running"]
+        return running, scheduler.get_metrics()["media"]
+
+    running, metrics = asyncio.run(scenario())
+    assert running == 1
+    assert metrics["running"] == 0 and metrics["queued"] == 0
+
+def test_slot_granted_before_cancellation_is_released():
+    async def scenario():
+        scheduler = JobScheduler({"media": (1, 10)})
+        async with scheduler.slot("media", 1):
+            waiter = asyncio.create_task(hold(scheduler, "media", 2, asyncio.Event()))
+            await settle()
+        # Слот уже выдан ожидающей задаче, но она отменяется до того, как успела запуститься
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        return scheduler.get_metrics()["media"]
+
+    metrics = asyncio.run(scenario())
+    assert metrics["started"] == 2
+    assert metrics["running"] == 0 and metrics["queued"] == 0
+
+def test_cancelled_job_cost_is_refunded():
+    async def scenario():
+        scheduler = JobScheduler({"media": (1, 10)})
+        started = []
+        blocker = asyncio.Event()
+        done = asyncio.Event()
+        done.set()
+        holder = asyncio.create_task(hold(scheduler, "media", 0, blocker))
+        await settle()
+        heavy = asyncio.create_task(hold(scheduler, "media", 1, done, started, cost=50))
+        await settle()
+        heavy.cancel()
+        await asyncio.gather(heavy, return_exceptions=True)
+        # Отмененная задача не выполнялась: следующая задача пользователя 1 ее не оплачивает
+        tasks = [asyncio.create_task(hold(scheduler, "media", 1, done, started, cost=1))]
+        await settle()
+        tasks.append(asyncio.create_task(hold(scheduler, "media", 2, done, started, cost=5)))
+        await settle()
+        blocker.set()
+        await asyncio.gather(holder, *tasks)
+        return started
+
+    assert asyncio.run(scenario()) == [1, 2]
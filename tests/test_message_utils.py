@@ -0,0 +1,187 @@
+import asyncio
+import itertools
+import logging
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from src.handlers.text_handler import handle_text
+from src.utils import message_utils
+from src.utils import session_utils
+from src.utils.message_utils import MessageDeletionScheduler, ProgressReporter
+from src.utils.session_utils import SessionState, state_manager
+
+logger = logging.getLogger(__name__)
+
+class FakeMessage:
+    def __init__(self, chat_id):
+        self.chat_id = chat_id
+        self.replies = []
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+
+def make_update(chat_id=1):
+    return SimpleNamespace(message=FakeMessage(chat_id))
+
+def test_fast_stages_need_one_request():
+    async def scenario():
+        update = make_update()
+        progress = ProgressReporter(update, "⏳ Получение...")
+        progress.stage("⏳ Загрузка...")
+        progress.stage("⏳ Запись...")
+        await progress.finish("✅ Готово")
+        return update.message.replies, progress.api_calls
+
+    replies, api_calls = asyncio.run(scenario())
+    # Без оптимизации: отправка, две правки этапов, итоговая правка
+    assert replies == ["✅ Готово"]
+    assert api_calls == 1
+
+def test_context_manager_stops_task_without_finish():
+    async def scenario():
+        update = make_update()
+        async with ProgressReporter(update) as progress:
+            progress.stage("⏳ Загрузка...")
+        return progress._task.done(), update.message.replies
+
+    done, replies = asyncio.run(scenario())
+    assert done
+    assert replies == []
+
+def test_context_manager_reports_error():
+    async def scenario():
+        update = make_update()
+        with pytest.raises(RuntimeError):
+            async with ProgressReporter(update) as progress:
+                raise RuntimeError("сбой")
+        return progress._task.done(), update.message.replies
+
+    done, replies = asyncio.run(scenario())
+    assert done
+    assert len(replies) == 1 and replies[0].startswith("❌")
+
+def test_finish_forgets_stale_chats(monkeypatch):
+    monkeypatch.setattr(ProgressReporter, "_last_edit", {})
+    now = time.monotonic()
+    ProgressReporter._last_edit.update({
+        chat_id: now - ProgressReporter.EDIT_INTERVAL - 1 for chat_id in range(1000)
+    })
+    ProgressReporter._last_edit[5000] = now
+
+    async def scenario():
+        await ProgressReporter(make_update(7)).finish()
+
+    asyncio.run(scenario())
+    assert ProgressReporter._last_edit == {5000: now}
+
+class FakeBot:
+    """Запоминает вызовы delete_messages и отправленные сообщения"""
+    def __init__(self):
+        self.deleted = []
+        self.sent = []
+        self._ids = itertools.count(1000)
+
+    async def delete_messages(self, chat_id, message_ids):
+        self.deleted.append((chat_id, list(message_ids)))
+
+    async def send_message(self, chat_id, text, **kwargs):
+        message = SentMessage(self, chat_id, next(self._ids))
+        self.sent.append((chat_id, text))
+        return message
+
+class SentMessage:
+    def __init__(self, bot, chat_id, message_id):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.message_id = message_id
+
+    def get_bot(self):
+        return self.bot
+
+def test_deletion_follows_deadlines():
+    async def scenario():
+        bot = FakeBot()
+        scheduler = MessageDeletionScheduler()
+        scheduler.BATCH_WINDOW = 0
+        for message_id, delay in [(1, 0.06), (2, 0.02), (3, 0.04)]:
+            scheduler.schedule(SentMessage(bot, 7, message_id), delay)
+        await asyncio.sleep(0.15)
+        await scheduler.flush()
+        return bot.deleted
+
+    assert asyncio.run(scenario()) == [(7, [2]), (7, [3]), (7, [1])]
+
+def test_due_messages_are_deleted_in_batches_per_chat():
+    async def scenario():
+        bot = FakeBot()
+        scheduler = MessageDeletionScheduler()
+        for message_id in range(150):
+            scheduler.schedule(SentMessage(bot, 1, message_id), 0.01)
+        for message_id in range(3):
+            scheduler.schedule(SentMessage(bot, 2, message_id), 0.02)
+        await asyncio.sleep(0.1)
+        await scheduler.flush()
+        return bot.deleted
+
+    deleted = asyncio.run(scenario())
+    assert [(chat_id, len(ids)) for chat_id, ids in deleted] == [(1, 100), (1, 50), (2, 3)]
+
+def test_flush_deletes_pending_messages_at_once():
+    async def scenario():
+        bot = FakeBot()
+        scheduler = MessageDeletionScheduler()
+        scheduler.schedule(SentMessage(bot, 1, 10), 60)
+        scheduler.schedule(SentMessage(bot, 1, 11), 120)
+        await asyncio.sleep(0)
+        started = time.monotonic()
+        await scheduler.flush()
+        return bot.deleted, time.monotonic() - started, scheduler._task
+
+    deleted, elapsed, task = asyncio.run(scenario())
+    assert deleted == [(1, [10, 11])]
+    assert elapsed < 1
+    assert task is None
+
+class FakeDisk:
+    async def create_text_file_async(self, text, path):
+        pass
+
+class FakeSearchIndex:
+    async def add_records_async(self, protocol_path, records):
+        pass
+
+def test_handle_text_does_not_wait_for_notice_deletion(tmp_path, monkeypatch):
+    monkeypatch.setattr(session_utils, "search_index", FakeSearchIndex())
+    monkeypatch.setattr(message_utils, "deletion_scheduler", MessageDeletionScheduler())
+    bot = FakeBot()
+    user_id = 454545
+    session = SessionState("TD", "/TD/A", "A", user_id)
+    session.segmented = False
+    session.sidecar_file = tmp_path / "protocol.jsonl"
+    state_manager.set_session(user_id, session)
+    message = SimpleNamespace(chat_id=user_id, text="Договорились о сроках", get_bot=lambda: bot)
+    update = SimpleNamespace(effective_user=SimpleNamespace(id=user_id, username="tester", first_name="Test"),
+                             message=message)
+    context = SimpleNamespace(bot_data={"yadisk_helper": FakeDisk()})
+
+    async def scenario():
+        started = time.perf_counter()
+        await handle_text(update, context)
+        elapsed = time.perf_counter() - started
+        deleted_before_flush = list(bot.deleted)
+        await message_utils.deletion_scheduler.flush()
+        return elapsed, deleted_before_flush
+
+    try:
+        elapsed, deleted_before_flush = asyncio.run(scenario())
+    finally:
+        state_manager.clear_session(user_id)
+
+    logger.info(f"handle_text: {elapsed * 1000:.1f} мс (прежде обработчик ждал удаления уведомления 2 с)")
+    assert bot.sent == [(user_id, "📝 Сообщение записано в протокол")]
+    # Уведомление удаляется позже фоновым планировщиком, обработчик его не ждет
+    assert deleted_before_flush == []
+    assert bot.deleted == [(user_id, [1000])]
+    assert elapsed < 0.5
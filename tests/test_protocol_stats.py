@@ -0,0 +1,66 @@
+import json
+
+from src.utils.protocol_stats import aggregate_folder_stats, format_folder_stats, iter_sidecar_records
+
+def write_meeting(sidecar_dir, name, records):
+    path = sidecar_dir / f"{name}.jsonl"
+    path.write_text("".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records), encoding="utf-8")
+    return path
+
+def record(ts, folder, entry_type="text", size=None):
+    result = {"ts": ts, "folder": folder, "author": "tester", "type": entry_type, "text": "..."}
+    if size is not None:
+        result["size"] = size
+    return result
+
+def test_stats_are_aggregated_per_folder(tmp_path):
+    write_meeting(tmp_path, "meeting1", [
+        record("2026-10-01 10:00:00", "/TD/A"),
+        record("2026-10-01 10:05:00", "/TD/A", "photo", 1000),
+        record("2026-10-01 10:06:00", "/TD/A", "album", 3000),
+    ])
+    write_meeting(tmp_path, "meeting2", [
+        record("2026-10-02 11:00:00", "/TD/A", "voice", 500),
+        record("2026-10-02 11:01:00", "/TD/A", "document"),
+    ])
+    write_meeting(tmp_path, "meeting3", [record("2026-10-03 09:00:00", "/TD/B")])
+
+    stats = aggregate_folder_stats(tmp_path)
+    assert stats["/TD/A"] == {"meetings": 2, "entries": 5, "bytes": 4500,
+                              "text": 1, "photo": 1, "album": 1, "voice": 1, "document": 1}
+    assert stats["/TD/B"] == {"meetings": 1, "entries": 1, "bytes": 0, "text": 1}
+
+def test_since_filters_records_not_meetings(tmp_path):
+    # Встреча началась до начала периода и закончилась в нем
+    write_meeting(tmp_path, "meeting1", [
+        record("2026-09-30 23:50:00", "/TD/A", "photo", 1000),
+        record("2026-10-01 00:10:00", "/TD/A"),
+    ])
+    write_meeting(tmp_path, "meeting2", [record("2026-09-15 10:00:00", "/TD/B")])
+    write_meeting(tmp_path, "meeting3", [record("2026-10-05 10:00:00", "/TD/A", "photo", 200)])
+
+    stats = aggregate_folder_stats(tmp_path, since="2026-10-01")
+    assert stats == {"/TD/A": {"meetings": 2, "entries": 2, "bytes": 200, "text": 1, "photo": 1}}
+    assert aggregate_folder_stats(tmp_path, since="2026-11-01") == {}
+
+def test_damaged_lines_are_skipped(tmp_path):
+    path = write_meeting(tmp_path, "meeting1", [record("2026-10-01 10:00:00", "/TD/A")])
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"ts": "2026-10-01 10:01:00", "fol\n\n')
+        f.write(json.dumps(record("2026-10-01 10:02:00", "/TD/A")) + "\n")
+
+    assert len(list(iter_sidecar_records([path, tmp_path / "missing.jsonl"]))) == 2
+    assert aggregate_folder_stats(tmp_path)["/TD/A"]["entries"] == 2
+
+def test_format_sorts_by_entries_and_limits_folders(tmp_path):
+    stats = {
+        "/TD/A": {"meetings": 1, "entries": 2, "bytes": 0},
+        "/TD/B": {"meetings": 3, "entries": 7, "photo": 2, "bytes": 3 * 1024 * 1024},
+        "/TD/C": {"meetings": 1, "entries": 1, "bytes": 0},
+    }
+    text = format_folder_stats(stats, limit=2)
+    assert text.index("/TD/B") < text.index("/TD/A")
+    assert "/TD/C" not in text
+    assert "фото: 2" in text and "файлов: 3.0 МБ" in text
+    assert text.endswith("... и еще папок: 1")
+    assert format_folder_stats({}) == "Нет данных."
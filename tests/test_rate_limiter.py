@@ -0,0 +1,132 @@
+import asyncio
+import time
+
+from telegram.error import RetryAfter
+
+from src.utils.rate_limiter import OutboundRateLimiter
+
+def make_limiter(**kwargs):
+    rates = {"global_rate": 1000, "chat_rate": 1000, "group_rate": 1000, "chat_burst": 1}
+    rates.update(kwargs)
+    return OutboundRateLimiter(**rates)
+
+def send(limiter, sent, name, chat_id, endpoint="sendMessage", **data):
+    async def callback():
+        sent.append(name)
+        return name
+    return limiter.process_request(callback, (), {}, endpoint, {"chat_id": chat_id, **data}, None)
+
+def test_idle_chat_buckets_are_evicted():
+    async def scenario():
+        limiter = make_limiter()
+        limiter.BUCKET_EVICT_INTERVAL = 0
+        sent = []
+        for chat_id in range(1, 101):
+            await send(limiter, sent, chat_id, chat_id)
+        await asyncio.sleep(0.05)
+        await send(limiter, sent, "last", 1000)
+        buckets = len(limiter._chat_buckets)
+        await limiter.shutdown()
+        return sent, buckets
+
+    sent, buckets = asyncio.run(scenario())
+    assert len(sent) == 101
+    # Остается только корзина последнего чата, а не по корзине на каждый чат
+    assert buckets == 1
+
+def test_blocked_bucket_is_kept():
+    async def scenario():
+        limiter = make_limiter()
+        await send(limiter, [], "reply", 1)
+        bucket = limiter._chat_buckets[1]
+        now = time.monotonic() + 1
+        bucket.blocked_until = now + 10
+        limiter._evict_idle_buckets(now)
+        kept = 1 in limiter._chat_buckets
+        bucket.blocked_until = 0
+        limiter._evict_idle_buckets(now)
+        await limiter.shutdown()
+        return kept, 1 in limiter._chat_buckets
+
+    assert asyncio.run(scenario()) == (True, False)
+
+def test_replies_overtake_deletes_and_edits_are_merged():
+    async def scenario():
+        limiter = make_limiter(chat_rate=20)
+        sent = []
+        # Первый запрос забирает единственный токен, остальные ждут в очереди
+        first = asyncio.ensure_future(send(limiter, sent, "first", 1))
+        await asyncio.sleep(0)
+        results = await asyncio.gather(
+            first,
+            send(limiter, sent, "delete", 1, endpoint="deleteMessage", message_id=5),
+            send(limiter, sent, "edit 1", 1, endpoint="editMessageText", message_id=7),
+            send(limiter, sent, "edit 2", 1, endpoint="editMessageText", message_id=7),
+            send(limiter, sent, "reply", 1),
+        )
+        metrics = limiter.get_metrics()
+        await limiter.shutdown()
+        return sent, results, metrics
+
+    sent, results, metrics = asyncio.run(scenario())
+    assert sent == ["first", "reply", "edit 2", "delete"]
+    # Замененная правка получает результат более новой
+    assert results[2] == results[3] == "edit 2"
+    assert metrics["progress"]["merged"] == 1
+    assert metrics["reply"]["sent"] == 2
+
+def edit_after_retry(limiter, sent, name, retries):
+    """Правка сообщения 7; первые retries попыток получают ответ RetryAfter"""
+    async def callback():
+        sent.append(name)
+        if sent.count(name) <= retries:
+            raise RetryAfter(0.05)
+        return name
+    data = {"chat_id": 1, "message_id": 7}
+    return limiter.process_request(callback, (), {}, "editMessageText", data, None)
+
+def test_retried_edit_is_replaced_by_newer_edit():
+    async def scenario():
+        limiter = make_limiter()
+        sent = []
+        first = asyncio.ensure_future(edit_after_retry(limiter, sent, "edit 1", retries=1))
+        # Чат заблокирован после RetryAfter, правка 1 снова ждет в очереди
+        while limiter._chat_buckets.get(1) is None or not limiter._chat_buckets[1].blocked_until:
+            await asyncio.sleep(0.001)
+        results = await asyncio.gather(first, edit_after_retry(limiter, sent, "edit 2", retries=0))
+        metrics = limiter.get_metrics()
+        await limiter.shutdown()
+        return sent, results, metrics
+
+    sent, results, metrics = asyncio.run(scenario())
+    assert sent == ["edit 1", "edit 2"]
+    assert results == ["edit 2", "edit 2"]
+    assert metrics["progress"]["merged"] == 1
+
+def test_edit_sent_during_retried_request_replaces_it():
+    async def scenario():
+        limiter = make_limiter()
+        sent = []
+        started = asyncio.Event()
+        proceed = asyncio.Event()
+
+        async def slow_callback():
+            sent.append("edit 1")
+            started.set()
+            await proceed.wait()
+            raise RetryAfter(0.05)
+
+        data = {"chat_id": 1, "message_id": 7}
+        first = asyncio.ensure_future(limiter.process_request(slow_callback, (), {}, "editMessageText", data, None))
+        await started.wait()
+        # Более новая правка поставлена в очередь, пока первая еще выполняется
+        second = asyncio.ensure_future(edit_after_retry(limiter, sent, "edit 2", retries=0))
+        await asyncio.sleep(0)
+        proceed.set()
+        results = await asyncio.gather(first, second)
+        await limiter.shutdown()
+        return sent, results
+
+    sent, results = asyncio.run(scenario())
+    assert sent == ["edit 1", "edit 2"]
+    assert results == ["edit 2", "edit 2"]
@@ -0,0 +1,115 @@
+import asyncio
+import posixpath
+
+from src.utils.search_index import SearchIndex, build_match_query, parse_protocol
+
+PROTOCOL_HEADER = "=== Протокол встречи ===\nПапка: {folder}\n===\n"
+
+class FakeDisk:
+    """Яндекс.Диск в памяти: путь -> (текст, дата изменения); папки определяются по путям"""
+    def __init__(self, files):
+        self.files = files
+        self.reads = []
+
+    async def list_items_async(self, folder):
+        items = {}
+        for path, (_, modified) in self.files.items():
+            if not path.startswith(folder + "/"):
+                continue
+            name = path[len(folder) + 1:].split("/")[0]
+            child = posixpath.join(folder, name)
+            items[child] = (f"disk:{child}", "file" if child == path else "dir", modified)
+        return list(items.values())
+
+    async def read_text_file_async(self, path):
+        self.reads.append(path)
+        return self.files[path][0]
+
+def protocol(folder, *lines):
+    return PROTOCOL_HEADER.format(folder=folder) + "\n".join(lines) + "\n"
+
+def run_backfill(index, disk, folders):
+    return asyncio.run(index.backfill(disk, folders, concurrency=2))
+
+def test_parse_protocol_joins_continuation_lines():
+    rows = parse_protocol(protocol(
+        "/TD/A",
+        "[2025-01-10 10:00:00] [Иван] Обсудили компрессор",
+        "файл1.jpg",
+        "[2025-01-10 10:05:00] Без автора",
+    ), "/TD/A/a_visit_1.txt")
+    assert rows == [
+        ("/TD/A/a_visit_1.txt", "/TD/A", "2025-01-10 10:00:00", "Иван", "Обсудили компрессор\nфайл1.jpg"),
+        ("/TD/A/a_visit_1.txt", "/TD/A", "2025-01-10 10:05:00", "", "Без автора"),
+    ]
+
+def test_build_match_query_finds_word_forms(tmp_path):
+    assert build_match_query("Компрессоры X") == '"компрессо"* "x"*'
+    index = SearchIndex(tmp_path / "search.sqlite3")
+    index.add_rows([("/p.txt", "/TD/A", "2025-01-10 10:00:00", "", "Звонок поставщику про компрессор")])
+    assert len(index.search("компрессоры")) == 1
+    index.close()
+
+def test_backfill_indexes_protocols_once(tmp_path):
+    disk = FakeDisk({
+        "/TD/A/a_visit_1.txt": (protocol("/TD/A", "[2025-01-10 10:00:00] компрессор"), "1"),
+        "/TD/A/photo.jpg": ("", "1"),
+        "/TD/A/Sub/b_visit_2.txt": (protocol("/TD/A/Sub", "[2025-01-11 10:00:00] компрессор"), "1"),
+    })
+    index = SearchIndex(tmp_path / "search.sqlite3")
+    stats = run_backfill(index, disk, ["/TD/A"])
+    assert stats["protocols"] == 2 and stats["indexed"] == 2 and stats["errors"] == 0
+    assert len(index.search("компрессор")) == 2
+
+    # Повторный обход не загружает неизменившиеся протоколы
+    disk.reads.clear()
+    stats = run_backfill(index, disk, ["/TD/A"])
+    assert stats["indexed"] == 0 and disk.reads == []
+    assert len(index.search("компрессор")) == 2
+    index.close()
+
+def test_backfill_indexes_segments_under_protocol_path(tmp_path):
+    disk = FakeDisk({
+        "/TD/A/a_visit_1_parts/a_visit_1_0001.txt": (protocol("/TD/A", "[2025-01-10 10:00:00] компрессор"), "1"),
+        "/TD/A/a_visit_1_parts/a_visit_1_0002.txt": ("[2025-01-10 11:00:00] поставщик\n", "2"),
+        "/TD/A/a_visit_1_parts/a_visit_1_index.json": ("{}", "2"),
+    })
+    index = SearchIndex(tmp_path / "search.sqlite3")
+    # Записи, добавленные во время встречи, индексируются под путем протокола
+    index.add_rows([("/TD/A/a_visit_1.txt", "/TD/A", "2025-01-10 10:00:00", "", "компрессор")])
+    run_backfill(index, disk, ["/TD/A"])
+
+    results = index.search("компрессор")
+    assert len(results) == 1 and results[0]["folder"] == "/TD/A"
+    assert len(index.search("поставщик")) == 1
+
+    # Новый сегмент переиндексирует протокол без повторов
+    disk.files["/TD/A/a_visit_1_parts/a_visit_1_0003.txt"] = ("[2025-01-10 12:00:00] компрессор снова\n", "3")
+    stats = run_backfill(index, disk, ["/TD/A"])
+    assert stats["indexed"] == 1
+    assert len(index.search("компрессор")) == 2
+    index.close()
+
+def test_backfill_skips_segments_of_compacted_protocol(tmp_path):
+    text = protocol("/TD/A", "[2025-01-10 10:00:00] компрессор")
+    disk = FakeDisk({
+        "/TD/A/a_visit_1.txt": (text, "5"),
+        "/TD/A/a_visit_1_parts/a_visit_1_0001.txt": (text, "1"),
+    })
+    index = SearchIndex(tmp_path / "search.sqlite3")
+    run_backfill(index, disk, ["/TD/A"])
+    assert len(index.search("компрессор")) == 1
+    assert disk.reads == ["/TD/A/a_visit_1.txt"]
+    index.close()
+
+def test_search_is_limited_to_allowed_folders(tmp_path):
+    index = SearchIndex(tmp_path / "search.sqlite3")
+    index.add_rows([
+        ("/TD/Sales/p.txt", "/TD/Sales", "2025-01-10 10:00:00", "", "компрессор"),
+        ("/TD/Sales2/p.txt", "/TD/Sales2", "2025-01-10 10:00:00", "", "компрессор"),
+        ("/TD/Supply/x/p.txt", "/TD/Supply/x", "2025-01-10 10:00:00", "", "компрессор"),
+    ])
+    assert [r["folder"] for r in index.search("компрессор", ["/TD/Sales"])] == ["/TD/Sales"]
+    assert [r["folder"] for r in index.search("компрессор", ["/TD/Supply"])] == ["/TD/Supply/x"]
+    assert len(index.search("компрессор")) == 3
+    index.close()
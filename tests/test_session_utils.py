@@ -0,0 +1,118 @@
+import asyncio
+import logging
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from local_disk import LocalDisk
+from src.handlers import command_handler
+from src.utils import session_utils
+from src.utils import yadisk_helper as yadisk_helper_module
+from src.utils.job_scheduler import JobRejected
+from src.utils.session_utils import SessionState, state_manager
+from src.utils.yadisk_helper import YaDiskHelper
+
+logger = logging.getLogger(__name__)
+
+class FakeDisk:
+    """Запоминает записанные файлы; reject=True имитирует переполненную очередь"""
+    def __init__(self):
+        self.files = {}
+        self.reject = False
+
+    async def create_text_file_async(self, text, path):
+        if self.reject:
+            raise JobRejected("protocol")
+        self.files[path] = text
+
+class FakeSearchIndex:
+    async def add_records_async(self, protocol_path, records):
+        pass
+
+@pytest.fixture
+def session(tmp_path, monkeypatch):
+    monkeypatch.setattr(session_utils, "search_index", FakeSearchIndex())
+    session = SessionState("/TD", "/TD/A", "A", 1)
+    session.segmented = False
+    session.protocol_header = "=== Протокол ===\n"
+    session.sidecar_file = tmp_path / "protocol.jsonl"
+    return session
+
+def test_write_entry_reports_written_entry(session):
+    disk = FakeDisk()
+    entry = session.reserve_entry()
+    session.complete_entry(entry, "Первое сообщение")
+    assert asyncio.run(session.write_entry(disk, entry)) is True
+    assert "Первое сообщение" in disk.files[session.txt_file_path]
+
+def test_write_entry_waits_for_earlier_entry(session):
+    disk = FakeDisk()
+    media_entry = session.reserve_entry()
+    entry = session.reserve_entry()
+    session.complete_entry(entry, "Текст после фото")
+    # Фото еще загружается: текст ждет его в очереди
+    assert asyncio.run(session.write_entry(disk, entry)) is False
+    assert disk.files == {}
+
+    session.complete_entry(media_entry, "Загружено фото")
+    assert asyncio.run(session.write_entry(disk, entry)) is True
+    text = disk.files[session.txt_file_path]
+    assert text.index("Загружено фото") < text.index("Текст после фото")
+
+def test_write_entry_keeps_rejected_entry_queued(session):
+    disk = FakeDisk()
+    disk.reject = True
+    entry = session.reserve_entry()
+    session.complete_entry(entry, "Сообщение")
+    assert asyncio.run(session.write_entry(disk, entry)) is False
+    assert entry in session.pending_entries
+
+    # Запись попадает в протокол при следующей записи
+    disk.reject = False
+    later = session.reserve_entry()
+    session.complete_entry(later, "Следующее")
+    assert asyncio.run(session.write_entry(disk, later)) is True
+    assert "Сообщение" in disk.files[session.txt_file_path]
+
+class FakeMessage:
+    def __init__(self):
+        self.replies = []
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+
+def test_end_of_500_entry_meeting(session, tmp_path, monkeypatch):
+    monkeypatch.setattr(yadisk_helper_module, "UPLOAD_DIR", str(tmp_path))
+    disk = LocalDisk(tmp_path / "disk")
+    helper = YaDiskHelper(disk)
+    command_handler.init_handlers(None, helper)
+
+    async def meeting():
+        for index in range(500):
+            entry = session.reserve_entry()
+            session.complete_entry(entry, f"Сообщение {index}: обсуждение поставок и сроков")
+            # Часть записей еще не записана к моменту /end
+            if index < 490:
+                await session.write_entry(helper, entry)
+
+    asyncio.run(meeting())
+    disk.uploads.clear()
+    state_manager.set_session(session.user_id, session)
+    update = SimpleNamespace(effective_user=SimpleNamespace(id=session.user_id, username="tester", first_name="Test"),
+                             message=FakeMessage())
+    try:
+        started = time.perf_counter()
+        asyncio.run(command_handler.end_session(update, None))
+        elapsed = time.perf_counter() - started
+    finally:
+        state_manager.clear_session(session.user_id)
+
+    logger.info(f"/end встречи из 500 записей: {elapsed * 1000:.0f} мс, загрузок {len(disk.uploads)}")
+    assert update.message.replies[0].startswith("✅")
+    # Протокол загружается один раз и не скачивается: его текст хранится в сессии
+    assert disk.uploads.count(session.txt_file_path) == 1
+    assert disk.downloads == 0
+    protocol = disk.read(session.txt_file_path).decode("utf-8")
+    assert "Сообщение 499" in protocol and protocol.count("=== Завершение встречи ===") == 1
+    assert elapsed < 2
@@ -0,0 +1,29 @@
+import pytest
+
+from src.utils.speech_engines import ENGINES, SpeechEngine, get_engine
+
+class EchoEngine(SpeechEngine):
+    name = "echo"
+
+    def recognize(self, pcm, language):
+        return f"{len(pcm)} {language}" if pcm else None
+
+def test_incomplete_engine_cannot_be_created():
+    class IncompleteEngine(SpeechEngine):
+        name = "incomplete"
+
+    with pytest.raises(TypeError):
+        IncompleteEngine()
+
+def test_batch_recognition_defaults_to_single_chunks():
+    engine = EchoEngine()
+    assert engine.recognize_batch([b"ab", b"", b"abcd"], "ru-RU") == ["2 ru-RU", None, "4 ru-RU"]
+    assert engine.capabilities()["sample_rate"] == 16000
+
+def test_engines_are_created_once(monkeypatch):
+    monkeypatch.setitem(ENGINES, EchoEngine.name, EchoEngine)
+    assert get_engine("echo") is get_engine("echo")
+
+def test_unknown_engine_is_rejected():
+    with pytest.raises(ValueError):
+        get_engine("missing")
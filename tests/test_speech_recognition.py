@@ -0,0 +1,262 @@
+import asyncio
+import io
+import logging
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pytest
+
+import config.config as config
+from src.utils import speech_engines
+from src.utils import speech_recognition as speech_recognition_module
+from src.utils.concurrency_utils import LoopLagMonitor
+from src.utils.speech_engines import SpeechEngine
+from src.utils.speech_recognition import (
+    SAMPLE_RATE, SAMPLE_WIDTH, UNRECOGNIZED_CHUNK, SpeechRecognizer, split_on_silence
+)
+from src.utils.transcription_cache import TranscriptionCache
+
+logger = logging.getLogger(__name__)
+
+def speech(seconds, rng):
+    """Шум с амплитудой речи"""
+    return rng.normal(0, 4000, int(seconds * SAMPLE_RATE)).astype(np.int16)
+
+def silence(seconds):
+    return np.zeros(int(seconds * SAMPLE_RATE), dtype=np.int16)
+
+def test_cuts_land_in_silences():
+    rng = np.random.default_rng(0)
+    parts, pauses, position = [], [], 0
+    # Фразы не длиннее 4 с: во второй половине каждого 10-секундного окна есть пауза
+    for phrase in [3, 4, 2.5, 3.5, 4, 3, 2, 4, 3.5, 1.5]:
+        parts.append(speech(phrase, rng))
+        position += len(parts[-1])
+        parts.append(silence(0.6))
+        pauses.append((position, position + len(parts[-1])))
+        position += len(parts[-1])
+    pcm = np.concatenate(parts).tobytes()
+
+    chunks = split_on_silence(pcm, max_chunk_seconds=10)
+
+    assert b"".join(chunks) == pcm
+    assert len(chunks) > 1
+    assert all(len(chunk) // 2 <= 10 * SAMPLE_RATE for chunk in chunks)
+    cuts = np.cumsum([len(chunk) // 2 for chunk in chunks])[:-1]
+    for cut in cuts:
+        assert any(begin <= cut <= end for begin, end in pauses), f"разрез {cut} не в паузе"
+
+def test_chunks_never_exceed_limit():
+    rng = np.random.default_rng(1)
+    # Длины с неполным последним кадром: последний фрагмент тоже не длиннее лимита
+    for total in range(3 * SAMPLE_RATE, 4 * SAMPLE_RATE, 157):
+        pcm = rng.normal(0, 3000, total).astype(np.int16).tobytes()
+        chunks = split_on_silence(pcm, max_chunk_seconds=1)
+        assert b"".join(chunks) == pcm
+        assert max(len(chunk) // 2 for chunk in chunks) <= SAMPLE_RATE, total
+
+def test_short_audio_is_not_split():
+    pcm = silence(2).tobytes()
+    assert split_on_silence(pcm, max_chunk_seconds=5) == [pcm]
+
+def test_tiny_chunk_limit():
+    pcm = speech(0.5, np.random.default_rng(2)).tobytes()
+    # Одного кадра (20 мс) недостаточно: раньше такой лимит приводил к бесконечному циклу
+    with pytest.raises(ValueError):
+        split_on_silence(pcm, max_chunk_seconds=0.02)
+    chunks = split_on_silence(pcm, max_chunk_seconds=0.04)
+    assert b"".join(chunks) == pcm
+    assert max(len(chunk) // 2 for chunk in chunks) <= 0.04 * SAMPLE_RATE
+
+def test_validate_config_rejects_tiny_chunks(monkeypatch):
+    monkeypatch.setenv("TELEGRAM_TOKEN", "token")
+    monkeypatch.setenv("YANDEX_DISK_TOKEN", "token")
+    monkeypatch.setattr(config, "BOT_MODE", "polling")
+    monkeypatch.setattr(config, "SPEECH_ENGINE", "google")
+    monkeypatch.setattr(config, "SPEECH_CHUNK_SECONDS", 0.5)
+    with pytest.raises(ValueError, match="SPEECH_CHUNK_SECONDS"):
+        config.validate_config()
+
+class SlowEngine(SpeechEngine):
+    """Отвечает с задержкой, как сервис распознавания"""
+    name = "slow"
+
+    def recognize(self, pcm, language):
+        time.sleep(0.2)
+        return f"распознано {len(pcm) // (SAMPLE_RATE * SAMPLE_WIDTH)} с"
+
+@pytest.fixture
+def fake_converter(tmp_path, monkeypatch):
+    """Вместо ffmpeg - процесс, который выдает содержимое входного файла (уже PCM) в stdout"""
+    script = tmp_path / "fake_ffmpeg.py"
+    script.write_text(
+        "import sys\n"
+        "with open(sys.argv[sys.argv.index('-i') + 1], 'rb') as f:\n"
+        "    sys.stdout.buffer.write(f.read())\n"
+    )
+    launcher = tmp_path / "fake_ffmpeg"
+    launcher.write_text(f"#!/bin/sh\nexec {sys.executable} {script} \"$@\"\n")
+    launcher.chmod(0o755)
+    monkeypatch.setattr(speech_recognition_module.AudioSegment, "converter", str(launcher))
+
+@pytest.fixture
+def engines(monkeypatch):
+    monkeypatch.setattr(speech_engines, "_engines", {})
+    return speech_engines.ENGINES
+
+def test_voice_notes_do_not_block_event_loop(tmp_path, fake_converter, engines, monkeypatch):
+    monkeypatch.setitem(engines, SlowEngine.name, SlowEngine)
+    rng = np.random.default_rng(3)
+    paths = []
+    for index in range(10):
+        path = tmp_path / f"voice_{index}.pcm"
+        path.write_bytes(speech(20, rng).tobytes())
+        paths.append(path)
+
+    async def scenario():
+        recognizer = SpeechRecognizer(engine_name=SlowEngine.name, recognition_workers=4, chunk_seconds=30, cache=None)
+        monitor = LoopLagMonitor()
+        monitor.INTERVAL = 0.01
+        monitor.start()
+        try:
+            started = time.perf_counter()
+            texts = await asyncio.gather(*(recognizer.recognize_voice(str(path)) for path in paths))
+            elapsed = time.perf_counter() - started
+        finally:
+            await monitor.stop()
+            recognizer.shutdown()
+        return texts, elapsed, monitor.get_metrics()
+
+    texts, elapsed, lag = asyncio.run(scenario())
+    logger.info(f"10 голосовых сообщений по 20 с: {elapsed:.2f} с, задержка event loop {lag}")
+    assert texts == ["распознано 20 с"] * 10
+    # Декодирование и распознавание идут вне event loop: бот продолжает отвечать
+    assert lag["max_lag"] < 0.1
+
+def cpu_time():
+    """Процессорное время процесса теста и его дочерних процессов (ffmpeg)"""
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+def convert_to_wav_in_memory(voice_file_path):
+    """Прежнее преобразование: pydub декодирует OGG в AudioSegment и экспортирует WAV"""
+    audio = speech_recognition_module.AudioSegment.from_file(voice_file_path, format="ogg")
+    buffer = io.BytesIO()
+    audio.export(buffer, format="wav")
+    return buffer.getvalue()
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="для замера нужен ffmpeg")
+def test_conversion_cost_benchmark(tmp_path):
+    """Процессорное время и объем данных на одно преобразование голосового сообщения (60 с)"""
+    source = tmp_path / "voice.wav"
+    voice = tmp_path / "voice.ogg"
+    speech_recognition_module.AudioSegment(
+        speech(60, np.random.default_rng(4)).tobytes(), sample_width=2, frame_rate=SAMPLE_RATE, channels=1
+    ).export(str(source), format="wav")
+    # Голосовые сообщения Telegram - Opus в OGG, 48 кГц
+    subprocess.run(["ffmpeg", "-nostdin", "-loglevel", "error", "-i", str(source), "-ar", "48000",
+                    "-c:a", "libopus", str(voice)], check=True)
+
+    started = cpu_time()
+    wav = convert_to_wav_in_memory(str(voice))
+    old_cpu = cpu_time() - started
+
+    async def decode():
+        recognizer = SpeechRecognizer(cache=None)
+        recognizer._get_pool()
+        try:
+            return await recognizer.decode_to_pcm(str(voice))
+        finally:
+            recognizer.shutdown()
+
+    started = cpu_time()
+    pcm = asyncio.run(decode())
+    new_cpu = cpu_time() - started
+
+    logger.info(f"Преобразование 60 с аудио: в PCM {new_cpu * 1000:.0f} мс CPU, {len(pcm) / 1024:.0f} КБ; "
+                f"прежнее (WAV через pydub) {old_cpu * 1000:.0f} мс CPU, {len(wav) / 1024:.0f} КБ")
+    # Моно, 16 кГц, 16 бит: 32 000 байт на секунду аудио
+    assert abs(len(pcm) - 60 * SAMPLE_RATE * SAMPLE_WIDTH) < SAMPLE_RATE * SAMPLE_WIDTH // 10
+    assert len(pcm) < len(wav)
+
+class PhraseEngine(SpeechEngine):
+    """Узнает фразу по громкости фрагмента; фразы из failing распознать не удается"""
+    name = "phrase"
+    failing = {3}
+
+    def recognize(self, pcm, language):
+        phrase = int(np.abs(np.frombuffer(pcm, dtype=np.int16)).max()) // 1000
+        if phrase in self.failing:
+            raise RuntimeError(f"сервис не ответил на фразу {phrase}")
+        return f"фраза {phrase}"
+
+def phrases_file(tmp_path, count):
+    """Фразы по 4 с с паузами; громкость фразы k - 1000 * k"""
+    parts = []
+    for phrase in range(1, count + 1):
+        parts.append(np.full(4 * SAMPLE_RATE, 1000 * phrase, dtype=np.int16))
+        parts.append(silence(0.6))
+    path = tmp_path / "phrases.pcm"
+    path.write_bytes(np.concatenate(parts).tobytes())
+    return path
+
+def recognize(path, cache=None, file_unique_id=None):
+    async def scenario():
+        recognizer = SpeechRecognizer(engine_name=PhraseEngine.name, chunk_seconds=5, cache=cache)
+        try:
+            return await recognizer.recognize_voice(str(path), file_unique_id)
+        finally:
+            recognizer.shutdown()
+    return asyncio.run(scenario())
+
+def test_failed_chunk_is_marked_in_place(tmp_path, fake_converter, engines, monkeypatch):
+    monkeypatch.setitem(engines, PhraseEngine.name, PhraseEngine)
+    cache = TranscriptionCache(tmp_path / "cache.db", 10)
+    text = recognize(phrases_file(tmp_path, 4), cache, "voice-1")
+    assert text == f"фраза 1 фраза 2 {UNRECOGNIZED_CHUNK} фраза 4"
+    # Частичный результат не кэшируется: повторная отправка распознается заново
+    assert cache.get("voice-1", PhraseEngine.name, "ru-RU") is None
+
+def test_all_chunks_failed(tmp_path, fake_converter, engines, monkeypatch):
+    monkeypatch.setitem(engines, PhraseEngine.name, PhraseEngine)
+    monkeypatch.setattr(PhraseEngine, "failing", {1, 2, 3})
+    assert recognize(phrases_file(tmp_path, 3)) is None
+
+def test_engine_is_created_once_per_process(engines, monkeypatch):
+    monkeypatch.setitem(engines, PhraseEngine.name, PhraseEngine)
+
+    async def scenario():
+        first = SpeechRecognizer(engine_name=PhraseEngine.name, cache=None)
+        second = SpeechRecognizer(engine_name=PhraseEngine.name, cache=None)
+        try:
+            return await first.get_engine(), await first.get_engine(), await second.get_engine()
+        finally:
+            first.shutdown()
+            second.shutdown()
+
+    a, b, c = asyncio.run(scenario())
+    assert a is b is c
+
+@pytest.mark.parametrize("engine_name", sorted(speech_engines.ENGINES))
+def test_real_time_factor_benchmark(engine_name):
+    """Доля длительности аудио, которая уходит на распознавание (real-time factor)"""
+    if engine_name == "google" and not os.getenv("SPEECH_BENCHMARK_ONLINE"):
+        pytest.skip("замер Google Web Speech API требует сети: задайте SPEECH_BENCHMARK_ONLINE=1")
+    try:
+        engine = speech_engines.get_engine(engine_name)
+    except RuntimeError as e:
+        pytest.skip(str(e))
+
+    seconds = 10
+    pcm = speech(seconds, np.random.default_rng(5)).tobytes()
+    started = time.perf_counter()
+    text = engine.recognize(pcm, "ru-RU")
+    rtf = (time.perf_counter() - started) / seconds
+    logger.info(f"Движок {engine_name}: real-time factor {rtf:.3f} на {seconds} с аудио")
+    assert text is None or isinstance(text, str)
@@ -0,0 +1,59 @@
+import asyncio
+import itertools
+from types import SimpleNamespace
+
+import pytest
+
+from src.utils import transcription_cache as transcription_cache_module
+from src.utils.transcription_cache import TranscriptionCache
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    # Часы с шагом в секунду: порядок last_used не зависит от точности time.time()
+    clock = itertools.count(1_700_000_000)
+    monkeypatch.setattr(transcription_cache_module, "time", SimpleNamespace(time=lambda: next(clock)))
+    cache = TranscriptionCache(tmp_path / "cache.sqlite3", max_entries=3)
+    yield cache
+    cache.close()
+
+def test_hits_and_misses_are_counted(cache):
+    assert cache.get("voice-1", "google", "ru-RU") is None
+    cache.put("voice-1", "google", "ru-RU", "привет")
+    assert cache.get("voice-1", "google", "ru-RU") == "привет"
+    assert cache.get("voice-1", "google", "ru-RU") == "привет"
+    # Другой движок или язык - другая запись
+    assert cache.get("voice-1", "vosk", "ru-RU") is None
+    assert cache.get("voice-1", "google", "en-US") is None
+    assert cache.get_metrics() == {"hits": 2, "misses": 3, "size": 1, "max_entries": 3}
+
+def test_least_recently_used_entry_is_evicted(cache):
+    for number in range(1, 4):
+        cache.put(f"voice-{number}", "google", "ru-RU", f"текст {number}")
+    # Обращение к самой старой записи делает ее недавно использованной
+    assert cache.get("voice-1", "google", "ru-RU") == "текст 1"
+
+    cache.put("voice-4", "google", "ru-RU", "текст 4")
+    assert cache.get_metrics()["size"] == 3
+    assert cache.get("voice-2", "google", "ru-RU") is None
+    assert cache.get("voice-1", "google", "ru-RU") == "текст 1"
+    assert cache.get("voice-3", "google", "ru-RU") == "текст 3"
+    assert cache.get("voice-4", "google", "ru-RU") == "текст 4"
+
+def test_entries_survive_reopening(cache):
+    cache.put("voice-1", "google", "ru-RU", "привет")
+    cache.close()
+    reopened = TranscriptionCache(cache.db_path, max_entries=3)
+    try:
+        assert reopened.get("voice-1", "google", "ru-RU") == "привет"
+    finally:
+        reopened.close()
+
+def test_cache_errors_do_not_break_recognition(tmp_path):
+    # Каталог вместо файла базы: SQLite не может открыть соединение
+    broken = TranscriptionCache(tmp_path, max_entries=3)
+
+    async def scenario():
+        await broken.put_async("voice-1", "google", "ru-RU", "привет")
+        return await broken.get_async("voice-1", "google", "ru-RU")
+
+    assert asyncio.run(scenario()) is None
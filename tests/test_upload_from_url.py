@@ -0,0 +1,75 @@
+import asyncio
+import functools
+import http.server
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from src.handlers.media_handlers import transfer
+from src.utils.yadisk_helper import YaDiskHelper
+from local_disk import LocalDisk
+
+CONTENT = b"\xff\xd8 jpeg " * 1000
+
+class QuietHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+@pytest.fixture
+def file_server(tmp_path):
+    """HTTP-сервер, отдающий файл как сервер файлов Telegram"""
+    served = tmp_path / "served"
+    served.mkdir()
+    (served / "photo.jpg").write_bytes(CONTENT)
+    handler = functools.partial(QuietHandler, directory=str(served))
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+def test_upload_from_url_polls_until_done(tmp_path, file_server):
+    disk = LocalDisk(tmp_path / "disk", operation_delay=0.6)
+    helper = YaDiskHelper(disk)
+    assert helper.upload_from_url(f"{file_server}/photo.jpg", "/TD/A/photo.jpg") is True
+    assert disk.read("/TD/A/photo.jpg") == CONTENT
+    # Проверки: сразу, через 0.5 с и через 1.5 с (интервал растет вдвое)
+    assert 2 <= disk.status_polls <= 3
+    # Содержимое не проходило через бота
+    assert disk.bytes_uploaded == 0
+
+def test_upload_from_url_reports_failed_operation(tmp_path, file_server):
+    helper = YaDiskHelper(LocalDisk(tmp_path / "disk"))
+    with pytest.raises(RuntimeError):
+        helper.upload_from_url(f"{file_server}/missing.jpg", "/TD/A/photo.jpg")
+
+def test_upload_from_url_times_out(tmp_path):
+    helper = YaDiskHelper(LocalDisk(tmp_path / "disk", operation_delay=5))
+    started = time.monotonic()
+    with pytest.raises(TimeoutError):
+        helper.upload_from_url("https://files.example/photo.jpg", "/TD/A/photo.jpg", poll_timeout=1)
+    assert time.monotonic() - started < 2
+
+def test_upload_via_url_counts_offloaded_bytes(tmp_path, monkeypatch):
+    monkeypatch.setattr(transfer, "transfer_stats", dict.fromkeys(transfer.transfer_stats, 0))
+    urls = {"https://files.example/photo.jpg": CONTENT}
+    helper = YaDiskHelper(LocalDisk(tmp_path / "disk", fetch=urls.__getitem__))
+    telegram_file = SimpleNamespace(file_path="https://files.example/photo.jpg", file_size=len(CONTENT))
+
+    assert asyncio.run(transfer.upload_via_url(telegram_file, "/TD/A/photo.jpg", helper)) is True
+    assert transfer.transfer_stats["via_url"] == 1
+    assert transfer.transfer_stats["bytes_offloaded"] == len(CONTENT)
+
+def test_upload_via_url_falls_back_on_failure(tmp_path, monkeypatch):
+    monkeypatch.setattr(transfer, "transfer_stats", dict.fromkeys(transfer.transfer_stats, 0))
+    helper = YaDiskHelper(LocalDisk(tmp_path / "disk", fetch={}.__getitem__))
+    telegram_file = SimpleNamespace(file_path="https://files.example/photo.jpg", file_size=len(CONTENT))
+
+    assert asyncio.run(transfer.upload_via_url(telegram_file, "/TD/A/photo.jpg", helper)) is False
+    assert transfer.transfer_stats["url_fallbacks"] == 1
+
+def test_upload_via_url_skips_local_file_paths(tmp_path):
+    helper = YaDiskHelper(LocalDisk(tmp_path / "disk"))
+    telegram_file = SimpleNamespace(file_path="/var/lib/telegram-bot-api/photo.jpg", file_size=1)
+    assert asyncio.run(transfer.upload_via_url(telegram_file, "/TD/A/photo.jpg", helper)) is False
@@ -0,0 +1,86 @@
+import asyncio
+
+import yadisk
+
+from src.utils.upload_index import UploadIndex
+
+class FakeDisk:
+    """Яндекс.Диск в памяти; error - исключение, которое вернет следующая операция"""
+    def __init__(self, files=()):
+        self.files = set(files)
+        self.copies = []
+        self.error = None
+
+    def _raise_error(self):
+        if self.error:
+            error, self.error = self.error, None
+            raise error
+
+    async def exists_async(self, path):
+        self._raise_error()
+        return path in self.files
+
+    async def copy_file_async(self, src_path, dst_path):
+        self._raise_error()
+        if src_path not in self.files:
+            raise yadisk.exceptions.PathNotFoundError(msg=src_path)
+        self.files.add(dst_path)
+        self.copies.append((src_path, dst_path))
+
+def save(index, disk, target_path, uploads):
+    async def transfer():
+        uploads.append(target_path)
+        disk.files.add(target_path)
+    return asyncio.run(index.save_file("uid", 1000, target_path, disk, transfer))
+
+def test_first_save_uploads_and_remembers_path(tmp_path):
+    index, disk, uploads = UploadIndex(tmp_path / "uploads.sqlite3"), FakeDisk(), []
+    assert save(index, disk, "/TD/A/photo.jpg", uploads) == "/TD/A/photo.jpg"
+    assert uploads == ["/TD/A/photo.jpg"]
+    assert index.find("uid", 1000) == ["/TD/A/photo.jpg"]
+    index.close()
+
+def test_same_folder_hit_returns_existing_file(tmp_path):
+    index, disk, uploads = UploadIndex(tmp_path / "uploads.sqlite3"), FakeDisk(), []
+    save(index, disk, "/TD/A/photo1.jpg", uploads)
+    assert save(index, disk, "/TD/A/photo2.jpg", uploads) == "/TD/A/photo1.jpg"
+    assert uploads == ["/TD/A/photo1.jpg"]
+    assert index.get_metrics()["same_folder_hits"] == 1
+    assert index.get_metrics()["bytes_saved"] == 1000
+    index.close()
+
+def test_other_folder_hit_copies_on_disk(tmp_path):
+    index, disk, uploads = UploadIndex(tmp_path / "uploads.sqlite3"), FakeDisk(), []
+    save(index, disk, "/TD/A/photo.jpg", uploads)
+    assert save(index, disk, "/TD/B/photo.jpg", uploads) == "/TD/B/photo.jpg"
+    assert uploads == ["/TD/A/photo.jpg"]
+    assert disk.copies == [("/TD/A/photo.jpg", "/TD/B/photo.jpg")]
+    assert set(index.find("uid", 1000)) == {"/TD/A/photo.jpg", "/TD/B/photo.jpg"}
+    index.close()
+
+def test_missing_source_is_forgotten(tmp_path):
+    index, disk, uploads = UploadIndex(tmp_path / "uploads.sqlite3"), FakeDisk(), []
+    save(index, disk, "/TD/A/photo.jpg", uploads)
+    disk.files.clear()
+    assert save(index, disk, "/TD/B/photo.jpg", uploads) == "/TD/B/photo.jpg"
+    assert uploads == ["/TD/A/photo.jpg", "/TD/B/photo.jpg"]
+    assert index.find("uid", 1000) == ["/TD/B/photo.jpg"]
+    index.close()
+
+def test_transient_copy_error_keeps_source(tmp_path):
+    index, disk, uploads = UploadIndex(tmp_path / "uploads.sqlite3"), FakeDisk(), []
+    save(index, disk, "/TD/A/photo.jpg", uploads)
+    disk.error = ConnectionError("timeout")
+    assert save(index, disk, "/TD/B/photo.jpg", uploads) == "/TD/B/photo.jpg"
+    # Файл загружен заново, но исходный путь остался в индексе
+    assert uploads == ["/TD/A/photo.jpg", "/TD/B/photo.jpg"]
+    assert set(index.find("uid", 1000)) == {"/TD/A/photo.jpg", "/TD/B/photo.jpg"}
+    index.close()
+
+def test_transient_exists_error_keeps_path(tmp_path):
+    index, disk, uploads = UploadIndex(tmp_path / "uploads.sqlite3"), FakeDisk(), []
+    save(index, disk, "/TD/A/photo1.jpg", uploads)
+    disk.error = ConnectionError("timeout")
+    save(index, disk, "/TD/A/photo2.jpg", uploads)
+    assert set(index.find("uid", 1000)) == {"/TD/A/photo1.jpg", "/TD/A/photo2.jpg"}
+    index.close()
@@ -0,0 +1,139 @@
+import asyncio
+import json
+import logging
+import socket
+import statistics
+import time
+
+from tornado.httpclient import AsyncHTTPClient
+from telegram.ext import Application, TypeHandler
+from telegram.request import BaseRequest
+
+from src.utils.concurrency_utils import PerUserUpdateProcessor
+from src.utils.webhook_server import SECRET_TOKEN_HEADER, WebhookServer
+
+logger = logging.getLogger(__name__)
+
+SECRET = "test-secret"
+
+class OfflineRequest(BaseRequest):
+    """Отвечает на запросы к Bot API без сети (нужен только getMe при запуске приложения)"""
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None):
+        result = {"id": 1, "is_bot": True, "first_name": "Test", "username": "test_bot"}
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+def recorded_update(update_id, user_id, text):
+    """Обновление в том виде, в котором Telegram присылает его на webhook"""
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 1700000000,
+            "chat": {"id": user_id, "type": "private", "first_name": "Test"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "Test"},
+            "text": text,
+        },
+    }
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+async def run_with_server(scenario):
+    application = (
+        Application.builder()
+        .token("1:TEST")
+        .request(OfflineRequest())
+        .get_updates_request(OfflineRequest())
+        .updater(None)
+        .concurrent_updates(PerUserUpdateProcessor(8))
+        .build()
+    )
+    received = {}
+
+    async def handler(update, context):
+        received[update.update_id] = time.perf_counter()
+
+    application.add_handler(TypeHandler(object, handler))
+    port = free_port()
+    server = WebhookServer(application, listen="127.0.0.1", port=port, url_path="/telegram", secret_token=SECRET)
+    client = AsyncHTTPClient()
+    async with application:
+        await application.start()
+        server.start()
+        try:
+            return await scenario(server, client, f"http://127.0.0.1:{port}", received)
+        finally:
+            await server.stop()
+            await application.stop()
+
+async def post(client, url, body, secret=SECRET):
+    return await client.fetch(
+        f"{url}/telegram",
+        method="POST",
+        body=json.dumps(body),
+        headers={"Content-Type": "application/json", SECRET_TOKEN_HEADER: secret},
+        raise_error=False,
+    )
+
+def test_wrong_secret_token_is_rejected():
+    async def scenario(server, client, url, received):
+        response = await post(client, url, recorded_update(1, 10, "привет"), secret="wrong")
+        await asyncio.sleep(0.05)
+        return response.code, received
+
+    code, received = asyncio.run(run_with_server(scenario))
+    assert code == 403
+    assert received == {}
+
+def test_health_and_readiness():
+    async def scenario(server, client, url, received):
+        health = await client.fetch(f"{url}/healthz", raise_error=False)
+        not_ready = await client.fetch(f"{url}/readyz", raise_error=False)
+        # Готовность наступает после регистрации webhook в Telegram
+        server.webhook_registered = True
+        ready = await client.fetch(f"{url}/readyz", raise_error=False)
+        return health, not_ready, ready
+
+    health, not_ready, ready = asyncio.run(run_with_server(scenario))
+    assert health.code == 200 and json.loads(health.body) == {"status": "ok"}
+    assert not_ready.code == 503
+    assert ready.code == 200 and json.loads(ready.body)["status"] == "ready"
+
+def test_recorded_updates_reach_handler():
+    updates = [recorded_update(update_id, 100 + update_id % 5, f"сообщение {update_id}")
+               for update_id in range(1, 51)]
+
+    async def scenario(server, client, url, received):
+        posted = {}
+        codes = []
+        for update in updates:
+            posted[update["update_id"]] = time.perf_counter()
+            codes.append((await post(client, url, update)).code)
+        deadline = time.monotonic() + 5
+        while len(received) < len(updates) and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        return codes, posted, received
+
+    codes, posted, received = asyncio.run(run_with_server(scenario))
+    assert codes == [200] * len(updates)
+    assert sorted(received) == [update["update_id"] for update in updates]
+
+    latencies = sorted((received[update_id] - posted[update_id]) * 1000 for update_id in received)
+    median = statistics.median(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    logger.info(f"Webhook: задержка от запроса до обработчика медиана {median:.1f} мс, p95 {p95:.1f} мс")
+    # Локально обновление доходит до обработчика за единицы миллисекунд
+    assert median < 100
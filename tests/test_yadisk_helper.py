@@ -0,0 +1,71 @@
+import os
+
+import pytest
+
+from local_disk import LocalDisk
+from src.utils import yadisk_helper as yadisk_helper_module
+from src.utils.yadisk_helper import YaDiskHelper, _ProgressFile
+
+@pytest.fixture
+def delays(monkeypatch):
+    """Паузы между попытками загрузки (без фактического ожидания)"""
+    delays = []
+    monkeypatch.setattr(yadisk_helper_module.time, "sleep", delays.append)
+    return delays
+
+@pytest.fixture
+def local_file(tmp_path):
+    path = tmp_path / "document.bin"
+    path.write_bytes(os.urandom(1024 * 1024 + 123))
+    return path
+
+def test_progress_file_reports_each_percent(local_file):
+    reports = []
+    with open(local_file, "rb") as f:
+        source = _ProgressFile(f, lambda sent, total: reports.append((sent, total)))
+        while source.read(4096):
+            pass
+    total = os.path.getsize(local_file)
+    assert reports[-1] == (total, total)
+    assert 100 <= len(reports) <= 102
+    assert [sent for sent, _ in reports] == sorted(sent for sent, _ in reports)
+
+def test_progress_file_restarts_count_on_seek(local_file):
+    reports = []
+    with open(local_file, "rb") as f:
+        source = _ProgressFile(f, lambda sent, total: reports.append(sent))
+        source.read(300 * 1024)
+        # Повторная попытка клиента начинается с начала файла
+        source.seek(0)
+        assert source.sent == 0 and source.tell() == 0
+        while source.read(64 * 1024):
+            pass
+    assert source.sent == os.path.getsize(local_file)
+    assert reports[-1] == os.path.getsize(local_file)
+
+def test_upload_retries_with_backoff(tmp_path, local_file, delays):
+    disk = LocalDisk(tmp_path / "disk")
+    helper = YaDiskHelper(disk)
+    disk.fail_uploads = 2
+    reports = []
+
+    assert helper.upload_file(str(local_file), "/TD/A/document.bin",
+                              progress_callback=lambda sent, total: reports.append(sent))
+
+    assert disk.read("/TD/A/document.bin") == local_file.read_bytes()
+    assert len(disk.uploads) == 3
+    # Пауза между попытками растет вдвое
+    assert delays == [2, 4]
+    # Каждая попытка отсчитывает прогресс с начала файла и последняя доходит до конца
+    restarts = [index for index in range(1, len(reports)) if reports[index] < reports[index - 1]]
+    assert len(restarts) == 2
+    assert reports[-1] == os.path.getsize(local_file)
+
+def test_upload_gives_up_after_retries(tmp_path, local_file, delays):
+    disk = LocalDisk(tmp_path / "disk")
+    helper = YaDiskHelper(disk)
+    disk.fail_uploads = 3
+    with pytest.raises(ConnectionError):
+        helper.upload_file(str(local_file), "/TD/A/document.bin", retry_count=3, retry_delay=1)
+    assert delays == [1, 2]
+    assert not disk.exists("/TD/A/document.bin")